@@ -0,0 +1,1633 @@
+"""Benchmarks for Window Dance.
+
+Run `python benchmark.py <name> --help` for the options of each benchmark.
+Without `--audio` a synthetic song (kick drum, bass line and noise) is used,
+so every benchmark also runs on a machine without any music files.
+"""
+
+import argparse
+import json
+import math
+import os
+import shutil
+import subprocess
+import sys
+import time
+import tracemalloc
+
+from main import DanceEngine, DanceShow, FrameGovernor, FrameProducer, LiveAnalyzer, PlaybackClock, WindowDance
+
+
+def synthetic_song(np, seconds, sr=22050, bpm=120, seed=0):
+    rng = np.random.default_rng(seed)
+    t = np.arange(int(seconds * sr)) / sr
+    y = 0.1 * np.sin(2 * np.pi * 55 * t) * (np.sin(2 * np.pi * 0.25 * t) > 0)
+    y += 0.05 * np.sin(2 * np.pi * 440 * t)
+    y += 0.02 * rng.standard_normal(len(t))
+
+    kick_len = int(0.15 * sr)
+    kick_t = np.arange(kick_len) / sr
+    kick = 0.8 * np.sin(2 * np.pi * 60 * kick_t) * np.exp(-kick_t * 20)
+    for beat in np.arange(0, seconds, 60 / bpm):
+        i = int(beat * sr)
+        seg = y[i:i + kick_len]
+        seg += kick[:len(seg)]
+
+    return y.astype(np.float32)
+
+
+def load_song(wd, args):
+    if args.audio:
+        y, _ = wd.librosa.load(args.audio, sr=wd.ANALYSIS_SR)
+        return y
+    return synthetic_song(wd.np, args.seconds, sr=wd.ANALYSIS_SR)
+
+
+def load_analysis(wd, args):
+    """(tempo, bass_energy, rms, beat_times) of --audio (through the analysis cache) or of the synthetic song."""
+    if args.audio:
+        wd.AUDIO_FILE = args.audio
+        wd.analyze_audio()
+        return wd.tempo, wd.bass_energy, wd.rms, wd.beat_times
+
+    y = synthetic_song(wd.np, args.seconds, sr=wd.ANALYSIS_SR)
+    tempo, tracks = wd.analyze_signal(y, wd.ANALYSIS_SR)
+    return math.ceil(tempo), tracks["bass_energy"], tracks["rms"], tracks["beat_times"]
+
+
+def write_results(args, results):
+    if getattr(args, "output", None):
+        with open(args.output, "w") as f:
+            json.dump(results, f, indent=2)
+        print(f"Results written to {args.output}")
+
+
+def best_time(fn, repeats):
+    best = float("inf")
+    result = None
+    for _ in range(repeats):
+        start = time.perf_counter()
+        result = fn()
+        best = min(best, time.perf_counter() - start)
+    return best, result
+
+
+# -------------------------------------------------
+# Bass extraction
+
+def bench_bass(args):
+    wd = WindowDance(interactive=False)
+    np = wd.np
+    y = load_song(wd, args)
+    sr = wd.ANALYSIS_SR
+
+    # Warm up librosa's caches so the first backend isn't charged for them
+    wd.bass_band_stft(y[:sr], sr)
+    wd.bass_band_lowband(y[:sr], sr)
+
+    t_stft, ref = best_time(lambda: wd.bass_band_stft(y, sr), args.repeats)
+    t_low, low = best_time(lambda: wd.bass_band_lowband(y, sr), args.repeats)
+
+    def normalize(bass):
+        denom = bass.max() - bass.min()
+        return bass / denom if denom > 0 else np.zeros_like(bass)
+
+    err = np.abs(normalize(ref) - normalize(low))
+    print(f"audio: {len(y) / sr:.1f} s, {len(ref)} frames")
+    print(f"stft:    {t_stft * 1000:8.1f} ms")
+    print(f"lowband: {t_low * 1000:8.1f} ms  ({t_stft / t_low:.1f}x faster)")
+    print(f"bass_energy error: max {err.max():.4f}, mean {err.mean():.5f}, "
+          f"corr {np.corrcoef(ref, low)[0, 1]:.5f}, frames {len(ref)} vs {len(low)}")
+
+
+def write_synthetic_song(wd, path, seconds, sr=44100):
+    """The synthetic song as a mono WAV, made a minute at a time so an hour of it doesn't have to fit in memory."""
+    with wd.soundfile.SoundFile(path, "w", samplerate=sr, channels=1) as f:
+        for start in range(0, math.ceil(seconds), 60):
+            f.write(synthetic_song(wd.np, min(60, seconds - start), sr=sr, seed=start))
+
+
+def bench_stream_child(args):
+    # One analysis of --audio in a fresh process, so its peak is its own
+    wd = WindowDance(interactive=False)
+    wd.decode_for_playback = False
+    wd.report_progress = lambda status: None
+    wd.AUDIO_FILE = args.audio
+    # Imports and librosa's caches aren't the song's memory
+    wd.analyze_signal(synthetic_song(wd.np, 4, sr=wd.ANALYSIS_SR), wd.ANALYSIS_SR)
+
+    tracemalloc.start()
+    start = time.perf_counter()
+    if args.memory_child == "streamed":
+        wd.compute_analysis_streaming()
+    else:
+        wd.compute_analysis()
+    seconds = time.perf_counter() - start
+    print(json.dumps({"peak_mb": tracemalloc.get_traced_memory()[1] / 2**20, "seconds": seconds}))
+
+
+def bench_stream_memory(args, tmp_dir):
+    """Peak memory of the streamed and in-memory analysis at each of --memory-minutes, and whether the streamed one stays flat."""
+    wd = WindowDance(interactive=False)
+    results = {}
+    for minutes in args.memory_minutes:
+        path = os.path.join(tmp_dir, f"song_{minutes:g}min.wav")
+        write_synthetic_song(wd, path, minutes * 60)
+        for way in ("streamed", "in_memory"):
+            out = subprocess.run(
+                [sys.executable, os.path.abspath(__file__), "stream", "--memory-child", way, "--audio", path],
+                capture_output=True, text=True, check=True,
+            )
+            r = json.loads(out.stdout.strip().splitlines()[-1])
+            results[f"{way}_{minutes:g}min"] = r
+            print(f"{minutes:5g} min {way:9s}: peak {r['peak_mb']:8.1f} MB in {r['seconds']:6.1f} s")
+        os.remove(path)
+
+    short, long = min(args.memory_minutes), max(args.memory_minutes)
+    growth = results[f"streamed_{long:g}min"]["peak_mb"] / results[f"streamed_{short:g}min"]["peak_mb"]
+    in_memory_growth = results[f"in_memory_{long:g}min"]["peak_mb"] / results[f"in_memory_{short:g}min"]["peak_mb"]
+    flat = growth <= args.max_growth
+    print(f"{long / short:g}x the length: streamed peak {growth:.2f}x, in memory {in_memory_growth:.2f}x"
+          f"{'' if flat else f'  FAILED (more than {args.max_growth:g}x)'}")
+    results.update(streamed_growth=growth, in_memory_growth=in_memory_growth)
+    return results, flat
+
+
+def bench_stream(args):
+    """Tracks of the block-streamed analysis against the in-memory one for each bass backend, then the peak memory of both."""
+    import tempfile
+
+    if args.memory_child:
+        bench_stream_child(args)
+        return
+
+    wd = WindowDance(interactive=False)
+    np = wd.np
+    wd.decode_for_playback = False
+    wd.report_progress = lambda status: None
+
+    tmp_dir = None
+    if args.audio:
+        wd.AUDIO_FILE = args.audio
+    else:
+        tmp_dir = tempfile.mkdtemp(prefix="window_dance_stream_")
+        wd.AUDIO_FILE = os.path.join(tmp_dir, "song.wav")
+        wd.soundfile.write(wd.AUDIO_FILE, synthetic_song(np, args.seconds, sr=44100), 44100)
+
+    try:
+        # Warm up librosa's caches so neither way is charged for them
+        wd.analyze_signal(synthetic_song(np, 4, sr=wd.ANALYSIS_SR), wd.ANALYSIS_SR)
+
+        memory = {}
+        for backend in ("stft", "lowband"):
+            wd.BASS_BACKEND = backend
+            start = time.perf_counter()
+            memory[backend] = wd.compute_analysis() + (time.perf_counter() - start,)
+
+        start = time.perf_counter()
+        tempo, streamed = wd.compute_analysis_streaming()
+        stream_s = time.perf_counter() - start
+
+        results = {"stream_s": stream_s, "backends": {}}
+        failed = False
+        for backend, (ref_tempo, ref, memory_s) in memory.items():
+            n = min(len(ref["rms"]), len(streamed["rms"]))
+            beats_match = len(ref["beat_times"]) == len(streamed["beat_times"])
+            r = {
+                "memory_s": memory_s,
+                "frames": [len(ref["rms"]), len(streamed["rms"])],
+                "bass_error": float(np.abs(ref["bass_energy"][:n] - streamed["bass_energy"][:n]).max()),
+                # rms relative to the loudest frame
+                "rms_error": float(np.abs(ref["rms"][:n] - streamed["rms"][:n]).max() / max(float(ref["rms"].max()), 1e-12)),
+                "tempo": [ref_tempo, tempo],
+                "beats": [len(ref["beat_times"]), len(streamed["beat_times"])],
+                "beat_error_s": float(np.abs(ref["beat_times"] - streamed["beat_times"]).max()) if beats_match and len(ref["beat_times"]) else 0.0,
+            }
+            results["backends"][backend] = r
+            ok = (
+                r["frames"][0] == r["frames"][1]
+                and r["bass_error"] <= args.max_error and r["rms_error"] <= args.max_error
+                and ref_tempo == tempo and beats_match
+                and r["beat_error_s"] <= wd.HOP_LENGTH / wd.ANALYSIS_SR
+            )
+            failed |= not ok
+            print(f"{backend:8s} in memory {r['memory_s']:.2f} s, streamed {stream_s:.2f} s: "
+                  f"bass error {r['bass_error']:.2e}, rms error {r['rms_error']:.2e}, "
+                  f"tempo {ref_tempo:.2f} vs {tempo:.2f}, {r['beats'][0]} vs {r['beats'][1]} beats "
+                  f"(max {r['beat_error_s'] * 1000:.1f} ms apart){'' if ok else '  FAILED'}")
+
+        if len(args.memory_minutes) > 1:
+            memory_dir = tempfile.mkdtemp(prefix="window_dance_stream_memory_")
+            try:
+                results["memory"], flat = bench_stream_memory(args, memory_dir)
+            finally:
+                shutil.rmtree(memory_dir, ignore_errors=True)
+            failed |= not flat
+    finally:
+        if tmp_dir:
+            shutil.rmtree(tmp_dir, ignore_errors=True)
+
+    write_results(args, results)
+    if failed:
+        sys.exit(1)
+
+
+# -------------------------------------------------
+# Headless engine
+
+def make_engine(wd, args, tempo, bass_energy, rms, beat_times):
+    engine = DanceEngine(wd, (1920, 1080), seed=0)
+    engine.load_tracks(bass_energy, rms, tempo, beat_times=beat_times)
+    engine.has_image = [args.images] * engine.DANCERS
+    return engine
+
+
+def bench_engine(args):
+    wd = WindowDance(interactive=False)
+    wd.WINDOW_JUMP = -40
+    wd.DANCERS, wd.PILLARS, wd.ORBIT_RINGS = args.dancers, args.pillars, args.rings
+    tempo, bass_energy, rms, beat_times = load_analysis(wd, args)
+
+    hz = args.hz
+    dt = 1 / hz
+    n_frames = int(len(rms) * wd.HOP_LENGTH / wd.ANALYSIS_SR * hz)
+
+    elapsed = float("inf")
+    for _ in range(args.repeats):
+        engine = make_engine(wd, args, tempo, bass_energy, rms, beat_times)
+        step = engine.step
+        start = time.perf_counter()
+        for i in range(n_frames):
+            step(i * dt, dt)
+        elapsed = min(elapsed, time.perf_counter() - start)
+
+    # Allocation pass on a slice of the song, tracemalloc slows everything down
+    engine = make_engine(wd, args, tempo, bass_energy, rms, beat_times)
+    sample = min(n_frames, args.alloc_frames)
+    tracemalloc.start()
+    base = tracemalloc.get_traced_memory()[0]
+    transient = 0
+    for i in range(sample):
+        before = tracemalloc.get_traced_memory()[0]
+        tracemalloc.reset_peak()
+        engine.step(i * dt, dt)
+        transient += tracemalloc.get_traced_memory()[1] - before
+    retained = tracemalloc.get_traced_memory()[0] - base
+    tracemalloc.stop()
+
+    results = {
+        "source": args.audio or f"synthetic {args.seconds:g} s",
+        "frames": n_frames,
+        "hz": hz,
+        "dancers": args.dancers,
+        "pillars": args.pillars,
+        "seconds": elapsed,
+        "engine_fps": n_frames / elapsed,
+        "realtime_factor": n_frames / elapsed / hz,
+        "us_per_frame": elapsed / n_frames * 1e6,
+        "peak_bytes_per_frame": transient / max(1, sample),
+        "retained_bytes_per_frame": retained / max(1, sample),
+    }
+    print(f"{results['source']}: {n_frames} frames at {hz} Hz, {args.dancers} dancers on {args.rings} orbits, {args.pillars} pillars")
+    print(f"engine: {results['engine_fps']:,.0f} frames/s ({results['us_per_frame']:.1f} us/frame, "
+          f"{results['realtime_factor']:.0f}x realtime)")
+    print(f"allocations: {results['peak_bytes_per_frame']:.0f} B peak per frame, "
+          f"{results['retained_bytes_per_frame']:.1f} B retained per frame")
+    write_results(args, results)
+
+    if args.min_fps and results["engine_fps"] < args.min_fps:
+        print(f"FAIL: below --min-fps {args.min_fps}")
+        sys.exit(1)
+
+
+def parse_layout(text):
+    """DANCERSxPILLARS or DANCERSxPILLARSxRINGS."""
+    parts = [int(p) for p in text.lower().split("x")]
+    return tuple(parts) if len(parts) == 3 else (parts[0], parts[1], 1)
+
+
+def bench_layouts(args):
+    """Step, seek and compile every layout with and without album art, failing on any error or stray window."""
+    import traceback
+
+    wd = WindowDance(interactive=False)
+    np = wd.np
+    wd.WINDOW_JUMP = -40
+    tempo, bass_energy, rms, beat_times = load_analysis(wd, args)
+    dt = 1 / args.hz
+    n_frames = int(len(rms) * wd.HOP_LENGTH / wd.ANALYSIS_SR * args.hz)
+
+    results = []
+    for dancers, pillars, rings in args.layouts:
+        wd.DANCERS, wd.PILLARS, wd.ORBIT_RINGS = dancers, pillars, rings
+        for images in (False, True):
+            args.images = images
+            row = {"dancers": dancers, "pillars": pillars, "rings": rings, "images": images}
+            try:
+                engine = make_engine(wd, args, tempo, bass_energy, rms, beat_times)
+                start = time.perf_counter()
+                positions = np.array(engine.rest_positions(), dtype=float)
+                for i in range(n_frames):
+                    frame = engine.step(i * dt, dt)
+                    for w, p in enumerate(frame.positions):
+                        if p is not None:
+                            positions[w] = p
+                    for kind, dancer, _ in frame.flashes:
+                        if not 0 <= dancer < dancers:
+                            raise ValueError(f"{kind} for dancer {dancer} of {dancers}")
+                row["us_per_frame"] = (time.perf_counter() - start) / n_frames * 1e6
+                if not np.isfinite(positions).all():
+                    raise ValueError("a window position is not finite")
+
+                engine.seek(engine.duration / 2)
+                engine.step(engine.duration / 2, dt)
+                engine.reset()
+                show = engine.compile_show(args.hz)
+                row["show_frames"] = show.n_frames
+                row["ok"] = True
+            except Exception as err:
+                row["ok"] = False
+                row["error"] = "".join(traceback.format_exception_only(err)).strip()
+            results.append(row)
+            print(f"{dancers:3d} dancers, {pillars:3d} pillars, {rings} orbits, {'art ' if images else 'bg  '}"
+                  + (f"ok   {row['us_per_frame']:7.1f} us/frame" if row["ok"] else f"FAIL {row['error']}"))
+
+    write_results(args, results)
+    if not all(row["ok"] for row in results):
+        sys.exit(1)
+
+
+def bench_seek(args):
+    """Seek cost at random points of a song the engine has already played through once."""
+    import random
+
+    wd = WindowDance(interactive=False)
+    wd.WINDOW_JUMP = -40
+    tempo, bass_energy, rms, beat_times = load_analysis(wd, args)
+    engine = make_engine(wd, args, tempo, bass_energy, rms, beat_times)
+
+    dt = 1 / wd.PHYSICS_HZ
+    for i in range(int(engine.duration * wd.PHYSICS_HZ)):
+        engine.step(i * dt, dt)
+
+    rng = random.Random(0)
+    targets = [rng.uniform(0, engine.duration) for _ in range(args.seeks)]
+    times = []
+    for target in targets:
+        start = time.perf_counter()
+        engine.seek(target)
+        times.append(time.perf_counter() - start)
+
+    # Early and late seeks should cost the same
+    order = sorted(range(len(targets)), key=targets.__getitem__)
+    half = len(order) // 2
+    early = sum(times[i] for i in order[:half]) / max(1, half) * 1000
+    late = sum(times[i] for i in order[half:]) / max(1, len(order) - half) * 1000
+    times.sort()
+    results = {
+        "source": args.audio or f"synthetic {args.seconds:g} s",
+        "checkpoints": len(engine.checkpoints),
+        "seeks": len(times),
+        "p50_ms": times[len(times) // 2] * 1000,
+        "max_ms": times[-1] * 1000,
+        "first_half_mean_ms": early,
+        "second_half_mean_ms": late,
+    }
+    print(f"{results['source']}: {results['checkpoints']} checkpoints, {len(times)} seeks")
+    print(f"seek p50 {results['p50_ms']:.2f} ms, max {results['max_ms']:.2f} ms, "
+          f"mean {early:.2f} ms in the first half vs {late:.2f} ms in the second")
+    write_results(args, results)
+
+
+def bench_show(args):
+    """Compile time, size and load time of a compiled show, and its per-frame cost vs stepping the engine."""
+    import tempfile
+
+    wd = WindowDance(interactive=False)
+    wd.WINDOW_JUMP = -40
+    np = wd.np
+    tempo, bass_energy, rms, beat_times = load_analysis(wd, args)
+    hz = args.hz
+    dt = 1 / hz
+
+    compile_s, show = best_time(lambda: make_engine(wd, args, tempo, bass_energy, rms, beat_times).compile_show(hz), args.repeats)
+    work_dir = tempfile.mkdtemp(prefix="window_dance_show_")
+    show.save(work_dir, "show_")
+    size = sum(e.stat().st_size for e in os.scandir(work_dir))
+    load_s, show = best_time(lambda: DanceShow.load(np, work_dir, "show_", hz), args.repeats)
+
+    def step_all():
+        engine = make_engine(wd, args, tempo, bass_energy, rms, beat_times)
+        start = time.perf_counter()
+        for i in range(show.n_frames):
+            engine.step(i * dt, dt)
+        return time.perf_counter() - start
+
+    def look_up_all():
+        show.rewind()
+        for i in range(show.n_frames):
+            show.frame_at(i * dt)
+
+    step_s = min(step_all() for _ in range(args.repeats))
+    lookup_s, _ = best_time(look_up_all, args.repeats)
+    shutil.rmtree(work_dir, ignore_errors=True)
+
+    results = {
+        "source": args.audio or f"synthetic {args.seconds:g} s",
+        "frames": show.n_frames,
+        "hz": hz,
+        "compile_s": compile_s,
+        "size_bytes": size,
+        "load_ms": load_s * 1000,
+        "step_us_per_frame": step_s / show.n_frames * 1e6,
+        "show_us_per_frame": lookup_s / show.n_frames * 1e6,
+    }
+    print(f"{results['source']}: {show.n_frames} frames at {hz} Hz")
+    print(f"compiled in {compile_s:.2f} s, {size / 1024:.0f} KB on disk, memory-mapped in {results['load_ms']:.2f} ms")
+    print(f"per frame: engine step {results['step_us_per_frame']:.1f} us, show lookup {results['show_us_per_frame']:.1f} us "
+          f"({step_s / lookup_s:.1f}x less)")
+    write_results(args, results)
+
+
+# -------------------------------------------------
+# Live input
+
+def bench_live(args):
+    """Live analysis and engine step per frame, fed the song a capture block at a time as if it was playing."""
+    wd = WindowDance(interactive=False)
+    wd.WINDOW_JUMP = -40
+    np = wd.np
+    rate = wd.LIVE_RATE
+    if args.audio:
+        y, _ = wd.librosa.load(args.audio, sr=rate)
+    else:
+        y = synthetic_song(np, args.seconds, sr=rate, bpm=args.bpm)
+
+    analyzer = LiveAnalyzer(np, wd, rate)
+    engine = DanceEngine(wd, (1920, 1080), seed=0)
+    engine.load_live(analyzer.tempo, 64)
+
+    block = wd.LIVE_BLOCK
+    blocks = [y[i:i + block] for i in range(0, len(y) - block + 1, block)]
+    dt = 1 / args.hz
+    n_frames = int(len(blocks) * block / rate * args.hz)
+    beats = np.arange(0, len(y) / rate, 60 / args.bpm)
+
+    costs, delays, tempos = [], [], []
+    sent = 0
+    jumping = False
+    for f in range(1, n_frames + 1):
+        now = f * dt
+        # Every block whose last sample is in by now
+        ready = []
+        while sent < len(blocks) and (sent + 1) * block / rate <= now:
+            ready.append(((sent + 1) * block / rate, blocks[sent]))
+            sent += 1
+
+        start = time.perf_counter()
+        result = analyzer.process(ready)
+        if result is not None:
+            engine.feed_live(result[1], result[2])
+        if analyzer.tempo != engine.tempo:
+            engine.set_tempo(analyzer.tempo, now)
+        engine.step(now, dt)
+        costs.append(time.perf_counter() - start)
+        tempos.append(analyzer.tempo)
+
+        # How long after a kick the dance first knows about it
+        jump = bool(engine.track_jump[engine.live_index])
+        if jump and not jumping and not args.audio:
+            kick = beats[beats <= now]
+            if len(kick):
+                delays.append(now - kick[-1])
+        jumping = jump
+
+    us = np.array(costs) * 1e6
+    p50, p99 = np.percentile(us, [50, 99])
+    final = tempos[-1]
+    settled = next((i for i in range(len(tempos)) if all(t == final for t in tempos[i:])), len(tempos))
+    results = {
+        "source": args.audio or f"synthetic {args.seconds:g} s at {args.bpm:g} BPM",
+        "frames": n_frames,
+        "hz": args.hz,
+        "block": block,
+        "hop_ms": analyzer.hop / rate * 1000,
+        "p50_us_per_frame": p50,
+        "p99_us_per_frame": p99,
+        "max_us_per_frame": float(us.max()),
+        "tempo": final,
+        "tempo_settled_s": settled * dt,
+    }
+    if delays:
+        results["detection_delay_ms_p50"] = float(np.median(delays) * 1000)
+        results["detection_delay_ms_max"] = float(np.max(delays) * 1000)
+    print(f"{results['source']}: {n_frames} frames at {args.hz} Hz, {block}-sample blocks, {results['hop_ms']:.2f} ms hops")
+    print(f"analysis + step: p50 {p50:.0f} us, p99 {p99:.0f} us, max {results['max_us_per_frame']:.0f} us per frame "
+          f"(frame period {dt * 1e6:.0f} us)")
+    print(f"tempo: {final} BPM, settled after {results['tempo_settled_s']:.1f} s")
+    if delays:
+        print(f"kick to dance: p50 {results['detection_delay_ms_p50']:.1f} ms, max {results['detection_delay_ms_max']:.1f} ms "
+              f"(includes waiting for the next frame)")
+    write_results(args, results)
+
+
+# -------------------------------------------------
+# Playback clock
+
+class SimulatedMixer:
+    """pygame.mixer.music.get_pos() as pygame computes it, against a known audible time.
+
+    The audio callback fills one buffer at a time, a little early or late, and
+    get_pos() adds SDL's millisecond ticks since the last callback. The sound
+    handed over in a callback is heard one buffer later, and the sound card's
+    clock drifts by drift_ppm against perf_counter.
+    """
+
+    def __init__(self, rng, buffer=512, freq=44100, drift_ppm=50, callback_jitter_ms=2.0):
+        self.rng = rng
+        self.period = buffer / freq
+        self.rate = 1 + drift_ppm / 1e6
+        self.callback_jitter = callback_jitter_ms / 1000
+        self.next_callback = 0.0
+        self.music_pos = 0.0
+        self.callback_ticks = 0
+
+    def get_pos(self, now):
+        while now >= self.next_callback:
+            # Audio time handed to the mixer so far (sample accurate, device clock)
+            self.music_pos = (self.next_callback + self.period) * self.rate
+            self.callback_ticks = int(self.next_callback * 1000)
+            self.next_callback += self.period + self.rng.uniform(-1, 1) * self.callback_jitter
+        ticks = int(now * 1000)
+        return int(self.music_pos * 1000) + (ticks - self.callback_ticks)
+
+    def audible(self, now):
+        return max(0.0, now * self.rate)
+
+
+def bench_clock(args):
+    """Raw get_pos() vs PlaybackClock against the time actually heard, with a simulated mixer."""
+    import random
+
+    rng = random.Random(0)
+    mixer = SimulatedMixer(rng, buffer=args.buffer, drift_ppm=args.drift_ppm)
+    latency = args.buffer / 44100
+
+    now = [0.0]
+    clock = PlaybackClock(lambda: now[0], latency=latency)
+
+    raw_err, clock_err = [], []
+    n_frames = int(args.seconds * args.hz)
+    for f in range(n_frames):
+        # Tk's after() wakes up a little late, never early
+        now[0] = f / args.hz + rng.uniform(0, args.frame_jitter_ms / 1000)
+        reported = mixer.get_pos(now[0]) / 1000
+        t = clock.update(reported)
+        heard = mixer.audible(now[0])
+        raw_err.append(reported - heard)
+        clock_err.append(t - heard)
+
+    def stats(errors):
+        # Skip the first second while the clock locks on
+        e = sorted(errors[args.hz:])
+        mean = sum(e) / len(e)
+        std = (sum((x - mean) ** 2 for x in e) / len(e)) ** 0.5
+        return {"mean_ms": mean * 1000, "std_ms": std * 1000, "p99_abs_ms": sorted(abs(x) for x in e)[int(len(e) * 0.99)] * 1000}
+
+    jitter = clock.jitter()
+    results = {
+        "frames": n_frames,
+        "hz": args.hz,
+        "raw_error": stats(raw_err),
+        "clock_error": stats(clock_err),
+        "raw_jitter_ms": jitter["raw_jitter_ms"],
+        "smoothed_jitter_ms": jitter["smoothed_jitter_ms"],
+    }
+    for name in ("raw_error", "clock_error"):
+        r = results[name]
+        print(f"{name:12s} mean {r['mean_ms']:+6.2f} ms (+ = dance ahead of the sound), std {r['std_ms']:5.2f} ms, p99 |err| {r['p99_abs_ms']:5.2f} ms")
+    print(f"step jitter: {results['raw_jitter_ms']:.2f} ms raw, {results['smoothed_jitter_ms']:.2f} ms smoothed")
+    write_results(args, results)
+
+    if args.max_jitter_ms is not None and results["smoothed_jitter_ms"] > args.max_jitter_ms:
+        print(f"FAIL: above --max-jitter-ms {args.max_jitter_ms}")
+        sys.exit(1)
+
+
+# -------------------------------------------------
+# Tk window updates
+
+def open_tk():
+    import tkinter as tk
+
+    try:
+        root = tk.Tk()
+    except tk.TclError as err:
+        print(f"Tk needs a display ({err}), run under a virtual X server: xvfb-run python benchmark.py ...")
+        sys.exit(1)
+    root.geometry("200x200+0+0")
+    return tk, root
+
+
+def bench_tcl(args):
+    """Per-frame cost of one Tk call per change vs one batched Tcl eval per frame."""
+    tk, root = open_tk()
+    results = []
+
+    for count in args.windows:
+        wins = []
+        for _ in range(count):
+            win = tk.Toplevel(root)
+            win.overrideredirect(True)
+            win.geometry("100x100+0+0")
+            wins.append(win)
+        root.update()
+
+        def frame_values(f):
+            for i, win in enumerate(wins):
+                x = (f * 3 + i * 37) % 800
+                y = (f * 5 + i * 53) % 600
+                color = f"#{(f + i) % 256:02X}{(f * 2) % 256:02X}{(i * 8) % 256:02X}"
+                yield win, x, y, color
+
+        def per_call(f):
+            for win, x, y, color in frame_values(f):
+                win.geometry(f"+{x}+{y}")
+                win.config(bg=color)
+            root.update_idletasks()
+
+        def batched(f):
+            script = []
+            for win, x, y, color in frame_values(f):
+                script.append(f"wm geometry {win} +{x}+{y}")
+                script.append(f"{win} configure -bg {color}")
+            root.tk.eval("\n".join(script))
+            root.update_idletasks()
+
+        row = {"windows": count}
+        for name, fn in (("per_call", per_call), ("batched", batched)):
+            def run():
+                for f in range(args.frames):
+                    fn(f)
+            elapsed, _ = best_time(run, args.repeats)
+            row[f"{name}_us_per_frame"] = elapsed / args.frames * 1e6
+        row["speedup"] = row["per_call_us_per_frame"] / row["batched_us_per_frame"]
+        results.append(row)
+        print(f"{count:3d} windows: per call {row['per_call_us_per_frame']:8.1f} us/frame, "
+              f"batched {row['batched_us_per_frame']:8.1f} us/frame ({row['speedup']:.2f}x)")
+
+        for win in wins:
+            win.destroy()
+
+    root.destroy()
+    write_results(args, results)
+
+
+# -------------------------------------------------
+# Window system
+
+WM_SCREEN = (1920, 1080)
+# How update_loop talks to the windows in the replay
+WM_MODES = {
+    "uncached": {"cache": False, "batch": False},
+    "cached": {"cache": True, "batch": False},
+    "batched": {"cache": True, "batch": True},
+}
+
+
+def start_xvfb(size):
+    """Start a virtual X server on a free display and point DISPLAY at it."""
+    xvfb = shutil.which("Xvfb")
+    if xvfb is None:
+        print("Xvfb not found (it is in the xvfb package)")
+        sys.exit(1)
+
+    # Xvfb picks a free display and writes its number to the pipe once it accepts clients
+    read_fd, write_fd = os.pipe()
+    proc = subprocess.Popen(
+        [xvfb, "-displayfd", str(write_fd), "-screen", "0", f"{size[0]}x{size[1]}x24", "-nolisten", "tcp"],
+        pass_fds=(write_fd,), stderr=subprocess.DEVNULL,
+    )
+    os.close(write_fd)
+    with os.fdopen(read_fd) as f:
+        display = f.readline().strip()
+    if not display:
+        proc.kill()
+        print("Xvfb failed to start")
+        sys.exit(1)
+    os.environ["DISPLAY"] = f":{display}"
+    return proc
+
+
+def wm_layout(count):
+    """(dancers, pillars, rings) for count windows in total, the main window included."""
+    pillars = (count - 1) // 3
+    dancers = count - 1 - pillars
+    return dancers, pillars, max(1, dancers // 8)
+
+
+def time_calls(root, frames, calls, prepare=None):
+    """(us per call, us per flush) of calls(f) followed by update_idletasks, over frames."""
+    call_s = 0.0
+    flush_s = 0.0
+    n_calls = 0
+    for f in range(frames):
+        if prepare:
+            prepare(f)
+            root.update_idletasks()
+        start = time.perf_counter()
+        n_calls += calls(f)
+        mid = time.perf_counter()
+        root.update_idletasks()
+        flush_s += time.perf_counter() - mid
+        call_s += mid - start
+    return call_s / max(1, n_calls) * 1e6, flush_s / frames * 1e6
+
+
+def bench_primitives(root, wins, canvases, frames, size):
+    """Per-call cost of each window call the dance makes, on override-redirect toplevels."""
+    def geometry(f):
+        for i, win in enumerate(wins):
+            win.geometry(f"+{(f * 3 + i * 37) % 800}+{(f * 5 + i * 53) % 600}")
+        return len(wins)
+
+    def config_bg(f):
+        for i, win in enumerate(wins):
+            win.config(bg=f"#{(f + i) % 256:02X}{(f * 2) % 256:02X}{(i * 8) % 256:02X}")
+        return len(wins)
+
+    # As trigger_flash and clear_flash draw them
+    def create_rectangle(f):
+        for canvas in canvases:
+            canvas.create_rectangle(0, 0, size, size, fill="#FFFFFF" if f % 2 else "#FF0000", outline="", tags="flash")
+        return len(canvases)
+
+    def delete(f):
+        for canvas in canvases:
+            canvas.delete("flash")
+        return len(canvases)
+
+    row = {}
+    for name, calls, prepare in (
+        ("geometry", geometry, None),
+        ("config_bg", config_bg, None),
+        ("create_rectangle", create_rectangle, delete),
+        ("delete", delete, create_rectangle),
+    ):
+        call_us, flush_us = time_calls(root, frames, calls, prepare)
+        row[f"{name}_call_us"] = call_us
+        row[f"{name}_flush_us"] = flush_us
+    return row
+
+
+def bench_replay(wd, args, analysis, mode):
+    """Per-frame cost of apply_frame, the commit and the flush to the X server, as update_loop does them."""
+    np = wd.np
+    wd.engine = make_engine(wd, args, *analysis)
+    wd.BATCH_TCL = mode["batch"]
+    wd._last_geom = {}
+    wd._last_bg = {}
+
+    # Count what reaches the backend, after the caches
+    backend = wd.backend
+    calls = {"move": 0, "set_color": 0, "flash": 0, "clear_flash": 0}
+    for name in calls:
+        def counted(*a, _call=getattr(type(backend), name), _name=name):
+            calls[_name] += 1
+            _call(backend, *a)
+        setattr(backend, name, counted)
+
+    dt = 1 / args.hz
+    times = []
+    try:
+        for f in range(args.frames):
+            frame = wd.engine.step(f * dt, dt)
+            start = time.perf_counter()
+            if not mode["cache"]:
+                wd._last_geom.clear()
+                wd._last_bg.clear()
+            wd.apply_frame(frame)
+            wd.root.update_idletasks()
+            times.append(time.perf_counter() - start)
+    finally:
+        for name in calls:
+            delattr(backend, name)
+
+    us = np.array(times) * 1e6
+    row = {
+        "mean_us": float(us.mean()),
+        "p50_us": float(np.percentile(us, 50)),
+        "p95_us": float(np.percentile(us, 95)),
+        "p99_us": float(np.percentile(us, 99)),
+        "max_us": float(us.max()),
+    }
+    row.update({f"{name}_per_frame": n / args.frames for name, n in calls.items()})
+    return row
+
+
+def bench_loop(wd, args, analysis, audio_file, art, threaded):
+    """The real start() and update_loop on Tk's mainloop for --loop-seconds, frames computed inline or on the frame thread."""
+    np = wd.np
+    root = wd.root
+    wd.setup_state()
+    wd.FRAME_THREAD = threaded
+    wd.engine = make_engine(wd, args, *analysis)
+    wd.setup_mixer()
+    wd.AUDIO_FILE = audio_file
+    _, sound = wd.decode_once()
+    wd.player.load(audio_file, sound)
+    wd.playlist = [audio_file]
+    wd.current_track = wd.first_track = {"index": 0, "file": audio_file, "art": art}
+    wd.start_button = wd.tk.Button(root)
+
+    # Tk-thread time of every tick, the frame thread's work included only when inline
+    busy = []
+    update_loop = wd.update_loop
+
+    def timed_update_loop():
+        start = time.perf_counter()
+        update_loop()
+        busy.append(time.perf_counter() - start)
+
+    wd.update_loop = timed_update_loop
+    wd.start()
+    root.after(int(args.loop_seconds * 1000), root.quit)
+    root.mainloop()
+
+    if wd.frame_job:
+        root.after_cancel(wd.frame_job)
+    if wd.producer is not None:
+        wd.producer.stop()
+        wd.producer = None
+    wd.player.stop()
+    del wd.update_loop
+
+    us = np.array(busy) * 1e6
+    return {
+        "ticks": wd.frames_ticked,
+        "missed": wd.frames_missed,
+        "tick_jitter_ms": wd.tick_jitter_ms(),
+        "p50_us": float(np.percentile(us, 50)),
+        "p99_us": float(np.percentile(us, 99)),
+        "max_us": float(us.max()),
+    }
+
+
+def wm_regressions(results, baseline, tolerance):
+    """Measurements more than tolerance times slower than the same ones in baseline."""
+    def keyed(data):
+        rows = {}
+        for row in data.get("primitives", []):
+            for name, value in row.items():
+                if name.endswith("_us"):
+                    rows[f"primitives {row['windows']} windows {name}"] = value
+        for row in data.get("replay", []):
+            rows[f"replay {row['windows']} windows {row['mode']} p50_us"] = row["p50_us"]
+        for row in data.get("loop", []):
+            rows[f"loop {row['windows']} windows {row['mode']} p50_us"] = row["p50_us"]
+        return rows
+
+    old = keyed(baseline)
+    return [
+        (name, old[name], value) for name, value in keyed(results).items()
+        if name in old and old[name] > 0 and value > old[name] * tolerance
+    ]
+
+
+def bench_wm(args):
+    """Per-call cost of the window primitives, replayed frames and the real update loop, for 2 to 64 windows."""
+    import platform
+
+    import tempfile
+
+    # The loop plays a song to drive its clock, nothing has to be heard
+    os.environ["SDL_AUDIODRIVER"] = "dummy"
+    xvfb = start_xvfb(WM_SCREEN) if args.xvfb else None
+    work_dir = tempfile.mkdtemp(prefix="window_dance_wm_")
+    try:
+        wd = WindowDance(interactive=False)
+        np = wd.np
+        wd.WINDOW_JUMP = -40
+        wd.GOVERNOR = False
+        # No frame thread until a loop run's setup_state, album art goes straight to the engine
+        wd.producer = None
+        analysis = load_analysis(wd, args)
+        art = wd.Image.new("RGB", (wd.SQUARE_SIZE, wd.SQUARE_SIZE), "#3060c0") if args.images else None
+
+        # A song a little longer than each loop run, decoded into a mixer Sound like SINGLE_DECODE does
+        rate = wd.MIXER_FORMAT[0]
+        y = synthetic_song(np, args.loop_seconds + 2, sr=rate)
+        audio_file = os.path.join(work_dir, "loop.wav")
+        wd.soundfile.write(audio_file, np.stack([y, y], axis=1), rate)
+
+        results = {"environment": None, "primitives": [], "replay": [], "loop": []}
+        for count in args.windows:
+            wd.DANCERS, wd.PILLARS, wd.ORBIT_RINGS = wm_layout(count)
+            wd.engine = make_engine(wd, args, *analysis)
+            backend = open_backend(wd, "tk")
+            if backend is None:
+                sys.exit(1)
+            root = wd.root
+            wd.show_album_art(art)
+            root.update()
+            if results["environment"] is None:
+                results["environment"] = {
+                    "x_server": root.winfo_server(),
+                    "display": os.environ.get("DISPLAY"),
+                    "xvfb": xvfb is not None,
+                    "tk": root.tk.call("info", "patchlevel"),
+                    "python": platform.python_version(),
+                    "platform": platform.platform(),
+                    "frames": args.frames,
+                    "hz": args.hz,
+                    "images": args.images,
+                }
+
+            row = {"windows": count}
+            row.update(bench_primitives(root, wd.windows[1:], wd.canvases, args.frames, wd.SQUARE_SIZE))
+            results["primitives"].append(row)
+            print(f"{count:3d} windows, us per call (+ us per flush): "
+                  + ", ".join(f"{name} {row[f'{name}_call_us']:.1f} (+{row[f'{name}_flush_us']:.0f})"
+                              for name in ("geometry", "config_bg", "create_rectangle", "delete")))
+
+            for mode_name, mode in WM_MODES.items():
+                row = {"windows": count, "mode": mode_name}
+                row.update(bench_replay(wd, args, analysis, mode))
+                results["replay"].append(row)
+                print(f"    replay {mode_name:8s} p50 {row['p50_us']:8.1f} us, p99 {row['p99_us']:8.1f} us per frame, "
+                      f"{row['move_per_frame']:.1f} moves and {row['set_color_per_frame']:.1f} colors per frame")
+
+            if args.loop_seconds > 0:
+                for mode_name, threaded in (("inline", False), ("threaded", True)):
+                    row = {"windows": count, "mode": mode_name}
+                    row.update(bench_loop(wd, args, analysis, audio_file, art, threaded))
+                    results["loop"].append(row)
+                    print(f"    loop   {mode_name:8s} p50 {row['p50_us']:8.1f} us, p99 {row['p99_us']:8.1f} us per tick, "
+                          f"{row['ticks']} ticks, {row['missed']} missed, {row['tick_jitter_ms']:.2f} ms tick jitter")
+
+            root.destroy()
+    finally:
+        if xvfb is not None:
+            xvfb.terminate()
+            xvfb.wait()
+        shutil.rmtree(work_dir, ignore_errors=True)
+
+    write_results(args, results)
+    if args.baseline:
+        with open(args.baseline) as f:
+            slower = wm_regressions(results, json.load(f), args.tolerance)
+        for name, old, new in slower:
+            print(f"REGRESSION {name}: {old:.1f} -> {new:.1f} us")
+        if slower:
+            sys.exit(1)
+        print(f"No measurement more than {args.tolerance:g}x slower than {args.baseline}")
+
+
+# -------------------------------------------------
+# Render backends
+
+def open_backend(wd, name):
+    """The named backend set up on a fresh screen, or None if it can't run here."""
+    if name == "tk":
+        try:
+            wd.root = wd.tk.Tk()
+        except wd.tk.TclError as err:
+            print(f"tk: skipped, Tk needs a display ({err}), run under xvfb-run")
+            return None
+    else:
+        try:
+            wd.pygame.display.init()
+        except wd.pygame.error as err:
+            print(f"{name}: skipped ({err}), set SDL_VIDEODRIVER=dummy to time the drawing without a display")
+            return None
+
+    backend = wd.RENDER_BACKENDS[name](wd)
+    backend.setup(wd.engine)
+    wd.backend = backend
+    wd.windows = backend.windows
+    wd.canvases = backend.canvases
+    wd._last_geom = {}
+    wd._last_bg = {}
+    wd.profiler = None
+    wd.governor = None
+    return backend
+
+
+def bench_backends(args):
+    """Per-frame cost of applying the same dance through each render backend."""
+    wd = WindowDance(interactive=False)
+    np = wd.np
+    wd.WINDOW_JUMP = -40
+    wd.PREVIEW_SCALE = args.scale
+    tempo, bass_energy, rms, beat_times = load_analysis(wd, args)
+    art = wd.Image.new("RGB", (wd.SQUARE_SIZE, wd.SQUARE_SIZE), "#3060c0") if args.images else None
+
+    results = {}
+    for name in args.backends:
+        wd.engine = make_engine(wd, args, tempo, bass_energy, rms, beat_times)
+        backend = open_backend(wd, name)
+        if backend is None:
+            continue
+        wd.show_album_art(art)
+
+        dt = 1 / args.hz
+        times = []
+        for f in range(args.frames):
+            frame = wd.engine.step(f * dt, dt)
+            start = time.perf_counter()
+            wd.apply_frame(frame)
+            if name == "tk":
+                # Let Tk hand the changes to the window manager inside the timing
+                wd.root.update_idletasks()
+            times.append(time.perf_counter() - start)
+            if name == "pygame":
+                wd.pygame.event.pump()
+
+        if name == "tk":
+            wd.root.destroy()
+        else:
+            wd.pygame.display.quit()
+
+        us = np.array(times) * 1e6
+        results[name] = {
+            "frames": len(times),
+            "mean_us": float(us.mean()),
+            "p50_us": float(np.percentile(us, 50)),
+            "p95_us": float(np.percentile(us, 95)),
+            "p99_us": float(np.percentile(us, 99)),
+            "max_us": float(us.max()),
+        }
+
+    if not results:
+        sys.exit(1)
+
+    print(f"{args.frames} frames at {args.hz} Hz, us per frame:")
+    print(f"{'backend':8s} {'mean':>9s} {'p50':>9s} {'p95':>9s} {'p99':>9s} {'max':>9s}")
+    for name, r in results.items():
+        print(f"{name:8s} {r['mean_us']:9.1f} {r['p50_us']:9.1f} {r['p95_us']:9.1f} {r['p99_us']:9.1f} {r['max_us']:9.1f}")
+    if len(results) == 2:
+        print(f"tk / pygame at p50: {results['tk']['p50_us'] / results['pygame']['p50_us']:.2f}x")
+    if os.environ.get("SDL_VIDEODRIVER") == "dummy":
+        print("(SDL_VIDEODRIVER=dummy: pygame drew into memory, nothing was presented)")
+    write_results(args, results)
+
+
+# -------------------------------------------------
+# Frame governor
+
+class SlowBackend:
+    """A window system under load: every window call burns call_us of CPU, and each commit commit_us."""
+
+    def __init__(self, engine, call_us, commit_us):
+        self.windows = list(range(len(engine.WINDOWS)))
+        self.canvases = list(range(engine.DANCERS))
+        self.call_s = call_us / 1e6
+        self.commit_s = commit_us / 1e6
+        # Where each window really is, to measure how far the governor leaves them
+        self.pos = [tuple(p) for p in engine.rest_positions()]
+
+    def burn(self, seconds):
+        end = time.perf_counter() + seconds
+        while time.perf_counter() < end:
+            pass
+
+    def move(self, win, x, y):
+        self.pos[win] = (x, y)
+        self.burn(self.call_s)
+
+    def set_color(self, win, color):
+        self.burn(self.call_s)
+
+    def flash(self, canvas, color):
+        self.burn(self.call_s)
+
+    def clear_flash(self, canvas):
+        self.burn(self.call_s)
+
+    def commit(self):
+        self.burn(self.commit_s)
+
+
+def bench_governor(args):
+    """Frame time and window error under a slow window system, with and without the governor."""
+    wd = WindowDance(interactive=False)
+    np = wd.np
+    wd.WINDOW_JUMP = -40
+    tempo, bass_energy, rms, beat_times = load_analysis(wd, args)
+    period = 1 / args.hz
+
+    results = {}
+    for governed in (False, True):
+        engine = make_engine(wd, args, tempo, bass_energy, rms, beat_times)
+        backend = SlowBackend(engine, args.call_us, args.commit_us)
+        wd.backend = backend
+        wd.windows = backend.windows
+        wd.canvases = backend.canvases
+        wd._last_geom = {}
+        wd._last_bg = {}
+        wd.profiler = None
+        wd.governor = None
+        if governed:
+            wd.governor = FrameGovernor(
+                time.perf_counter, period, len(engine.WINDOWS), range(engine.PILLAR1, len(engine.WINDOWS)),
+                wd.GOVERNOR_HIGH, wd.GOVERNOR_LOW, wd.GOVERNOR_HOLD, wd.GOVERNOR_MIN_MOVE,
+            )
+
+        # Frames back to back, each stepped at the time it is due
+        truth = [tuple(p) for p in engine.rest_positions()]
+        times = []
+        errors = []
+        for f in range(args.frames):
+            start = time.perf_counter()
+            frame = engine.step(f * period, period)
+            for w, p in enumerate(frame.positions):
+                if p is not None:
+                    truth[w] = (int(p[0]), int(p[1]))
+            wd.apply_frame(frame)
+            work = time.perf_counter() - start
+            times.append(work)
+            if governed:
+                wd.governor.record(work, int(work / period))
+            errors.append(np.abs(np.subtract(backend.pos, truth)).max(axis=1).mean())
+
+        ms = np.array(times) * 1000
+        name = "governed" if governed else "full"
+        results[name] = {
+            "p50_ms": float(np.percentile(ms, 50)),
+            "p95_ms": float(np.percentile(ms, 95)),
+            "over_budget": float((ms > period * 1000).mean()),
+            "mean_error_px": float(np.mean(errors)),
+            "max_error_px": float(np.max(errors)),
+        }
+        if governed:
+            results[name]["governor"] = wd.governor.summary()
+
+    print(f"{args.frames} frames at {args.hz} Hz ({period * 1000:.2f} ms budget), "
+          f"{args.call_us:g} us per window call, {args.commit_us:g} us per commit")
+    print(f"{'':9s} {'p50 ms':>8s} {'p95 ms':>8s} {'over budget':>12s} {'mean error px':>14s} {'max error px':>13s}")
+    for name, r in results.items():
+        print(f"{name:9s} {r['p50_ms']:8.2f} {r['p95_ms']:8.2f} {r['over_budget']:12.1%} "
+              f"{r['mean_error_px']:14.2f} {r['max_error_px']:13.1f}")
+    levels = results["governed"]["governor"]["levels"]
+    print("time at each level: " + ", ".join(f"{name} {r['share']:.0%}" for name, r in levels.items()))
+    write_results(args, results)
+
+
+# -------------------------------------------------
+# Frame thread
+
+def bench_threads(args):
+    """Tick jitter and Tk-thread time per tick, frames computed inline vs on the frame thread."""
+    import threading
+
+    wd = WindowDance(interactive=False)
+    np = wd.np
+    wd.WINDOW_JUMP = -40
+    tempo, bass_energy, rms, beat_times = load_analysis(wd, args)
+    period = 1 / args.hz
+
+    # Extra NumPy work per frame, standing in for a heavier dance or analysis
+    size = 64
+    a = np.random.default_rng(0).random((size, size))
+    start = time.perf_counter()
+    for _ in range(20):
+        a @ a
+    reps = max(0, round(args.compute_ms / 1000 / ((time.perf_counter() - start) / 20)))
+
+    results = {}
+    for threaded in (False, True):
+        engine = make_engine(wd, args, tempo, bass_energy, rms, beat_times)
+        backend = SlowBackend(engine, args.call_us, args.commit_us)
+        wd.backend = backend
+        wd.windows = backend.windows
+        wd.canvases = backend.canvases
+        wd._last_geom = {}
+        wd._last_bg = {}
+        wd.profiler = None
+        wd.governor = None
+
+        def step(t, dt):
+            for _ in range(reps):
+                a @ a
+            return engine.step(t, dt)
+
+        producer = None
+        if threaded:
+            producer = FrameProducer(threading, step, engine.rest_positions,
+                                   engine.DANCERS, period, wd.MAX_FRAME_DT)
+
+        # A Tk-like loop: sleep until each deadline, then do the tick's work on this thread
+        intervals = []
+        busy = []
+        applied = 0
+        begin = last = time.perf_counter()
+        deadline = begin
+        for f in range(args.frames):
+            deadline += period
+            delay = deadline - time.perf_counter()
+            if delay > 0:
+                time.sleep(delay)
+            now = time.perf_counter()
+            intervals.append(now - last)
+            last = now
+
+            t = now - begin
+            if producer is not None:
+                frame = producer.take()
+                producer.request(t + period)
+            else:
+                frame = step(t, period)
+            if frame is not None:
+                wd.apply_frame(frame)
+                applied += 1
+            busy.append(time.perf_counter() - now)
+
+        if producer is not None:
+            producer.stop()
+
+        jitter = (np.array(intervals[1:]) - period) * 1000
+        busy_ms = np.array(busy) * 1000
+        name = "threaded" if threaded else "inline"
+        results[name] = {
+            "jitter_rms_ms": float(np.sqrt(np.mean(jitter ** 2))),
+            "jitter_p99_ms": float(np.percentile(np.abs(jitter), 99)),
+            "busy_p50_ms": float(np.percentile(busy_ms, 50)),
+            "busy_p99_ms": float(np.percentile(busy_ms, 99)),
+            "applied": applied / args.frames,
+        }
+
+    print(f"{args.frames} ticks at {args.hz} Hz, {args.compute_ms:g} ms of extra NumPy work per frame, "
+          f"{os.cpu_count()} CPUs")
+    print(f"{'':9s} {'jitter rms ms':>14s} {'jitter p99 ms':>14s} {'Tk p50 ms':>10s} {'Tk p99 ms':>10s} {'applied':>8s}")
+    for name, r in results.items():
+        print(f"{name:9s} {r['jitter_rms_ms']:14.2f} {r['jitter_p99_ms']:14.2f} {r['busy_p50_ms']:10.2f} "
+              f"{r['busy_p99_ms']:10.2f} {r['applied']:8.1%}")
+    write_results(args, results)
+
+
+# -------------------------------------------------
+# Startup
+
+# Loaded first in each startup run. Marks when Tk is first asked for a window ("tk") and when one is
+# mapped on screen ("window"), then ends the run. Every run analyzes cold, like a first launch.
+STARTUP_HOOK = """\
+import os, sys, time, tkinter
+_start = time.perf_counter()
+_tk_init = tkinter.Tk.__init__
+
+def _mark(name):
+    print(f"\\n@startup {name} {(time.perf_counter() - _start) * 1000:.3f}", flush=True)
+
+def _mapped(event):
+    if isinstance(event.widget, (tkinter.Tk, tkinter.Toplevel)):
+        _mark("window")
+        os._exit(0)
+
+def _tk(self, *args, **kwargs):
+    _mark("tk")
+    _tk_init(self, *args, **kwargs)
+    self.bind_all("<Map>", _mapped, add="+")
+
+def _uncached(setup_defaults):
+    def wrapped(self):
+        setup_defaults(self)
+        self.CACHE_DIR = None
+    return wrapped
+
+tkinter.Tk.__init__ = _tk
+"""
+
+STARTUP_SCRIPTS = {
+    # The old start: every heavy import, pygame's display probe and the whole analysis before any window
+    "eager": """\
+import librosa, pygame, numpy, PIL.Image, PIL.ImageTk, mutagen.id3
+import main
+main.WindowDance.setup_defaults = _uncached(main.WindowDance.setup_defaults)
+
+class EagerStart(main.WindowDance):
+    def probe_refresh_rate(self):
+        try:
+            pygame.init()
+            pygame.display.set_mode((1, 1))
+            rf = pygame.display.get_current_refresh_rate()
+            pygame.display.quit()
+            return rf
+        except Exception:
+            return None
+
+    def setup_windows(self):
+        self.analyze_audio()
+        super().setup_windows()
+
+EagerStart().run()
+""",
+    # main.py as it is launched
+    "lazy": """\
+import main
+main.WindowDance.setup_defaults = _uncached(main.WindowDance.setup_defaults)
+main.WindowDance().run()
+""",
+}
+
+
+def bench_startup(args):
+    """Launch to the first mapped window, answering the prompts, each run in a fresh interpreter."""
+    import tempfile
+
+    xvfb = start_xvfb(WM_SCREEN) if args.xvfb else None
+    work_dir = tempfile.mkdtemp(prefix="window_dance_startup_")
+    try:
+        audio_file = os.path.abspath(args.audio) if args.audio else os.path.join(work_dir, "song.wav")
+        if not args.audio:
+            wd = WindowDance(interactive=False)
+            y = synthetic_song(wd.np, args.seconds, sr=wd.MIXER_FORMAT[0])
+            wd.soundfile.write(audio_file, y, wd.MIXER_FORMAT[0])
+        # Song, jump height, no custom tempo
+        answers = f"{audio_file}\n0\nn\n"
+        env = dict(os.environ, SDL_AUDIODRIVER="dummy")
+
+        results = {}
+        for name, script in STARTUP_SCRIPTS.items():
+            best = {}
+            for _ in range(args.repeats):
+                out = subprocess.run(
+                    [sys.executable, "-c", STARTUP_HOOK + script], input=answers, capture_output=True, text=True,
+                    cwd=os.path.dirname(os.path.abspath(__file__)), env=env,
+                )
+                marks = dict(line.split()[1:] for line in out.stdout.splitlines() if line.startswith("@startup "))
+                if "tk" not in marks:
+                    print(out.stdout + out.stderr)
+                    sys.exit(1)
+                for mark, ms in marks.items():
+                    best[mark] = min(best.get(mark, float("inf")), float(ms))
+            for mark, ms in best.items():
+                results[f"{name}_{mark}_ms"] = ms
+            window = f"{best['window']:8.1f} ms" if "window" in best else "     n/a"
+            print(f"{name}: Tk asked for a window after {best['tk']:8.1f} ms, first window mapped after {window}")
+    finally:
+        if xvfb is not None:
+            xvfb.terminate()
+            xvfb.wait()
+        shutil.rmtree(work_dir, ignore_errors=True)
+
+    mark = "window" if "lazy_window_ms" in results and "eager_window_ms" in results else "tk"
+    results["speedup"] = results[f"eager_{mark}_ms"] / results[f"lazy_{mark}_ms"]
+    if mark == "tk":
+        print("No window was mapped (no display, --xvfb starts one), only the time up to Tk() is compared")
+    print(f"fast start is {results['speedup']:.1f}x quicker to {'the first window' if mark == 'window' else 'Tk()'}")
+    write_results(args, results)
+
+
+# -------------------------------------------------
+# Decoding
+
+def decode_path(wd, path, audio_file):
+    """Decode audio_file for analysis and playback the old way ("double") or with decode_once ("single").
+
+    Returns the seconds spent decoding for playback on top of the analysis decode.
+    """
+    wd.AUDIO_FILE = audio_file
+    if path == "single":
+        wd.decode_once()
+        return 0.0
+
+    wd.librosa.load(audio_file, sr=wd.ANALYSIS_SR)
+    # mixer.music decodes the file once more while it plays, this is the same decode done at once
+    start = time.perf_counter()
+    wd.pygame.mixer.Sound(audio_file)
+    return time.perf_counter() - start
+
+
+def proc_status_kb(field):
+    with open("/proc/self/status") as f:
+        for line in f:
+            if line.startswith(field + ":"):
+                return int(line.split()[1])
+    return None
+
+
+def bench_decode_child(args):
+    # One path in a fresh process, so its peak memory is its own (Linux only, from /proc)
+    wd = WindowDance(interactive=False)
+    wd.player = None
+    wd.setup_mixer()
+
+    # Warm up on the first second, so lazily loaded modules don't count as decode memory
+    warmup = os.path.join(os.path.dirname(args.audio), "warmup_" + os.path.basename(args.audio))
+    data, rate = wd.soundfile.read(args.audio, frames=wd.MIXER_FORMAT[0], always_2d=True)
+    wd.soundfile.write(warmup, data, rate)
+    decode_path(wd, args.child, warmup)
+    os.remove(warmup)
+
+    try:
+        # Writing 5 starts the peak (VmHWM) over from the current resident size
+        with open("/proc/self/clear_refs", "w") as f:
+            f.write("5")
+        base = proc_status_kb("VmRSS")
+    except OSError:
+        base = None
+
+    analysis = playback = float("inf")
+    peak_mb = None
+    for _ in range(args.repeats):
+        start = time.perf_counter()
+        playback_s = decode_path(wd, args.child, args.audio)
+        analysis = min(analysis, time.perf_counter() - start - playback_s)
+        playback = min(playback, playback_s)
+        if peak_mb is None and base is not None:
+            peak_mb = (proc_status_kb("VmHWM") - base) / 1024
+    result = {"analysis_decode_s": analysis, "playback_decode_s": playback, "peak_mb": peak_mb}
+    if args.child == "single":
+        result.update(bench_decode_seeks(wd, args.audio, base is not None))
+    print(json.dumps(result))
+
+
+def bench_decode_seeks(wd, audio_file, has_peak):
+    """Time and extra peak memory of seeking in a decoded song, and of copying its tail like seeks used to."""
+    from main import AudioPlayer
+
+    pygame = wd.pygame
+    wd.AUDIO_FILE = audio_file
+    _, sound = wd.decode_once()
+    player = AudioPlayer(pygame, time.perf_counter)
+    player.load(audio_file, sound)
+    player.play()
+    middle = sound.get_length() / 2
+
+    def copy_tail():
+        samples = pygame.sndarray.samples(sound)
+        return pygame.mixer.Sound(buffer=samples[int(middle * wd.MIXER_FORMAT[0]):])
+
+    result = {}
+    for name, seek in (("seek", lambda: player.play(start=middle)), ("copy_seek", copy_tail)):
+        if has_peak:
+            with open("/proc/self/clear_refs", "w") as f:
+                f.write("5")
+            base = proc_status_kb("VmRSS")
+        start = time.perf_counter()
+        kept = seek()
+        result[f"{name}_ms"] = (time.perf_counter() - start) * 1000
+        result[f"{name}_peak_mb"] = (proc_status_kb("VmHWM") - base) / 1024 if has_peak else None
+        del kept
+    player.stop()
+    return result
+
+
+def bench_decode(args):
+    """Decode time and peak memory of one decode shared by analysis and playback vs one each."""
+    if args.child:
+        return bench_decode_child(args)
+
+    import tempfile
+
+    wd = WindowDance(interactive=False)
+    work_dir = tempfile.mkdtemp(prefix="window_dance_decode_")
+    audio = args.audio
+    if not audio:
+        np = wd.np
+        rate = wd.MIXER_FORMAT[0]
+        y = synthetic_song(np, args.seconds, sr=rate)
+        fmt = "MP3" if "MP3" in wd.soundfile.available_formats() else "WAV"
+        audio = os.path.join(work_dir, f"synthetic.{fmt.lower()}")
+        wd.soundfile.write(audio, np.stack([y, y], axis=1), rate, format=fmt)
+
+    # Nothing is played, the mixer only has to exist
+    env = dict(os.environ, SDL_AUDIODRIVER="dummy", PYGAME_HIDE_SUPPORT_PROMPT="1")
+    results = {"source": args.audio or f"synthetic {args.seconds:g} s ({os.path.splitext(audio)[1][1:]})"}
+    for path in ("double", "single"):
+        out = subprocess.run(
+            [sys.executable, os.path.abspath(__file__), "decode", "--child", path, "--audio", audio, "--repeats", str(args.repeats)],
+            capture_output=True, text=True, check=True, env=env,
+        )
+        results[path] = json.loads(out.stdout.strip().splitlines()[-1])
+    shutil.rmtree(work_dir, ignore_errors=True)
+
+    double, single = results["double"], results["single"]
+    print(f"{results['source']}")
+    print(f"double: {double['analysis_decode_s']:.3f} s decode + resample for analysis, "
+          f"{double['playback_decode_s']:.3f} s decoding again for playback, {double['peak_mb']:.0f} MB peak")
+    print(f"single: {single['analysis_decode_s']:.3f} s for both, {single['peak_mb']:.0f} MB peak (the playback buffer included)")
+    print(f"seek in the decoded song: {single['seek_ms']:.1f} ms, {single['seek_peak_mb']:.0f} MB more at the peak "
+          f"(copying the rest of the song, as seeks used to: {single['copy_seek_ms']:.1f} ms, {single['copy_seek_peak_mb']:.0f} MB)")
+    total = double["analysis_decode_s"] + double["playback_decode_s"]
+    print(f"decode time: {total / single['analysis_decode_s']:.2f}x lower, peak memory: {double['peak_mb'] / single['peak_mb']:.2f}x lower")
+    write_results(args, results)
+
+
+BENCHMARKS = {
+    "bass": (bench_bass, "Low-band bass extractor vs the full STFT"),
+    "stream": (bench_stream, "Block-streamed analysis vs the in-memory one, tracks and peak memory compared"),
+    "engine": (bench_engine, "Headless DanceEngine frames per second and allocations"),
+    "layouts": (bench_layouts, "Every window layout stepped, seeked and compiled, 0 dancers and 0 pillars included"),
+    "tcl": (bench_tcl, "Per-call vs batched Tcl window updates (needs a display)"),
+    "wm": (bench_wm, "Window primitives, replayed frames and the real update loop for 2 to 64 windows (needs a display or --xvfb)"),
+    "backends": (bench_backends, "Frame cost of the Tk windows vs the single pygame window"),
+    "seek": (bench_seek, "Seek cost anywhere in a song (checkpoint restore and replay)"),
+    "show": (bench_show, "Compiled show size and load time, per-frame lookup vs engine step"),
+    "governor": (bench_governor, "Frame time and window error under a slow window system, with and without the governor"),
+    "threads": (bench_threads, "Tick jitter and Tk-thread time, frames computed inline vs on the frame thread"),
+    "clock": (bench_clock, "Raw mixer position vs the smoothed playback clock (simulated mixer)"),
+    "live": (bench_live, "Live input analysis cost, tempo tracking and kick-to-dance delay"),
+    "startup": (bench_startup, "Launch to the first mapped window, the old eager start vs the fast start (needs a display or --xvfb)"),
+    "decode": (bench_decode, "One decode shared by analysis and playback vs one each"),
+}
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    sub = parser.add_subparsers(dest="name", required=True)
+    for name, (_, help_text) in BENCHMARKS.items():
+        p = sub.add_parser(name, help=help_text)
+        p.add_argument("--audio", help="audio file to use instead of the synthetic song")
+        p.add_argument("--seconds", type=float, default=240, help="length of the synthetic song")
+        p.add_argument("--repeats", type=int, default=5, help="runs per measurement, the best one is kept")
+        p.add_argument("--output", help="write the results to this JSON file")
+
+    stream = sub.choices["stream"]
+    stream.add_argument("--max-error", type=float, default=1e-3, help="largest bass and rms difference that passes (exit code 1 above it)")
+    stream.add_argument("--memory-minutes", type=float, nargs="*", default=[5, 60],
+                        help="song lengths the peak memory is measured at, none to skip (60 minutes in memory needs about 3 GB)")
+    stream.add_argument("--max-growth", type=float, default=1.5, help="how many times the streamed peak may grow from the shortest to the longest song (exit code 1 above it)")
+    stream.add_argument("--memory-child", choices=["streamed", "in_memory"], help=argparse.SUPPRESS)
+
+    engine = sub.choices["engine"]
+    engine.add_argument("--hz", type=int, default=60, help="frame rate to step the engine at")
+    engine.add_argument("--images", action="store_true", help="dancers show album art (flash events instead of fades)")
+    engine.add_argument("--alloc-frames", type=int, default=2000, help="frames traced for the allocation numbers")
+    engine.add_argument("--dancers", type=int, default=2, help="number of dancer windows")
+    engine.add_argument("--pillars", type=int, default=4, help="number of pillar windows")
+    engine.add_argument("--rings", type=int, default=1, help="orbits the dancers are spread over")
+    engine.add_argument("--min-fps", type=float, help="exit with an error below this many frames per second (for CI)")
+
+    layouts = sub.choices["layouts"]
+    layouts.add_argument("--layouts", type=parse_layout, nargs="+", default=[parse_layout(t) for t in ("0x0", "0x4", "1x0", "2x0", "2x4", "5x3x2", "32x16x4")],
+                         help="DANCERSxPILLARS[xRINGS] layouts to run (exit code 1 if any fails)")
+    layouts.add_argument("--hz", type=int, default=60, help="frame rate to step the engine at")
+
+    tcl = sub.choices["tcl"]
+    tcl.add_argument("--windows", type=int, nargs="+", default=[2, 4, 8, 16, 32, 64], help="window counts to try")
+    tcl.add_argument("--frames", type=int, default=300, help="frames per measurement")
+
+    wm = sub.choices["wm"]
+    wm.add_argument("--xvfb", action="store_true", help="start a virtual X server for the run (needs Xvfb)")
+    wm.add_argument("--windows", type=int, nargs="+", default=[2, 4, 8, 16, 32, 64], help="window counts to try, the main window included")
+    wm.add_argument("--hz", type=int, default=60, help="frame rate to step the engine at")
+    wm.add_argument("--frames", type=int, default=300, help="frames per measurement")
+    wm.add_argument("--images", action="store_true", help="dancers show album art (flash events instead of fades)")
+    wm.add_argument("--loop-seconds", type=float, default=5, help="seconds of the real update_loop per window count and mode (0 to skip)")
+    wm.add_argument("--baseline", help="results JSON of an earlier run, exit with an error on a regression (for CI)")
+    wm.add_argument("--tolerance", type=float, default=1.5, help="how many times slower than the baseline counts as a regression")
+
+    backends = sub.choices["backends"]
+    backends.add_argument("--backends", nargs="+", default=list(WindowDance.RENDER_BACKENDS), choices=list(WindowDance.RENDER_BACKENDS), help="backends to compare")
+    backends.add_argument("--hz", type=int, default=60, help="frame rate to step the engine at")
+    backends.add_argument("--frames", type=int, default=3000, help="frames applied per backend")
+    backends.add_argument("--scale", type=float, default=0.5, help="PREVIEW_SCALE of the pygame window")
+    backends.add_argument("--images", action="store_true", help="dancers show album art (flash events instead of fades)")
+
+    seek = sub.choices["seek"]
+    seek.add_argument("--images", action="store_true", help="dancers show album art (flash events instead of fades)")
+    seek.add_argument("--seeks", type=int, default=500, help="random seeks to time")
+
+    show = sub.choices["show"]
+    show.add_argument("--hz", type=int, default=60, help="frame rate the show is compiled at")
+    show.add_argument("--images", action="store_true", help="dancers show album art (flash events instead of fades)")
+
+    governor = sub.choices["governor"]
+    governor.add_argument("--hz", type=int, default=60, help="frame rate to step the engine at")
+    governor.add_argument("--frames", type=int, default=600, help="frames applied with and without the governor")
+    governor.add_argument("--call-us", type=float, default=1500, help="CPU each window call costs")
+    governor.add_argument("--commit-us", type=float, default=1000, help="CPU each commit costs")
+    governor.add_argument("--images", action="store_true", help="dancers show album art (flash events instead of fades)")
+
+    threads = sub.choices["threads"]
+    threads.add_argument("--hz", type=int, default=60, help="tick rate of the loop")
+    threads.add_argument("--frames", type=int, default=600, help="ticks per run")
+    threads.add_argument("--compute-ms", type=float, default=4, help="extra NumPy work per frame")
+    threads.add_argument("--call-us", type=float, default=100, help="CPU each window call costs")
+    threads.add_argument("--commit-us", type=float, default=500, help="CPU each commit costs")
+    threads.add_argument("--images", action="store_true", help="dancers show album art (flash events instead of fades)")
+
+    clock = sub.choices["clock"]
+    clock.add_argument("--hz", type=int, default=60, help="frame rate the clock is read at")
+    clock.add_argument("--buffer", type=int, default=512, help="mixer buffer size in samples")
+    clock.add_argument("--drift-ppm", type=float, default=50, help="sound card clock drift against perf_counter")
+    clock.add_argument("--frame-jitter-ms", type=float, default=2.0, help="how late a frame can wake up")
+    clock.add_argument("--max-jitter-ms", type=float, help="exit with an error above this smoothed step jitter (for CI)")
+
+    live = sub.choices["live"]
+    live.add_argument("--hz", type=int, default=60, help="frame rate the input is drained at")
+    live.add_argument("--bpm", type=float, default=120, help="tempo of the synthetic song")
+
+    startup = sub.choices["startup"]
+    startup.add_argument("--xvfb", action="store_true", help="start a virtual X server for the run (needs Xvfb)")
+
+    decode = sub.choices["decode"]
+    decode.add_argument("--child", choices=["double", "single"], help=argparse.SUPPRESS)
+
+    args = parser.parse_args()
+    BENCHMARKS[args.name][0](args)
+
+
+if __name__ == "__main__":
+    main()
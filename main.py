@@ -1,48 +1,2277 @@
-class WindowDance:
-    def __init__(self):
-        import tkinter as tk
-        import librosa
-        import pygame
+class FrameProfiler:
+    """Per-section frame timings and window call counts for update_loop.
+
+    Only created when PROFILE is on. DanceEngine.step and update_loop call lap()
+    after each section, which adds the time since the previous mark to that
+    section for the frame. Those methods are ProfiledMethods: the hooks only
+    run in their _profiled variants, which enable_profiler binds, and the
+    plain methods have no trace of the profiler.
+    """
+
+    def __init__(self, np, clock):
+        self.np = np
+        self.clock = clock
+        self.sections = {}
+        self.totals = []
+        self.current = {}
+        self.frame_start = 0.0
+        self.mark = 0.0
+
+        self.geom_issued = 0
+        self.geom_skipped = 0
+        self.bg_issued = 0
+        self.bg_skipped = 0
+
+    def start_frame(self):
+        self.frame_start = self.mark = self.clock()
+        self.current = {}
+
+    def lap(self, name):
+        now = self.clock()
+        self.current[name] = self.current.get(name, 0.0) + now - self.mark
+        self.mark = now
+
+    def end_frame(self):
+        frame = len(self.totals)
+        for name, seconds in self.current.items():
+            samples = self.sections.setdefault(name, [])
+            # Sections skipped in earlier frames count as 0
+            samples.extend([0.0] * (frame - len(samples)))
+            samples.append(seconds)
+        self.totals.append(self.clock() - self.frame_start)
+
+    def summary(self):
+        np = self.np
+
+        def stats(samples):
+            ms = np.asarray(samples) * 1000
+            if not len(ms):
+                return {}
+            p50, p95, p99 = np.percentile(ms, [50, 95, 99])
+            return {"p50_ms": p50, "p95_ms": p95, "p99_ms": p99, "mean_ms": ms.mean(), "max_ms": ms.max()}
+
+        frames = len(self.totals)
+        return {
+            "frames": frames,
+            "total": stats(self.totals),
+            "sections": {
+                name: stats(samples + [0.0] * (frames - len(samples)))
+                for name, samples in self.sections.items()
+            },
+            "geometry_calls": {"issued": self.geom_issued, "skipped": self.geom_skipped},
+            "bg_calls": {"issued": self.bg_issued, "skipped": self.bg_skipped},
+        }
+
+    def export(self, base_path, extra=None):
+        import json
+        import csv
+
+        summary = self.summary()
+        summary.update(extra or {})
+        with open(f"{base_path}.json", "w") as f:
+            json.dump(summary, f, indent=2, default=float)
+
+        names = list(self.sections)
+        with open(f"{base_path}.csv", "w", newline="") as f:
+            writer = csv.writer(f)
+            writer.writerow(["frame", "total_ms"] + [f"{name}_ms" for name in names])
+            for i, total in enumerate(self.totals):
+                row = [i, total * 1000]
+                for name in names:
+                    samples = self.sections[name]
+                    row.append(samples[i] * 1000 if i < len(samples) else 0.0)
+                writer.writerow(row)
+
+        return summary
+
+
+class ProfiledMethod:
+    """Decorator for a hot method with FrameProfiler hooks in it.
+
+    The hooks are the `prof = self.profiler` line and the `if prof:` blocks.
+    The method as written is kept as <name>_profiled, which
+    WindowDance.enable_profiler binds when PROFILE is on. <name> itself is
+    compiled again on first use with the hooks left out (same code and line
+    numbers otherwise), so when profiling is off the frame doesn't even check
+    for a profiler. Without the source (a frozen app) <name> is the method as
+    written.
+    """
+
+    def __init__(self, func):
+        self.func = func
+        self.name = func.__name__
+
+    def __set_name__(self, owner, name):
+        self.name = name
+        setattr(owner, f"{name}_profiled", self.func)
+
+    def __get__(self, obj, owner=None):
+        owner = owner if owner is not None else type(obj)
+        plain = self.without_hooks()
+        # Later lookups find the plain function, this descriptor is done
+        setattr(owner, self.name, plain)
+        return plain if obj is None else plain.__get__(obj, owner)
+
+    def without_hooks(self):
+        import ast
+        import inspect
+        import textwrap
+
+        try:
+            lines, first = inspect.getsourcelines(self.func)
+            filename = inspect.getsourcefile(self.func)
+        except (OSError, TypeError):
+            return self.func
+
+        def is_hook(test):
+            # `if prof:` and `if prof and ...:`
+            if isinstance(test, ast.BoolOp) and isinstance(test.op, ast.And):
+                test = test.values[0]
+            return isinstance(test, ast.Name) and test.id == "prof"
+
+        class StripHooks(ast.NodeTransformer):
+            def visit_Assign(self, node):
+                return None if any(isinstance(t, ast.Name) and t.id == "prof" for t in node.targets) else node
+
+            def visit_If(self, node):
+                if is_hook(node.test):
+                    return None
+                self.generic_visit(node)
+                node.body = node.body or [ast.Pass()]
+                return node
+
+        tree = ast.parse(textwrap.dedent("".join(lines)))
+        ast.increment_lineno(tree, first - 1)
+        func_def = tree.body[0]
+        func_def.decorator_list = []
+        tree = ast.fix_missing_locations(StripHooks().visit(tree))
+        if any(isinstance(node, ast.Name) and node.id == "prof" for node in ast.walk(tree)):
+            # A hook in a shape this doesn't know, keep the method as written
+            return self.func
+
+        namespace = {}
+        exec(compile(tree, filename, "exec"), self.func.__globals__, namespace)
+        plain = namespace[func_def.name]
+        plain.__qualname__ = self.func.__qualname__
+        return plain
+
+
+class FrameGovernor:
+    """Sheds window updates, least visible first, while frames run over budget.
+
+    record() is given each frame's work time (tick to commit) and the frames
+    the scheduler had to drop. The load is a moving average of the work time
+    over the frame budget: above high, or with frames dropped, one more level
+    is shed (at most every SHED_SECONDS), and after hold seconds below low one
+    is restored.
+
+    Levels, in the order they are shed:
+      1 small moves: a window only moves once it is min_move pixels or more
+        from where it was last put
+      2 colors: color changes are applied every other frame
+      3 pillars: pillars move every third frame
+
+    shed() filters a DanceFrame just before it is applied. Changes held back
+    are applied with a later frame rather than dropped, so once the windows
+    stop they end up where they should (or less than min_move off), and the
+    dance is never out of step with the music, only coarser. At level 0 a
+    frame goes through untouched.
+    """
+
+    LEVELS = ("full", "small moves", "colors", "pillars")
+    SMALL_MOVES, COLORS, PILLARS = 1, 2, 3
+    SHED_SECONDS = 0.25
+    # Moving average weight of the newest frame
+    LOAD_WEIGHT = 0.1
+
+    def __init__(self, clock, budget, n_windows, pillar_rows, high=0.8, low=0.5, hold=1.0, min_move=3):
+        self.clock = clock
+        self.budget = budget
+        self.n_windows = n_windows
+        self.pillar_rows = set(pillar_rows)
+        self.high = high
+        self.low = low
+        self.hold = hold
+        self.min_move = min_move
+
+        self.level = 0
+        self.load = 0.0
+        self.frame_count = 0
+        now = clock()
+        self.changed_at = now
+        self.recorded_at = now
+        self.calm_since = None
+
+        # Seconds and frames spent at each level, and how often it changed
+        self.level_seconds = [0.0] * len(self.LEVELS)
+        self.level_frames = [0] * len(self.LEVELS)
+        self.changes = 0
+        self.reset()
+
+    def reset(self):
+        """Forget held changes, for when the windows were put somewhere else (a rest or a seek)."""
+        # Newest position and color held back for each window, where each window was last put
+        self.held_positions = [None] * self.n_windows
+        self.held_colors = [None] * self.n_windows
+        self.applied = [None] * self.n_windows
+        self.holding = False
+
+    def record(self, seconds, missed=0):
+        now = self.clock()
+        self.level_seconds[self.level] += now - self.recorded_at
+        self.level_frames[self.level] += 1
+        self.recorded_at = now
+        self.load += (seconds / self.budget - self.load) * self.LOAD_WEIGHT
+
+        if self.load > self.high or missed:
+            self.calm_since = None
+            if self.level < len(self.LEVELS) - 1 and now - self.changed_at >= self.SHED_SECONDS:
+                self.set_level(self.level + 1, now)
+        elif self.load < self.low and self.level > 0:
+            if self.calm_since is None:
+                self.calm_since = now
+            elif now - self.calm_since >= self.hold:
+                self.set_level(self.level - 1, now)
+                self.calm_since = now
+        else:
+            self.calm_since = None
+
+    def set_level(self, level, now):
+        if self.level == 0:
+            # Nothing was tracked at full quality
+            self.applied = [None] * self.n_windows
+        self.level = level
+        self.changed_at = now
+        self.changes += 1
+
+    def shed(self, frame):
+        level = self.level
+        if level == 0 and not self.holding:
+            return frame
+        self.frame_count += 1
+        hold_colors = level >= self.COLORS and self.frame_count % 2
+        hold_pillars = level >= self.PILLARS and self.frame_count % 3
+        min_move = self.min_move if level >= self.SMALL_MOVES else 0
+        holding = False
+
+        positions = frame.positions
+        held = self.held_positions
+        applied = self.applied
+        for w in range(self.n_windows):
+            p = positions[w]
+            if p is None:
+                p = held[w]
+                if p is None:
+                    continue
+            a = applied[w]
+            if (hold_pillars and w in self.pillar_rows) or (
+                a is not None and abs(p[0] - a[0]) < min_move and abs(p[1] - a[1]) < min_move
+            ):
+                held[w] = p
+                positions[w] = None
+                holding = True
+            else:
+                positions[w] = p
+                held[w] = None
+                applied[w] = p
+
+        colors = frame.colors
+        held = self.held_colors
+        for w in range(self.n_windows):
+            c = colors[w]
+            if hold_colors:
+                if c is not None:
+                    held[w] = c
+                    colors[w] = None
+                    holding = True
+            elif c is None and held[w] is not None:
+                colors[w] = held[w]
+                held[w] = None
+            else:
+                held[w] = None
+
+        self.holding = holding
+        return frame
+
+    def summary(self):
+        total = sum(self.level_seconds) or 1.0
+        return {
+            "levels": {
+                name: {"seconds": seconds, "frames": frames, "share": seconds / total}
+                for name, seconds, frames in zip(self.LEVELS, self.level_seconds, self.level_frames)
+            },
+            "changes": self.changes,
+            "level": self.LEVELS[self.level],
+        }
+
+    def report(self):
+        parts = [
+            f"{name} {seconds:.1f} s"
+            for name, seconds in zip(self.LEVELS, self.level_seconds)
+            if seconds > 0
+        ]
+        return f"Governor: {', '.join(parts) or 'no frames'} ({self.changes} level changes)"
+
+
+class PlaybackClock:
+    """Smooth playback time from the mixer's coarse position reports.
+
+    Runs on perf_counter and only nudges its rate (by at most MAX_SLEW) towards
+    the reported position, so report jitter doesn't reach the dance and the
+    time never goes backwards. A report further than SNAP_SECONDS away (a new
+    song, a stall) moves the clock straight there. The returned time is
+    shifted back by the output latency and the user's offset, to line the
+    dance up with what is heard rather than with what was handed to the mixer.
+    """
+
+    MAX_SLEW = 0.05
+    SLEW_SECONDS = 0.5
+    SNAP_SECONDS = 0.25
+
+    def __init__(self, clock, latency=0.0, offset=0.0):
+        self.clock = clock
+        self.latency = latency
+        self.offset = offset
+        self.reset()
+
+    def reset(self, position=0.0):
+        self.jump(position)
+
+        # Running stats of (time step - wall step) for raw reports and the output
+        self.samples = 0
+        self.raw_sum = self.raw_sq = 0.0
+        self.out_sum = self.out_sq = 0.0
+        self.snaps = 0
+
+    def jump(self, position):
+        """Continue from position after a seek or a pause, keeping the jitter stats."""
+        self.position = position
+        self.rate = 1.0
+        self.last_now = self.clock()
+        self.last_out = None
+        self.last_reported = None
+
+    def update(self, reported):
+        """Playback time in seconds for a mixer report (seconds) taken just now."""
+        now = self.clock()
+        wall = now - self.last_now
+        self.last_now = now
+
+        predicted = self.position + wall * self.rate
+        error = reported - predicted
+        last_out = self.last_out
+
+        if abs(error) > self.SNAP_SECONDS:
+            self.position = reported
+            self.rate = 1.0
+            self.snaps += 1
+            last_out = None
+        else:
+            self.position = predicted
+            # Close the gap over about SLEW_SECONDS, never faster than MAX_SLEW
+            self.rate = 1.0 + max(-self.MAX_SLEW, min(self.MAX_SLEW, error / self.SLEW_SECONDS))
+
+        out = self.position if last_out is None else max(self.position, last_out)
+
+        if last_out is not None and self.last_reported is not None:
+            raw_err = (reported - self.last_reported) - wall
+            out_err = (out - last_out) - wall
+            self.samples += 1
+            self.raw_sum += raw_err
+            self.raw_sq += raw_err * raw_err
+            self.out_sum += out_err
+            self.out_sq += out_err * out_err
+
+        self.last_out = out
+        self.last_reported = reported
+        return out - self.latency - self.offset
+
+    def jitter(self):
+        """Standard deviation in ms of the per-frame time step against the wall clock."""
+        def std(total, sq):
+            n = self.samples
+            if n < 2:
+                return 0.0
+            mean = total / n
+            return max(0.0, sq / n - mean * mean) ** 0.5 * 1000
+
+        return {
+            "samples": self.samples,
+            "raw_jitter_ms": std(self.raw_sum, self.raw_sq),
+            "smoothed_jitter_ms": std(self.out_sum, self.out_sq),
+            "snaps": self.snaps,
+        }
+
+
+class AudioPlayer:
+    """Plays the songs, with the same interface as pygame.mixer.music.
+
+    A song whose analysis decoded it straight into a mixer Sound (see
+    WindowDance.decode_once) plays from that Sound on a channel of its own,
+    so the file is never decoded a second time. Any other song (analysis from
+    the cache, a long song streamed through the analysis, another sample
+    rate) streams from its file through pygame.mixer.music as before.
+
+    A channel can only play a Sound from its start, and Sound(buffer=...)
+    copies, so a seek would copy the rest of the song on the Tk thread. A
+    seek hands the song over to mixer.music instead, which streams it from
+    its file from the new position, until the next load().
+
+    A channel has no position, so get_pos() counts perf_counter time since
+    play() instead, less the time spent paused, and knows when a queued Sound
+    takes over from its length. Like mixer.music, play(start=...) starts that
+    count over, and get_busy() is False while paused.
+    """
+
+    def __init__(self, pygame, clock):
+        self.pygame = pygame
+        self.music = pygame.mixer.music
+        self.clock = clock
+        self.volume = 1.0
+        self.channel = None
+
+        # The song loaded: its file, and its Sound (None when streaming from the file)
+        self.file = None
+        self.sound = None
+        # True while mixer.music plays: a song without a Sound, or one that was seeked
+        self.streaming = True
+        # When the Sound started on the channel, and the song (file, Sound) queued after it
+        self.playing = None
+        self.started = None
+        self.paused_at = None
+        self.queued = None
+
+    def set_volume(self, volume):
+        self.volume = volume
+        self.music.set_volume(volume)
+        if self.channel is not None:
+            self.channel.set_volume(volume)
+
+    def load(self, file, sound=None):
+        self.stop()
+        self.file = file
+        self.sound = sound
+        self.streaming = sound is None
+        if sound is None:
+            self.music.load(file)
+            return
+        if self.channel is None:
+            # Kept out of the way of any other Sound
+            self.pygame.mixer.set_reserved(1)
+            self.channel = self.pygame.mixer.Channel(0)
+            self.channel.set_volume(self.volume)
+
+    def stop(self):
+        if self.streaming:
+            self.music.stop()
+        elif self.channel is not None:
+            self.channel.stop()
+        self.playing = None
+        self.started = None
+        self.paused_at = None
+        self.queued = None
+
+    def play(self, start=0.0):
+        if start > 0 and not self.streaming:
+            self.channel.stop()
+            self.music.load(self.file)
+            self.streaming = True
+            if self.queued is not None:
+                self.music.queue(self.queued[0])
+        if self.streaming:
+            self.music.play(start=start)
+            return
+
+        self.playing = self.sound
+        self.channel.play(self.sound)
+        if self.queued is not None:
+            self.channel.queue(self.queued[1])
+        self.started = self.clock()
+        self.paused_at = None
+
+    def queue(self, file, sound=None):
+        """Play this song right after the current one. False if it can't follow without a gap."""
+        if self.streaming:
+            # The next one streams too, even if it was decoded
+            self.music.queue(file)
+            self.queued = file, sound
+            return True
+        if sound is None or self.playing is None:
+            return False
+        self.channel.queue(sound)
+        self.queued = file, sound
+        return True
+
+    def get_pos(self):
+        if self.streaming:
+            return self.music.get_pos()
+        if self.started is None:
+            return -1
+
+        now = self.paused_at if self.paused_at is not None else self.clock()
+        elapsed = now - self.started
+        length = self.playing.get_length()
+        if self.queued is not None and elapsed >= length:
+            # The queued song took over
+            self.started += length
+            elapsed -= length
+            self.file, self.sound = self.queued
+            self.playing = self.sound
+            self.queued = None
+        return int(elapsed * 1000)
+
+    def get_busy(self):
+        if self.streaming:
+            return self.music.get_busy()
+        return self.paused_at is None and self.channel.get_busy()
+
+    def pause(self):
+        if self.streaming:
+            self.music.pause()
+        elif self.paused_at is None:
+            self.channel.pause()
+            self.paused_at = self.clock()
+
+    def unpause(self):
+        if self.streaming:
+            self.music.unpause()
+        elif self.paused_at is not None:
+            self.channel.unpause()
+            self.started += self.clock() - self.paused_at
+            self.paused_at = None
+
+
+class LiveInput:
+    """PCM blocks from a capture device, a named pipe or a file, as float32 mono.
+
+    The source is read on its own thread (SDL's audio thread for a device) and
+    each block is queued with the perf_counter time it arrived, for the frame
+    loop to drain with read(). A file is paced to real time so it stands in for
+    a device, a pipe is read as fast as its writer sends raw s16le PCM.
+    """
+
+    def __init__(self, wd, source):
+        from collections import deque
+
+        self.wd = wd
+        self.np = wd.np
+        self.time = wd.time
+        self.source = source
+        self.blocks = deque()
+        self.finished = False
+        self.device = None
+        self.block = wd.LIVE_BLOCK
+
+        if not source:
+            self.kind = "device"
+        elif self.is_pipe(source):
+            self.kind = "pipe"
+        elif wd.os.path.isfile(source):
+            self.kind = "file"
+        else:
+            # Anything else names a capture device
+            self.kind = "device"
+
+        self.rate = wd.soundfile.info(source).samplerate if self.kind == "file" else wd.LIVE_RATE
+
+    def is_pipe(self, path):
+        import stat
+
+        try:
+            return stat.S_ISFIFO(self.wd.os.stat(path).st_mode)
+        except OSError:
+            return False
+
+    def describe(self):
+        if self.kind == "device":
+            return f"capture device {self.source or '(default)'} at {self.rate} Hz"
+        return f"{self.kind} {self.source} at {self.rate} Hz"
+
+    def start(self):
+        if self.kind == "device":
+            self.open_device()
+            return
+        target = self.read_pipe if self.kind == "pipe" else self.read_file
+        self.wd.threading.Thread(target=target, daemon=True).start()
+
+    def stop(self):
+        if self.device is not None:
+            self.device.close()
+            self.device = None
+        self.finished = True
+
+    def push(self, samples):
+        # deque appends are atomic, the frame loop pops from the other end
+        self.blocks.append((self.time.perf_counter(), samples))
+
+    def read(self):
+        """Every block that arrived since the last call, oldest first."""
+        blocks = []
+        while self.blocks:
+            blocks.append(self.blocks.popleft())
+        return blocks
+
+    @property
+    def ended(self):
+        return self.finished and not self.blocks
+
+    def open_device(self):
+        from pygame._sdl2 import audio
+
+        np = self.np
+
+        def callback(device, data):
+            self.push(np.frombuffer(data, dtype=np.float32).copy())
+
+        # allowed_changes=0: SDL converts whatever the device does to mono float32 at LIVE_RATE
+        self.device = audio.AudioDevice(
+            devicename=self.source or None,
+            iscapture=True,
+            frequency=self.rate,
+            audioformat=audio.AUDIO_F32,
+            numchannels=1,
+            chunksize=self.block,
+            allowed_changes=0,
+            callback=callback,
+        )
+        self.device.pause(0)
+
+    def read_pipe(self):
+        np = self.np
+        n_bytes = self.block * 2
+        try:
+            with open(self.source, "rb", buffering=0) as pipe:
+                pending = b""
+                while not self.finished:
+                    data = pipe.read(n_bytes - len(pending))
+                    if not data:
+                        break
+                    pending += data
+                    if len(pending) < n_bytes:
+                        continue
+                    self.push(np.frombuffer(pending, dtype="<i2").astype(np.float32) / 32768)
+                    pending = b""
+        finally:
+            self.finished = True
+
+    def read_file(self):
+        sleep = self.time.sleep
+        clock = self.time.perf_counter
+        start = clock()
+        sent = 0
+        try:
+            for block in self.wd.soundfile.blocks(self.source, blocksize=self.block, dtype="float32", always_2d=True):
+                if self.finished:
+                    break
+                sent += len(block)
+                # A device hands a block over once its last sample is in
+                delay = start + sent / self.rate - clock()
+                if delay > 0:
+                    sleep(delay)
+                self.push(block.mean(axis=1))
+        finally:
+            self.finished = True
+
+
+class LiveAnalyzer:
+    """Bass, RMS, gate and tempo from live PCM, a hop at a time.
+
+    The same measures as the song analysis: mean STFT magnitude under
+    BASS_CUTOFF_HZ, frame RMS, and a gate against the rolling median of the
+    last half second of RMS. Frames are analyzed at the input rate with the FFT
+    size scaled to keep the bin spacing, and each one ends at its newest sample
+    instead of being centered, so nothing waits for future audio. The bass is
+    normalized against a slowly decaying peak instead of the song's maximum.
+    Every hop costs one FFT, the tempo is re-estimated once a second from
+    LIVE_TEMPO_SECONDS of onset strength, and audio more than MAX_FRAME_DT
+    behind is dropped rather than worked through.
+    """
+
+    def __init__(self, np, config, rate):
+        self.np = np
+        self.rate = rate
+        scale = rate / config.ANALYSIS_SR
+        self.hop = max(1, round(config.LIVE_HOP * scale))
+        self.n_fft = round(config.N_FFT * scale)
+        self.frame_rate = rate / self.hop
+
+        n = np.arange(self.n_fft)
+        self.window = (0.5 - 0.5 * np.cos(2 * np.pi * n / self.n_fft)).astype(np.float32)
+        self.bass_bins = np.fft.rfftfreq(self.n_fft, 1 / rate) < config.BASS_CUTOFF_HZ
+
+        self.GATE_MULTIPLIER = config.GATE_MULTIPLIER
+        self.MIN_GATE_DROP = config.MIN_GATE_DROP
+        # The song analysis takes the median of 21 hops
+        self.median_len = max(1, round(21 * config.HOP_LENGTH / config.ANALYSIS_SR * self.frame_rate))
+        self.peak_decay = 0.5 ** (1 / (config.LIVE_PEAK_SECONDS * self.frame_rate))
+        self.max_backlog = int(config.MAX_FRAME_DT * rate)
+
+        # The first frame only needs one hop, the rest of its window is silence.
+        # base is the stream index of samples[0], received how many came in.
+        self.samples = np.zeros(self.n_fft - self.hop, dtype=np.float32)
+        self.base = self.hop - self.n_fft
+        self.received = 0
+        self.rms_recent = []
+        self.peak = 0.0
+        self.prev_spectrum = None
+        self.dropped = 0
+
+        self.tempo = config.LIVE_TEMPO
+        self.onsets = np.zeros(int(config.LIVE_TEMPO_SECONDS * self.frame_rate))
+        self.onset_count = 0
+        self.tempo_every = max(1, round(self.frame_rate))
+        self.tempo_guess = None
+
+    def process(self, blocks):
+        """Analyze the blocks from LiveInput.read().
+
+        Returns (arrival, bass_energy, is_gated) for the hops they completed,
+        arrival being when the newest of those samples came in, or None.
+        """
+        if not blocks:
+            return None
+        np = self.np
+
+        ends = []
+        for when, block in blocks:
+            self.received += len(block)
+            ends.append((self.received, when))
+
+        samples = np.concatenate([self.samples] + [block for _, block in blocks])
+        backlog = len(samples) - self.n_fft
+        if backlog > self.max_backlog:
+            drop = (backlog - self.max_backlog) // self.hop * self.hop
+            samples = samples[drop:]
+            self.base += drop
+            self.dropped += drop
+
+        count = (len(samples) - self.n_fft) // self.hop + 1
+        if count <= 0:
+            self.samples = samples
+            return None
+
+        frames = np.lib.stride_tricks.sliding_window_view(samples, self.n_fft)[::self.hop][:count]
+        self.samples = samples[count * self.hop:]
+        # Earlier blocks couldn't complete it, so one of these did
+        newest_end = self.base + (count - 1) * self.hop + self.n_fft
+        arrival = next(when for end, when in ends if end >= newest_end)
+        self.base += count * self.hop
+
+        spectrum = np.abs(np.fft.rfft(frames * self.window, axis=1))
+        bass = spectrum[:, self.bass_bins].mean(axis=1)
+        rms = np.sqrt(np.mean(frames.astype(np.float64) ** 2, axis=1))
+
+        # Half-wave rectified change in log magnitude, for the tempo
+        log_spec = np.log1p(spectrum)
+        prev = self.prev_spectrum if self.prev_spectrum is not None else log_spec[0]
+        flux = np.maximum(np.diff(log_spec, axis=0, prepend=prev[None, :]), 0).sum(axis=1)
+        self.prev_spectrum = log_spec[-1]
+
+        bass_energy = np.empty(count)
+        noise_floor = np.empty(count)
+        recent = self.rms_recent
+        for i in range(count):
+            self.peak = max(float(bass[i]), self.peak * self.peak_decay)
+            bass_energy[i] = bass[i] / self.peak if self.peak > 0 else 0.0
+            recent.append(float(rms[i]))
+            if len(recent) > self.median_len:
+                del recent[0]
+            noise_floor[i] = np.median(recent)
+
+        adaptive_gate = noise_floor * self.GATE_MULTIPLIER
+        is_gated = (rms < adaptive_gate) & ((noise_floor - rms) > self.MIN_GATE_DROP)
+
+        self.add_onsets(flux)
+        return arrival, bass_energy, is_gated
+
+    def add_onsets(self, flux):
+        size = len(self.onsets)
+        for value in flux.tolist():
+            self.onsets[self.onset_count % size] = value
+            self.onset_count += 1
+            if self.onset_count % self.tempo_every == 0 and self.onset_count >= size // 2:
+                self.update_tempo()
+
+    def update_tempo(self):
+        estimate = self.estimate_tempo()
+        if estimate is None:
+            return
+        # Only follow an estimate that the previous one agrees with
+        if self.tempo_guess and abs(estimate / self.tempo_guess - 1) < 0.04:
+            self.tempo = round((estimate + self.tempo_guess) / 2)
+        self.tempo_guess = estimate
+
+    def estimate_tempo(self):
+        """Autocorrelation tempo of the onset history, weighted towards 120 BPM like librosa."""
+        np = self.np
+        size = len(self.onsets)
+        n = min(self.onset_count, size)
+        start = self.onset_count % size if self.onset_count >= size else 0
+        env = np.roll(self.onsets, -start)[:n]
+        env = env - env.mean()
+
+        n_fft = 1 << (2 * n - 1).bit_length()
+        spec = np.fft.rfft(env, n_fft)
+        ac = np.fft.irfft(spec * spec.conj(), n_fft)[:n]
+        if ac[0] <= 0:
+            return None
+
+        lags = np.arange(1, n)
+        bpm = 60 * self.frame_rate / lags
+        score = ac[1:] * np.exp(-0.5 * np.log2(bpm / 120) ** 2)
+        score[(bpm < 60) | (bpm > 200)] = -np.inf
+        best = int(np.argmax(score))
+        if not np.isfinite(score[best]) or score[best] <= 0:
+            return None
+
+        # Parabolic interpolation between lags
+        lag = best + 1
+        if 1 < lag < n - 1:
+            a, b, c = ac[lag - 1], ac[lag], ac[lag + 1]
+            denom = a - 2 * b + c
+            if denom < 0:
+                lag += 0.5 * (a - c) / denom
+        return 60 * self.frame_rate / lag
+
+
+class DanceFrame:
+    """What changed in one engine step.
+
+    positions and colors have one slot per window (DanceEngine.WINDOWS order),
+    None meaning "leave it as it is". flashes holds ("flash", dancer, color) and
+    ("flash_end", dancer, None) events for dancers showing album art.
+    """
+
+    __slots__ = ("positions", "colors", "flashes")
+
+    def __init__(self, n_windows):
+        self.positions = [None] * n_windows
+        self.colors = [None] * n_windows
+        self.flashes = []
+
+
+class DanceEngine:
+    """The choreography, without any windows or audio device.
+
+    Built from the screen size and a seed, given a song with load_tracks(), then
+    driven with step(t, dt): the playback time and the seconds since the
+    previous step. The same inputs always give the same frames, so it can be
+    benchmarked and replayed headless. WindowDance is the Tk/pygame adapter
+    around it.
+
+    A song's jumps, speed boosts, orbit pulls and teleports are compiled into
+    a timeline of events on its beat grid (compile_events), and step() only
+    moves a pointer past the ones that are due. For live input, load_live()
+    replaces the song's tracks with a ring that feed_live() fills as the audio
+    comes in, and step() fires events from the hops fed since the last step.
+
+    The windows are the main window, DANCERS dancers and PILLARS pillars (see
+    WINDOWS), and every per-window quantity is a NumPy array with one row per
+    dancer, pillar or window, so a step costs about the same for 2 dancers as
+    for 32.
+    """
+
+    ROOT = 0
+    # Pillar sides, in the order they are handed out
+    LEFT, RIGHT, BOTTOM, TOP = range(4)
+    # Event kinds, in the order events at the same time fire
+    PULL, BOOST, JUMP, TELEPORT = range(4)
+
+    def __init__(self, config, screen_size, seed=None):
         import math
         import random
+        import copy
+        import bisect
+
+        self.math = math
+        self.copy = copy
+        self.bisect = bisect
+        self.random = random.Random(seed)
+
+        self.W_WIDTH, self.W_HEIGHT = config.W_WIDTH, config.W_HEIGHT
+        self.SQUARE_SIZE = config.SQUARE_SIZE
+        self.ORBIT_RADIUS = config.ORBIT_RADIUS
+        self.PILLAR_WIDTH = config.PILLAR_WIDTH
+        self.DANCERS = config.DANCERS
+        self.PILLARS = config.PILLARS
+        self.ORBIT_RINGS = config.ORBIT_RINGS
+        self.ORBIT_RING_STEP = config.ORBIT_RING_STEP
+        self.GATE_MULTIPLIER = config.GATE_MULTIPLIER
+        self.BASS_RADIUS_PULL = config.BASS_RADIUS_PULL
+        self.MIN_GATE_DROP = config.MIN_GATE_DROP
+        self.BASS_SPEED_BOOST = config.BASS_SPEED_BOOST
+        self.BASS_SPEED_THRESHOLD = config.BASS_SPEED_THRESHOLD
+        self.JUMP_DAMPING = config.JUMP_DAMPING
+        self.JUMP_GRAVITY = config.JUMP_GRAVITY
+        self.JUMP_BASS_THRESHOLD = config.JUMP_BASS_THRESHOLD
+        self.JUMP_REARM_VELOCITY = config.JUMP_REARM_VELOCITY
+        self.WINDOW_JUMP = config.WINDOW_JUMP
+        self.BG_FADE_SPEED = config.BG_FADE_SPEED
+        self.BG_DANCERS_FADE_SPEED = config.BG_DANCERS_FADE_SPEED
+        self.PHYSICS_HZ = config.PHYSICS_HZ
+        self.TRACK_RATE = config.ANALYSIS_SR / config.HOP_LENGTH
+        self.TELEPORT_COOLDOWN = config.TELEPORT_COOLDOWN
+        self.CHECKPOINT_SECONDS = config.CHECKPOINT_SECONDS
+        self.MAX_REPLAY_SECONDS = config.MAX_REPLAY_SECONDS
+        self.MAX_FRAME_DT = config.MAX_FRAME_DT
+        self.BEAT_GRID_DIVISION = config.BEAT_GRID_DIVISION
+        self.TELEPORT_EASE_SECONDS = 1 / 15
+        # The old max(3, UPDATE_HZ // 17) frames at the target rate, 3 frames (50 ms) at 60 Hz
+        self.FLASH_SECONDS = max(3, config.UPDATE_HZ // 17) / config.UPDATE_HZ
+
+        if self.DANCERS < 0 or self.PILLARS < 0 or self.ORBIT_RINGS < 1:
+            raise ValueError(f"Need DANCERS >= 0, PILLARS >= 0 and ORBIT_RINGS >= 1, got {self.DANCERS}, {self.PILLARS} and {self.ORBIT_RINGS}")
+        self.setup_layout(*screen_size)
+
+        # Dancers showing album art flash a rectangle instead of fading their bg
+        self.has_image = [False] * self.DANCERS
+        self.profiler = None
+        self.frame = DanceFrame(len(self.WINDOWS))
+        self.no_change = [None] * len(self.WINDOWS)
+        self.live = False
+
+    def load_tracks(self, bass_energy, rms, tempo, keep_state=False, beat_times=None):
+        """Switch to a song's tracks. With keep_state the dance carries on from where it is.
+
+        beat_times are the beats from the analysis, without them the events
+        snap to an even grid at the tempo.
+        """
+        # NumPy waits until there is a song, the layout alone is enough to open the windows
         import numpy as np
-        from PIL import Image, ImageTk
+
+        self.np = np
+        self.live = False
+        self.set_tempo(tempo)
+
+        self.setup_arrays()
+        self.precompile_tracks(bass_energy, rms)
+        self.compile_events(beat_times)
+        self.clear_checkpoints()
+        if not keep_state:
+            self.reset()
+        # The new song starts at t = 0 either way
+        self.event_index = 0
+
+    def load_live(self, tempo, history):
+        """Dance to live input: history analysis hops of controls, filled by feed_live()."""
+        import numpy as np
+
+        self.np = np
+        self.live = True
+        self.set_tempo(tempo)
+
+        self.setup_arrays()
+        self.track_len = history
+        self.track_bass = np.zeros(history)
+        self.track_is_gated = np.zeros(history, dtype=bool)
+        self.track_radius_pull, self.track_boost, self.track_jump, self.track_teleport = self.controls(
+            self.track_bass, self.track_is_gated
+        )
+        self.live_index = 0
+        self.live_rows = []
+        self.event_times, self.events = [], []
+        self.clear_checkpoints()
+        self.reset()
+
+    def feed_live(self, bass_energy, is_gated):
+        # Next slots of the ring, step() fires the events of every hop fed since the last one
+        rows = (self.live_index + 1 + self.np.arange(len(bass_energy))) % self.track_len
+        self.track_bass[rows] = bass_energy
+        self.track_is_gated[rows] = is_gated
+        controls = self.controls(self.track_bass[rows], self.track_is_gated[rows])
+        for track, values in zip((self.track_radius_pull, self.track_boost, self.track_jump, self.track_teleport), controls):
+            track[rows] = values
+        self.live_index = int(rows[-1])
+        self.live_rows.extend(rows.tolist())
+
+    def set_tempo(self, tempo, t=None):
+        """Switch tempo. Given the playback time t, the swing carries on from the same phase."""
+        if t is None:
+            # Swing phase measured from t = 0
+            self.tempo_shift = 0.0
+        else:
+            self.tempo_shift = t - (t - self.tempo_shift) * self.tempo / tempo
+        self.tempo = tempo
+        self.HALF_BEAT_SECONDS = (60 / tempo) / 2
+        self.TELEPORT_COOLDOWN_SECONDS = (60 / tempo) / self.TELEPORT_COOLDOWN
+
+    @property
+    def duration(self):
+        return self.track_len / self.TRACK_RATE
+
+    @property
+    def has_image(self):
+        return self._has_image
+
+    @has_image.setter
+    def has_image(self, value):
+        self._has_image = list(value)
+        # Masks and fade rates follow it, rebuilt on the next step
+        self.image_mask = None
+
+    def update_image_mask(self):
+        np = self.np
+        image = self.image_mask = np.array(self._has_image, dtype=bool)
+        self.image_dancers = np.flatnonzero(image).tolist()
+        self.plain_rows = np.flatnonzero(~image) + self.DANCER1
+        self.image_rows = [self.DANCER1 + dancer for dancer in self.image_dancers]
+
+        # Fade kept per PHYSICS_HZ frame, 1 (no fade) for dancers showing album art
+        self.fade_keep = 1 - self.fade_speed
+        self.fade_keep[self.image_rows] = 1
+        self.fade_n = None
+
+    # -------------------------------------------------
+    # Layout
+
+    def setup_layout(self, sw, sh):
+        math = self.math
+        self.screen_width, self.screen_height = sw, sh
+        self.BASE_X = sw//2 - self.W_WIDTH//2
+        self.BASE_Y = sh//2 - self.W_HEIGHT//2
+
+        n_dancers, n_pillars = self.DANCERS, self.PILLARS
+        self.WINDOWS = (
+            ("root",)
+            + tuple(f"dancer{i + 1}" for i in range(n_dancers))
+            + tuple(f"pillar{i + 1}" for i in range(n_pillars))
+        )
+        # First row of each kind, the dancers and pillars follow on from it
+        self.DANCER1 = 1
+        self.PILLAR1 = 1 + n_dancers
+
+        # Dancers rest in a row between where the first two always stood
+        left, right = self.BASE_X / 1.55, self.BASE_X * 1.8
+        self.dancer_rest = [
+            [int(left + (right - left) * i / max(1, n_dancers - 1)), int(self.BASE_Y * 1.15)]
+            for i in range(n_dancers)
+        ]
+
+        # Dancer i is on ring i % ORBIT_RINGS, spread evenly around it.
+        # Inner rings are smaller, turned half a gap and spin the other way.
+        self.dancer_orbits = []
+        for i in range(n_dancers):
+            ring = i % self.ORBIT_RINGS
+            on_ring = len(range(ring, n_dancers, self.ORBIT_RINGS))
+            phase = 2 * math.pi * (i // self.ORBIT_RINGS + ring / 2) / on_ring
+            direction = -1 if ring % 2 else 1
+            scale = max(0.0, 1 - ring * self.ORBIT_RING_STEP)
+            # Rounded so the first ring's dancers sit exactly opposite each other
+            self.dancer_orbits.append((round(math.cos(phase), 12), round(math.sin(phase), 12), direction, scale))
+
+        # Pillars go round the sides: left, right, bottom, top, then the next layer
+        # of each, one orbit phase further on
+        layers = -(-n_pillars // 4)
+        bases = {
+            self.LEFT: [0, 0],
+            self.RIGHT: [int(sw - self.PILLAR_WIDTH), 0],
+            self.BOTTOM: [0, int(sh - self.PILLAR_WIDTH)],
+            self.TOP: [0, 0],
+        }
+        self.pillar_sides = [i % 4 for i in range(n_pillars)]
+        self.pillar_pos = [list(bases[side]) for side in self.pillar_sides]
+        self.pillar_phases = []
+        for i in range(n_pillars):
+            phase = 2 * math.pi * (i // 4) / layers
+            self.pillar_phases.append((round(math.cos(phase), 12), round(math.sin(phase), 12)))
+
+    def rest_positions(self):
+        return (
+            [(self.BASE_X, self.BASE_Y)]
+            + [tuple(pos) for pos in self.dancer_rest]
+            + [tuple(pos) for pos in self.pillar_pos]
+        )
+
+    def window_sizes(self):
+        """Width and height of every window, in WINDOWS order."""
+        sw, sh, pw = self.screen_width, self.screen_height, self.PILLAR_WIDTH
+        return (
+            [(self.W_WIDTH, self.W_HEIGHT)]
+            + [(self.SQUARE_SIZE, self.SQUARE_SIZE)] * self.DANCERS
+            + [(pw, sh) if side in (self.LEFT, self.RIGHT) else (sw, pw) for side in self.pillar_sides]
+        )
+
+    def setup_arrays(self):
+        """The layout as arrays, once NumPy is loaded.
+
+        Every orbit-driven number of a step is one entry of
+        (cos a * orbit_cos + sin a * orbit_sin) * (radius * orbit_radius + swing_y * orbit_swing):
+        the x and y offset of each dancer, then how far each left/right pillar
+        closes in, then how far each bottom/top pillar bobs.
+        """
+        np = self.np
+        n_dancers = self.DANCERS
+        orbits = np.array(self.dancer_orbits, dtype=float).reshape(-1, 4)
+        # Angle direction * a + phase, unrolled: cos = cos a * cp - sin a * d * sp,
+        # sin = cos a * sp + sin a * d * cp
+        cos_phase, sin_phase, direction, scale = orbits.T
+
+        # Left/right pillars close in with the orbit, bottom/top ones bob with the swing.
+        # Left and top move with the orbit, right and bottom against it.
+        sides = self.pillar_sides
+        base = np.array(self.pillar_pos, dtype=float).reshape(-1, 2)
+        phases = np.array(self.pillar_phases, dtype=float).reshape(-1, 2)
+        vertical = [i for i, side in enumerate(sides) if side in (self.LEFT, self.RIGHT)]
+        horizontal = [i for i, side in enumerate(sides) if side in (self.BOTTOM, self.TOP)]
+        sign = np.array([1.0 if side in (self.LEFT, self.TOP) else -1.0 for side in sides])
+        n_vertical = len(vertical)
+
+        self.orbit_cos = np.concatenate([
+            np.stack([cos_phase, sin_phase], axis=1).ravel(),
+            phases[vertical, 0], phases[horizontal, 0],
+        ])
+        self.orbit_sin = np.concatenate([
+            np.stack([-direction * sin_phase, direction * cos_phase], axis=1).ravel(),
+            -phases[vertical, 1], -phases[horizontal, 1],
+        ])
+        self.orbit_radius = np.concatenate([np.repeat(scale, 2), np.ones(n_vertical), np.zeros(len(horizontal))])
+        self.orbit_swing = np.concatenate([np.zeros(2 * n_dancers + n_vertical), np.ones(len(horizontal))])
+        self.orbit_dancers = slice(0, 2 * n_dancers)
+        self.orbit_vertical = slice(2 * n_dancers, 2 * n_dancers + n_vertical)
+        self.orbit_horizontal = slice(2 * n_dancers + n_vertical, None)
+
+        self.pillar_v_rows = [self.PILLAR1 + i for i in vertical]
+        self.pillar_v_x = base[vertical, 0]
+        self.pillar_v_y = base[vertical, 1].tolist()
+        self.pillar_v_sign = sign[vertical]
+
+        self.pillar_h_rows = [self.PILLAR1 + i for i in horizontal]
+        self.pillar_h_x = base[horizontal, 0].tolist()
+        self.pillar_h_y = base[horizontal, 1]
+        self.pillar_h_sign = sign[horizontal]
+
+        self.max_teleport = (self.screen_width - self.SQUARE_SIZE, self.screen_height - self.SQUARE_SIZE)
+
+    # -------------------------------------------------
+    # Control tracks
+
+    def precompile_tracks(self, bass_energy, rms):
+        """Everything the dance derives from the audio alone, one entry per analysis frame.
+
+        compile_events() turns the triggers into the event timeline, so no
+        frame has to scan rms_times, take a median or check a threshold.
+        """
+        np = self.np
+        rms = np.asarray(rms, dtype=float)
+        n = len(rms)
+
+        self.track_len = n
+
+        # Rolling median over the current frame and the 20 before it
+        noise_floor = np.empty(n)
+        head = min(n, 20)
+        for i in range(head):
+            noise_floor[i] = np.median(rms[:i + 1])
+        if n > 20:
+            noise_floor[20:] = np.median(np.lib.stride_tricks.sliding_window_view(rms, 21), axis=1)
+
+        adaptive_gate = noise_floor * self.GATE_MULTIPLIER
+        is_gated = (rms < adaptive_gate) & ((noise_floor - rms) > self.MIN_GATE_DROP)
+
+        bass = np.asarray(bass_energy, dtype=float)
+        bass_strength = bass[np.minimum(np.arange(n), len(bass) - 1)]
+
+        self.track_noise_floor = noise_floor
+        self.track_adaptive_gate = adaptive_gate
+        self.track_is_gated = is_gated
+        self.track_bass = bass_strength
+        self.track_radius_pull, self.track_boost, self.track_jump, self.track_teleport = self.controls(bass_strength, is_gated)
+
+    def controls(self, bass_strength, is_gated):
+        """Orbit pull, speed boost, jump and teleport triggers, for a whole song or live hops."""
+        return (
+            bass_strength > 0.65,
+            bass_strength > self.BASS_SPEED_THRESHOLD,
+            bass_strength > self.JUMP_BASS_THRESHOLD,
+            is_gated & (bass_strength < 0.2),
+        )
+
+    # -------------------------------------------------
+    # Event timeline
+
+    def beat_grid(self, beat_times):
+        """BEAT_GRID_DIVISION points per beat across the song, sorted.
+
+        The detected beats are carried on before the first and after the last
+        one at their median spacing. Without (enough) beats the grid is even at
+        the tempo, starting at t = 0.
+        """
+        np = self.np
+        duration = self.duration
+        beats = np.asarray(beat_times if beat_times is not None else (), dtype=float)
+        if len(beats) < 2:
+            period = 60 / self.tempo
+            beats = np.arange(0, duration + 2 * period, period)
+        else:
+            period = float(np.median(np.diff(beats)))
+            before = beats[0] - period * np.arange(np.ceil(beats[0] / period), 0, -1)
+            after = beats[-1] + period * np.arange(1, np.ceil((duration - beats[-1]) / period) + 2)
+            beats = np.concatenate([before, beats, after])
+
+        # Evenly between each pair of beats
+        steps = np.arange(self.BEAT_GRID_DIVISION) / self.BEAT_GRID_DIVISION
+        grid = (beats[:-1, None] + np.diff(beats)[:, None] * steps).ravel()
+        return grid[(grid >= 0) & (grid < duration)]
+
+    def compile_events(self, beat_times):
+        """Every event of the song as sorted (time, (kind, value)) lists for step() to walk through.
+
+        A grid point gets an event when a track frame closer to it than to the
+        next and previous point triggers one, so a kick lands on its beat. The
+        jump rearm and the teleport cooldown only depend on time, so they are
+        applied here too: a jump needs the previous one to have come back down
+        to JUMP_REARM_VELOCITY, a teleport waits for the previous ease and cooldown.
+        """
+        np = self.np
+        grid = self.beat_grid(beat_times)
+        n = self.track_len
+
+        # Track frames of each grid point's cell, cells split halfway between points
+        edges = np.concatenate([[0.0], (grid[1:] + grid[:-1]) / 2, [self.duration]])
+        bounds = np.minimum(np.ceil(edges * self.TRACK_RATE).astype(np.intp), n)
+        starts, stops = bounds[:-1], bounds[1:]
+
+        def any_in_cell(track):
+            counts = np.concatenate([[0], np.cumsum(track)])
+            return counts[stops] > counts[starts]
+
+        pulls, boosts, jumps, teleports = (
+            any_in_cell(track)
+            for track in (self.track_radius_pull, self.track_boost, self.track_jump, self.track_teleport)
+        )
+        # Strongest bass in the cell, for how far the orbit is pulled in
+        peaks = np.maximum.reduceat(self.track_bass, np.minimum(starts, n - 1)) if n else np.zeros(len(grid))
+
+        # v = rest + (WINDOW_JUMP - rest) * d ** frames, solved for v = -JUMP_REARM_VELOCITY
+        rest = self.JUMP_GRAVITY * self.JUMP_DAMPING / (1 - self.JUMP_DAMPING)
+        if self.WINDOW_JUMP < -self.JUMP_REARM_VELOCITY:
+            frames = self.math.log((self.JUMP_REARM_VELOCITY + rest) / (rest - self.WINDOW_JUMP)) / self.math.log(self.JUMP_DAMPING)
+            rearm = frames / self.PHYSICS_HZ
+        else:
+            rearm = 0.0
+        teleport_spacing = self.TELEPORT_EASE_SECONDS + self.TELEPORT_COOLDOWN_SECONDS
+
+        times, events = [], []
+        jump_ready = teleport_ready = -self.math.inf
+        for t, pull, boost, jump, teleport, peak in zip(
+            grid.tolist(), pulls.tolist(), boosts.tolist(), jumps.tolist(), teleports.tolist(), peaks.tolist()
+        ):
+            if pull:
+                times.append(t)
+                events.append((self.PULL, peak))
+            if boost:
+                times.append(t)
+                events.append((self.BOOST, None))
+            if jump and t >= jump_ready:
+                times.append(t)
+                events.append((self.JUMP, None))
+                jump_ready = t + rearm
+            if teleport and t >= teleport_ready:
+                times.append(t)
+                events.append((self.TELEPORT, None))
+                teleport_ready = t + teleport_spacing
+
+        self.event_times = times
+        self.events = events
+
+    def dispatch_events(self, t, n):
+        """Fire the events due by time t, each set up as if it happened right on time."""
+        times = self.event_times
+        events = self.events
+        i = self.event_index
+        # Events a jump in time skipped over (a seek without replay) are dropped, not fired at once
+        oldest = t - self.MAX_FRAME_DT
+        while i < len(times) and times[i] <= t:
+            if times[i] >= oldest:
+                kind, value = events[i]
+                self.fire(kind, value, t - times[i], n)
+            i += 1
+        self.event_index = i
+
+    def dispatch_live(self, n):
+        """Fire the events of the hops fed since the last step, as soon as they come in."""
+        rows = self.live_rows
+        if not rows:
+            return
+        self.live_rows = []
+
+        # No timeline to work the rearm and cooldown out ahead, so they are checked here
+        if self.track_radius_pull[rows].any():
+            self.fire(self.PULL, float(self.track_bass[rows].max()), 0.0, n)
+        if self.track_boost[rows].any():
+            self.fire(self.BOOST, None, 0.0, n)
+        if self.track_jump[rows].any() and self.jump_velocity > -self.JUMP_REARM_VELOCITY:
+            self.fire(self.JUMP, None, 0.0, n)
+        if self.track_teleport[rows].any() and self.teleport_timer <= 0 and self.gate_cooldown_timer <= 0:
+            self.fire(self.TELEPORT, None, 0.0, n)
+
+    def fire(self, kind, value, late, n):
+        """Apply one event that happened late seconds before the step in progress (n frames long)."""
+        if kind == self.PULL:
+            # Bass then shrink orbit radius
+            self.orbit_radius_current = self.ORBIT_RADIUS * (1 - value * (1 - self.BASS_RADIUS_PULL))
+            self.orbit_radius_target = self.ORBIT_RADIUS
+            self.boost_timer = self.HALF_BEAT_SECONDS - late
+        elif kind == self.BOOST:
+            self.speed_boost_timer = self.HALF_BEAT_SECONDS - late
+        elif kind == self.JUMP:
+            self.jump(late, n)
+        else:
+            self.teleport(late)
+
+    def jump(self, late, n):
+        # The jump physics in step() decays the velocity by the whole step, so
+        # start it where it would be that many frames before reaching late seconds in
+        decay = self.JUMP_DAMPING ** (late * self.PHYSICS_HZ - n)
+        rest = self.JUMP_GRAVITY * self.JUMP_DAMPING / (1 - self.JUMP_DAMPING)
+        pillar_rest = rest * 1.4
+        self.jump_velocity = rest + (self.WINDOW_JUMP - rest) * decay
+        self.pillar_jump_velocity = pillar_rest + (self.WINDOW_JUMP * 1.6 - pillar_rest) * decay
+
+        rgb = self.colors
+        targets = self.color_targets
+        rgb[self.ROOT] = 255
+        targets[self.ROOT] = 0
+
+        # Dancer flash: a white bg fading back, or a white rectangle over the art
+        plain = self.plain_rows
+        targets[plain] = self.teleport_colors[plain]
+        rgb[plain] = 255
+        flashing = self.image_dancers
+        if flashing:
+            self.start_flashes(flashing, ["#FFFFFF"] * len(flashing), self.FLASH_SECONDS)
+
+        # Pillar flash
+        rgb[self.PILLAR1:] = 255
+
+    def teleport(self, late):
+        np = self.np
+        max_x, max_y = self.max_teleport
+
+        self.teleport_start[:] = self.dancer_pos
+        self.teleport_target[:] = np.array([
+            [self.random.randint(0, max_x), self.random.randint(0, max_y)]
+            for _ in range(self.DANCERS)
+        ], dtype=float).reshape(-1, 2)
+
+        rgb = self.colors
+        targets = self.color_targets
+        targets[self.PILLAR1:] = np.array([self.random_rgb() for _ in range(self.PILLARS)], dtype=float).reshape(-1, 3)
+
+        self.teleport_timer = self.TELEPORT_EASE_SECONDS - late
+        self.gate_cooldown_timer = self.TELEPORT_COOLDOWN_SECONDS
+
+        rgb[self.ROOT] = self.random_rgb()
+        targets[self.ROOT] = 0
+
+        # A new color for every dancer: its bg fades to it, or it flashes over the art
+        new_colors = np.array([self.random_rgb() for _ in range(self.DANCERS)], dtype=float).reshape(-1, 3)
+        rows = self.plain_rows
+        targets[rows] = self.teleport_colors[rows] = new_colors[rows - self.DANCER1]
+        flashing = self.image_dancers
+        if flashing:
+            self.start_flashes(flashing, [self.rgb_to_hex(new_colors[d]) for d in flashing], self.FLASH_SECONDS * 2)
+
+    # -------------------------------------------------
+    # Color helpers
+
+    HEX_LUT = ["{:02X}".format(i) for i in range(256)]
+
+    def random_rgb(self):
+        return [self.random.randint(0,255), self.random.randint(0,255), self.random.randint(0,255)]
+
+    def rgb_to_hex(self, rgb):
+        lut = self.HEX_LUT
+        return "#" + lut[int(rgb[0])] + lut[int(rgb[1])] + lut[int(rgb[2])]
+
+    # -------------------------------------------------
+    # State
+
+    def reset(self):
+        np = self.np
+        self.jump_velocity = 0.0
+        self.pillar_jump_velocity = 0.0
+
+        # Swing / orbit
+        self.angle_accumulator = 0.0
+        self.speed_boost_timer = 0
+        self.gate_cooldown_timer = 0
+        self.boost_timer = 0
+
+        self.orbit_radius_current = self.ORBIT_RADIUS
+        self.orbit_radius_target = self.ORBIT_RADIUS
+
+        # Teleport / easing, one row per dancer
+        self.teleport_timer = 0
+
+        self.dancer_pos = np.array(self.dancer_rest, dtype=np.intp).reshape(-1, 2)
+        self.teleport_start = np.zeros((self.DANCERS, 2))
+        self.teleport_target = np.zeros((self.DANCERS, 2))
+
+        # Colors, one row per window (WINDOWS order)
+        self.colors = np.zeros((len(self.WINDOWS), 3))
+        self.color_targets = np.full((len(self.WINDOWS), 3), [160.0, 0.0, 0.0])
+        self.color_targets[self.ROOT] = 0
+        # Color the dancers fade back to after a jump flash
+        self.teleport_colors = np.zeros((len(self.WINDOWS), 3))
+
+        self.fade_speed = np.full(len(self.WINDOWS), self.BG_DANCERS_FADE_SPEED)
+        self.fade_speed[self.ROOT] = self.BG_FADE_SPEED
+        self.image_mask = None
+
+        # Flashes over album art
+        self.flash_timer = np.zeros(self.DANCERS)
+
+        # Next event of the timeline
+        self.event_index = 0
+
+    # -------------------------------------------------
+    # Checkpoints and seeking
+
+    # Everything step() changes, the rest only comes from the config and the tracks
+    STATE_FIELDS = (
+        "jump_velocity", "pillar_jump_velocity",
+        "angle_accumulator", "speed_boost_timer", "gate_cooldown_timer", "boost_timer",
+        "orbit_radius_current", "orbit_radius_target",
+        "teleport_timer", "dancer_pos", "teleport_start", "teleport_target",
+        "colors", "color_targets", "teleport_colors", "flash_timer", "event_index",
+    )
+
+    def snapshot(self):
+        state = {name: self.copy.deepcopy(getattr(self, name)) for name in self.STATE_FIELDS}
+        state["random"] = self.random.getstate()
+        return state
+
+    def restore(self, state):
+        for name in self.STATE_FIELDS:
+            # Copied again, so the same checkpoint can be restored on every loop
+            setattr(self, name, self.copy.deepcopy(state[name]))
+        self.random.setstate(state["random"])
+        # The adapter clears any flash on a jump, so don't wait for one to end
+        self.flash_timer[:] = 0
+
+    def clear_checkpoints(self):
+        # CHECKPOINT_SECONDS slot -> state at the start of it, slots kept sorted for bisect
+        self.checkpoints = {}
+        self.checkpoint_slots = []
+
+    def record_checkpoint(self, t):
+        slot = int(t // self.CHECKPOINT_SECONDS)
+        if slot < 0 or slot in self.checkpoints:
+            return
+        self.checkpoints[slot] = (t, self.snapshot())
+        self.bisect.insort(self.checkpoint_slots, slot)
+
+    def seek(self, t):
+        """Jump to playback time t with the state the dance had (or would have) there.
+
+        Restores the last checkpoint at or before t and replays from it at
+        PHYSICS_HZ. Without one close enough (a jump far ahead of anything
+        played yet) the dance carries on from its current state instead.
+        """
+        i = self.bisect.bisect_right(self.checkpoint_slots, int(t // self.CHECKPOINT_SECONDS))
+        start, state = self.checkpoints[self.checkpoint_slots[i - 1]] if i else (None, None)
+        if state is None or t - start > self.MAX_REPLAY_SECONDS:
+            # Carry on from here, with the events from t on
+            self.event_index = self.bisect.bisect_left(self.event_times, t)
+            return False
+
+        self.restore(state)
+        dt = 1 / self.PHYSICS_HZ
+        for k in range(round((t - start) * self.PHYSICS_HZ)):
+            self.step(start + k * dt, dt)
+        return True
+
+    def start_flashes(self, dancers, colors, seconds):
+        # dancers: indexes of dancers showing album art, colors: one per dancer
+        self.frame.flashes.extend(("flash", dancer, color) for dancer, color in zip(dancers, colors))
+        self.flash_timer[dancers] = seconds
+
+    def update_flashes(self, image, dt):
+        timers = self.flash_timer
+        if not timers.any():
+            return
+        active = image & (timers > 0)
+
+        timers[active] -= dt
+        ended = active & (timers <= 0)
+        timers[ended] = 0
+        self.frame.flashes.extend(("flash_end", dancer, None) for dancer in self.np.flatnonzero(ended).tolist())
+
+    # -------------------------------------------------
+    # Step
+
+    @ProfiledMethod
+    def step(self, t, dt):
+        """Advance to playback time t (seconds), dt seconds after the previous step."""
+        np = self.np
+        frame = self.frame
+        positions = frame.positions
+        colors = frame.colors
+        # Every color is set below
+        positions[:] = self.no_change
+        frame.flashes.clear()
+
+        if self.image_mask is None:
+            self.update_image_mask()
+        image = self.image_mask
+
+        # Elapsed time in PHYSICS_HZ frames, for the per-frame constants
+        n = dt * self.PHYSICS_HZ
+
+        prof = self.profiler
+
+        sin = self.math.sin
+        cos = self.math.cos
+
+        if self.live:
+            # Live input can't be sought, so no checkpoints either
+            self.dispatch_live(n)
+        else:
+            if t >= 0 and int(t // self.CHECKPOINT_SECONDS) not in self.checkpoints:
+                self.record_checkpoint(t)
+
+            # Nothing is due on most steps
+            i = self.event_index
+            if i < len(self.event_times) and self.event_times[i] <= t:
+                self.dispatch_events(t, n)
+
+        if prof:
+            prof.lap("audio_sync")
+
+        # -------- SWING --------
+        swing_freq = (self.tempo / 2) / 60
+        speed_multiplier = 1.0
+
+        if self.speed_boost_timer > 0:
+            speed_lerp = self.speed_boost_timer / self.HALF_BEAT_SECONDS
+            speed_multiplier = 1 + (self.BASS_SPEED_BOOST - 1) * speed_lerp
+            self.speed_boost_timer -= dt
+
+        self.angle_accumulator += swing_freq * speed_multiplier * dt
+
+        swing_t = t - self.tempo_shift
+        raw_sine = sin(swing_t * swing_freq * 2 * self.math.pi)
+        raw_fast = sin(swing_t * (self.tempo / 1.4 / 60) * 1.5 * self.math.pi)
+
+        swing_x = 150 * (abs(raw_sine) ** 0.5 * (1 if raw_sine > 0 else -1))
+        swing_y = 100 * (abs(raw_fast) ** 0.6 * (1 if raw_fast <= 0 else -1))
+
+        # -------- ORBIT RADIUS back out after a pull --------
+        # Per-frame lerps applied n times: target + (current - target) * keep ** n
+        if self.boost_timer > 0:
+            lerp = self.boost_timer / self.HALF_BEAT_SECONDS
+            self.orbit_radius_current = (
+                self.orbit_radius_target +
+                (self.orbit_radius_current - self.orbit_radius_target) * lerp ** n
+            )
+            self.boost_timer -= dt
+        else:
+            self.orbit_radius_current = (
+                self.ORBIT_RADIUS +
+                (self.orbit_radius_current - self.ORBIT_RADIUS) * 0.9 ** n
+            )
+
+        if prof:
+            prof.lap("swing_orbit")
+
+        # Every dancer offset and pillar move at once, see setup_arrays
+        angle = self.angle_accumulator
+        orbit = cos(angle) * self.orbit_cos
+        orbit += sin(angle) * self.orbit_sin
+        orbit *= self.orbit_radius_current * self.orbit_radius + swing_y * self.orbit_swing
+
+        center_x = self.BASE_X + self.W_WIDTH // 3.6 + swing_x
+        center_y = self.BASE_Y + self.W_HEIGHT // 3.6 + swing_y
+
+        # -------- JUMP PHYSICS --------
+        # v = (v + g) * d applied n times, in closed form around its fixed point g * d / (1 - d)
+        decay = self.JUMP_DAMPING ** n
+        rest = self.JUMP_GRAVITY * self.JUMP_DAMPING / (1 - self.JUMP_DAMPING)
+        pillar_rest = rest * 1.4
+        self.jump_velocity = rest + (self.jump_velocity - rest) * decay
+        self.pillar_jump_velocity = pillar_rest + (self.pillar_jump_velocity - pillar_rest) * decay
+
+        jump_offset = self.jump_velocity
+        pillar_jump_offset = self.pillar_jump_velocity
+        if abs(jump_offset) < 3.0:
+            jump_offset = 0.0
+        if abs(pillar_jump_offset) < 3.0:
+            pillar_jump_offset = 0.0
+
+        positions[self.ROOT] = (self.BASE_X + swing_x, self.BASE_Y + swing_y + jump_offset)
+
+        # -------- PILLARS --------
+        # Each pillar's point on the orbit: left/right ones close in by its x
+        # (at least 40 px), bottom/top ones bob by its x times the swing
+        sign = self.pillar_v_sign
+        xs = sign * np.maximum(orbit[self.orbit_vertical], 40)
+        xs += self.pillar_v_x
+        xs += sign * swing_x
+        xs += sign * pillar_jump_offset
+        for row, x, y in zip(self.pillar_v_rows, xs.tolist(), self.pillar_v_y):
+            positions[row] = (x, y)
+
+        vys = orbit[self.orbit_horizontal]
+        ys = (self.pillar_h_sign * vys + self.pillar_h_y).tolist()
+        for row, x, y, vy in zip(self.pillar_h_rows, self.pillar_h_x, ys, vys.tolist()):
+            if abs(vy) >= 1.0:
+                positions[row] = (x, y)
+
+        if prof:
+            prof.lap("jump_physics")
+
+        # -------- TELEPORT EASE/MOVE --------
+        if self.teleport_timer > 0:
+            t_norm = 1 - (self.teleport_timer / self.TELEPORT_EASE_SECONDS)
+            t_ease = 1 - (1 - t_norm) ** 3
+
+            start = self.teleport_start
+            self.move_dancers(start + (self.teleport_target - start) * t_ease)
+
+            self.teleport_timer -= dt
+
+        elif self.gate_cooldown_timer > 0:
+            self.gate_cooldown_timer -= dt
+
+        else:
+            dancer_xy = orbit[self.orbit_dancers].reshape(-1, 2)
+            dancer_xy += (center_x, center_y)
+            self.move_dancers(dancer_xy)
+
+        if prof:
+            prof.lap("teleport")
+
+        # -------- BACKGROUND FADE --------
+        # Every window at once; dancers showing album art keep their color
+        if n != self.fade_n:
+            # The same for every step at a steady frame rate
+            self.fade_n = n
+            self.fade = (1 - self.fade_keep ** n)[:, None]
+
+        # Stays within 0-255: every color moves part of the way to a target in range
+        rgb = self.colors
+        rgb += (self.color_targets - rgb) * self.fade
+
+        lut = self.HEX_LUT
+        colors[:] = ["#" + lut[r] + lut[g] + lut[b] for r, g, b in rgb.astype(np.intp).tolist()]
+
+        if self.image_rows:
+            for row in self.image_rows:
+                colors[row] = None
+            self.update_flashes(image, dt)
+
+        if prof:
+            prof.lap("background_fade")
+
+        return frame
+
+    def move_dancers(self, xy):
+        # Windows sit on whole pixels, teleports start from where they really are
+        self.dancer_pos[:] = xy
+        self.frame.positions[self.DANCER1:self.PILLAR1] = xy.tolist()
+
+    # -------------------------------------------------
+    # Compiling
+
+    def compile_show(self, fps):
+        """Step through the whole song at fps from the current state, into a DanceShow.
+
+        Positions are whole pixels and colors what the windows are set to, the
+        same values the adapter would apply frame by frame.
+        """
+        np = self.np
+        n_frames = int(self.duration * fps)
+        n_windows = len(self.WINDOWS)
+        positions = np.zeros((n_frames, n_windows, 2), dtype=np.int16)
+        colors = np.zeros((n_frames, n_windows, 3), dtype=np.uint8)
+        flash_colors = np.zeros((n_frames, self.DANCERS, 3), dtype=np.uint8)
+        flash_on = np.zeros((n_frames, self.DANCERS), dtype=bool)
+
+        # What the windows start with (see rest_windows), windows only follow what changed
+        pos = [list(p) for p in self.rest_positions()]
+        rgb = np.full((n_windows, 3), [0xA0, 0, 0], dtype=np.uint8)
+        rgb[self.ROOT] = 0
+        flash = np.zeros((self.DANCERS, 3), dtype=np.uint8)
+        # step() sets every color from self.colors but the ones of dancers showing album art
+        if self.image_mask is None:
+            self.update_image_mask()
+        shown = np.ones(n_windows, dtype=bool)
+        shown[self.image_rows] = False
+
+        dt = 1 / fps
+        for i in range(n_frames):
+            frame = self.step(i * dt, dt)
+            for w, p in enumerate(frame.positions):
+                if p is not None:
+                    pos[w] = p
+            positions[i] = pos
+
+            rgb[shown] = self.colors[shown]
+            colors[i] = rgb
+
+            for kind, dancer, color in frame.flashes:
+                if kind == "flash":
+                    flash[dancer] = [int(color[k:k + 2], 16) for k in (1, 3, 5)]
+            flash_colors[i] = flash
+            flash_on[i] = self.flash_timer > 0
+        flash_colors[~flash_on] = 0
+
+        return DanceShow(np, fps, positions, colors, flash_colors, flash_on)
+
+
+class DanceShow:
+    """A song's whole dance, compiled ahead of time by DanceEngine.compile_show().
+
+    One row per frame at fps: int16 positions and uint8 RGB colors for every
+    window, and each dancer's flash color and whether it is showing. A 4
+    minute song at 60 Hz takes about 1 MB with the default windows, and
+    WindowDance saves it next to the song's analysis and memory-maps it on
+    replay.
+
+    frame_at(t) looks up the frame at playback time t and returns a DanceFrame
+    of what changed since the frame it returned before, so the adapter
+    applies it just like a DanceEngine step. Seeking is only a different
+    lookup. After the windows were moved by something else (a rest, a seek
+    clearing the flashes, another song's show), rewind() makes the next
+    frame report everything.
+    """
+
+    ARRAYS = ("positions", "colors", "flash_colors", "flash_on")
+
+    def __init__(self, np, fps, positions, colors, flash_colors, flash_on):
+        self.np = np
+        self.fps = fps
+        # Plain views of memory-mapped files, indexing a np.memmap costs more than the lookup itself
+        self.positions = np.asarray(positions)
+        self.colors = np.asarray(colors)
+        self.flash_colors = np.asarray(flash_colors)
+        self.flash_on = np.asarray(flash_on)
+
+        self.n_frames, n_windows = positions.shape[:2]
+        self.frame = DanceFrame(n_windows)
+        self.no_change = [None] * n_windows
+        self.no_flash = [None] * flash_on.shape[1]
+        # Index and values of the frame returned last, None after rewind()
+        self.last = None
+        self.applied = None
+
+    @property
+    def duration(self):
+        return self.n_frames / self.fps
+
+    def rewind(self):
+        self.last = None
+        self.applied = None
+
+    def frame_at(self, t):
+        frame = self.frame
+        frame.positions[:] = self.no_change
+        frame.colors[:] = self.no_change
+        frame.flashes.clear()
+
+        i = min(max(int(t * self.fps + 0.5), 0), self.n_frames - 1)
+        if i < 0 or i == self.last:
+            # An empty show, or the same frame again
+            return frame
+        self.last = i
+
+        # Plain lists compare faster than a handful of windows' worth of NumPy calls
+        xy = self.positions[i].tolist()
+        rgb = self.colors[i].tolist()
+        flash = [c if on else None for c, on in zip(self.flash_colors[i].tolist(), self.flash_on[i].tolist())]
+        prev = self.applied
+        self.applied = xy, rgb, flash
+        if prev is None:
+            prev = self.no_change, self.no_change, self.no_flash
+
+        lut = DanceEngine.HEX_LUT
+        for w, (p, q) in enumerate(zip(xy, prev[0])):
+            if p != q:
+                frame.positions[w] = p
+        for w, (c, q) in enumerate(zip(rgb, prev[1])):
+            if c != q:
+                r, g, b = c
+                frame.colors[w] = "#" + lut[r] + lut[g] + lut[b]
+        for dancer, (c, q) in enumerate(zip(flash, prev[2])):
+            if c == q:
+                continue
+            if c is None:
+                frame.flashes.append(("flash_end", dancer, None))
+            else:
+                # Also a new flash over one still showing
+                r, g, b = c
+                frame.flashes.append(("flash", dancer, "#" + lut[r] + lut[g] + lut[b]))
+        return frame
+
+    def save(self, path, prefix):
+        """Write the arrays as <prefix><name>.npy files in the folder path."""
+        import os
+
+        for name in self.ARRAYS:
+            final = os.path.join(path, f"{prefix}{name}.npy")
+            # Written whole before it replaces an older show's file
+            with open(final + ".tmp", "wb") as f:
+                self.np.save(f, getattr(self, name))
+            os.replace(final + ".tmp", final)
+
+    @classmethod
+    def load(cls, np, path, prefix, fps):
+        """The show saved by save(), memory-mapped."""
+        import os
+
+        arrays = [np.load(os.path.join(path, f"{prefix}{name}.npy"), mmap_mode="r") for name in cls.ARRAYS]
+        return cls(np, fps, *arrays)
+
+
+class FrameProducer:
+    """Computes the dance on a thread of its own, one frame ahead of the Tk thread.
+
+    Each tick the Tk thread applies the newest finished frame with take() and
+    asks for the one of its next tick with request(t). step(t, dt) (the
+    engine's, or a DanceShow lookup) then runs on this thread while Tk is
+    free to handle input and move windows.
+
+    The threads share no lock. Frames are handed over through a single slot,
+    each a whole window state with every position, color and flash in new
+    tuples, so publishing one is a single reference assignment: the Tk thread
+    never sees half a frame, and a frame it never gets to loses nothing.
+    take() turns the newest state into a DanceFrame of what changed since the
+    one applied before it.
+
+    While this thread runs, only it touches the engine. Anything else that
+    changes it (a seek, a new song, album art) is sent with send() as a
+    function, which this thread runs before its next step, and frames
+    computed before the change are never applied.
+    """
+
+    def __init__(self, threading, step, rest_positions, n_dancers, period, max_dt):
+        from collections import deque
+
+        self.step = step
+        self.period = period
+        self.max_dt = max_dt
+        self.wake = threading.Event()
+        self.running = True
+
+        # Bumped by send(), requests and frames carry the one they were made in
+        self.generation = 0
+        self.requested = None
+        self.published = None
+        # (generation, change) sent by the Tk thread, run on this thread in order
+        self.changes = deque()
+
+        # This thread's running state of every window, starting from where rest_windows() leaves them.
+        # step() only reports changes, so after a seek the windows it leaves out stay where they are
+        self.positions = [tuple(p) for p in rest_positions()]
+        self.colors = ["#000000"] + ["#A00000"] * (len(self.positions) - 1)
+        self.flash = [None] * n_dancers
+        self.state_generation = 0
+        self.last_t = None
+
+        # The Tk thread's side: the state it applied last, None after send()
+        self.taken = None
+        self.applied = None
+        n_windows = len(rest_positions())
+        self.frame = DanceFrame(n_windows)
+        self.no_change = [None] * n_windows
+        self.no_flash = [None] * n_dancers
+
+        self.thread = threading.Thread(target=self.run, daemon=True)
+        self.thread.start()
+
+    def stop(self):
+        self.running = False
+        self.wake.set()
+        self.thread.join()
+        # Changes sent after the last step still happen, here now that the thread is gone
+        while self.changes:
+            self.changes.popleft()[1]()
+
+    # -------------------------------------------------
+    # Tk thread
+
+    def request(self, t):
+        self.requested = self.generation, t
+        self.wake.set()
+
+    def send(self, change):
+        """Run change() on the frame thread before its next step, frames from before it are dropped."""
+        self.generation += 1
+        self.applied = None
+        self.changes.append((self.generation, change))
+        self.wake.set()
+
+    def take(self):
+        """DanceFrame of what changed in the newest finished frame, None if there is no new one."""
+        published = self.published
+        if published is None or published is self.taken or published[0] != self.generation:
+            return None
+        self.taken = published
+        _, xy, rgb, flash = published
+
+        frame = self.frame
+        frame.positions[:] = self.no_change
+        frame.colors[:] = self.no_change
+        frame.flashes.clear()
+        prev = self.applied
+        self.applied = xy, rgb, flash
+        if prev is None:
+            prev = self.no_change, self.no_change, self.no_flash
+
+        for w, (p, q) in enumerate(zip(xy, prev[0])):
+            if p != q:
+                frame.positions[w] = p
+        for w, (c, q) in enumerate(zip(rgb, prev[1])):
+            if c != q:
+                frame.colors[w] = c
+        for dancer, (c, q) in enumerate(zip(flash, prev[2])):
+            if c != q:
+                frame.flashes.append(("flash_end", dancer, None) if c is None else ("flash", dancer, c))
+        return frame
+
+    # -------------------------------------------------
+    # Frame thread
+
+    def run(self):
+        while True:
+            self.wake.wait()
+            self.wake.clear()
+            if not self.running:
+                return
+
+            while self.changes:
+                # The first frame after a seek or a new song is stepped like the first one of a start
+                self.state_generation, change = self.changes.popleft()
+                change()
+                self.last_t = None
+
+            if self.requested is None:
+                continue
+            generation, t = self.requested
+            if generation != self.state_generation:
+                # Asked for before a change this thread already ran, or with one still on its way
+                continue
+
+            dt = self.period if self.last_t is None else min(max(t - self.last_t, 0.0), self.max_dt)
+            self.last_t = t
+            frame = self.step(t, dt)
+
+            positions = self.positions
+            for w, p in enumerate(frame.positions):
+                if p is not None:
+                    positions[w] = (int(p[0]), int(p[1]))
+            colors = self.colors
+            for w, c in enumerate(frame.colors):
+                if c is not None:
+                    colors[w] = c
+            for kind, dancer, color in frame.flashes:
+                self.flash[dancer] = color if kind == "flash" else None
+
+            self.published = generation, tuple(positions), tuple(colors), tuple(self.flash)
+
+
+class TkBackend:
+    """The dance as real windows: the main window, the dancers and the pillars.
+
+    WindowDance draws through a render backend: the windows and canvases
+    handles (DanceEngine.WINDOWS order and one per dancer), start for the
+    keys, and move, set_color, flash, clear_flash, show_art and commit. Here
+    the main window is the Tk root, which also holds the start button.
+    """
+
+    def __init__(self, wd):
+        self.wd = wd
+        self.tk = wd.tk
+        # Tcl commands waiting for commit (BATCH_TCL)
+        self.batch = []
+
+    def setup(self, engine):
+        wd = self.wd
+        root = wd.root
+        rest_positions = engine.rest_positions()
+        root_x, root_y = rest_positions[0]
+        root.geometry(f"{wd.W_WIDTH}x{wd.W_HEIGHT}+{root_x}+{root_y}")
+
+        # Same order as DanceEngine.WINDOWS
+        self.windows = [root]
+        self.canvases = []
+        for _ in range(engine.DANCERS):
+            dancer, canvas = self.make_dancer_window()
+            self.windows.append(dancer)
+            self.canvases.append(canvas)
+        for width, height in engine.window_sizes()[engine.PILLAR1:]:
+            self.windows.append(self.make_pillar_window(width, height))
+
+        for d in self.windows[1:]:
+            d.config(bg="#a00000")
+
+        for c in self.canvases:
+            c.config(bg="#a00000")
+
+        for win, (pos_x, pos_y) in zip(self.windows[1:], rest_positions[1:]):
+            win.geometry(f"+{pos_x}+{pos_y}")
+
+    def start(self, keys):
+        # Tk keysym -> action
+        for keysym, action in keys.items():
+            self.wd.root.bind(f"<{keysym}>", lambda event, action=action: action())
+
+    def make_dancer_window(self):
+        size = self.wd.SQUARE_SIZE
+        win = self.tk.Toplevel(self.wd.root)
+        win.overrideredirect(True)
+        win.geometry(f"{size}x{size}+0+0")
+
+        canvas = self.tk.Canvas(
+            win,
+            width=size,
+            height=size,
+            highlightthickness=0
+        )
+        canvas.pack(fill="both", expand=True)
+
+        return win, canvas
+
+    def make_pillar_window(self, width, height):
+        win = self.tk.Toplevel(self.wd.root)
+        win.overrideredirect(True)
+        win.geometry(f"{width}x{height}+0+0")
+
+        return win
+
+    def move(self, win, x, y):
+        if self.wd.BATCH_TCL:
+            self.batch.append(f"wm geometry {win} +{x}+{y}")
+        else:
+            win.geometry(f"+{x}+{y}")
+
+    def set_color(self, win, color):
+        if self.wd.BATCH_TCL:
+            self.batch.append(f"{win} configure -bg {color}")
+        else:
+            win.config(bg=color)
+
+    def flash(self, canvas, color):
+        size = self.wd.SQUARE_SIZE
+        if self.wd.BATCH_TCL:
+            self.batch.append(f"{canvas} create rectangle 0 0 {size} {size} -fill {color} -outline {{}} -tags flash")
+            return
+
+        canvas.create_rectangle(
+            0, 0, size, size,
+            fill=color, outline="", tags="flash"
+        )
+
+    def clear_flash(self, canvas):
+        if self.wd.BATCH_TCL:
+            self.batch.append(f"{canvas} delete flash")
+        else:
+            canvas.delete("flash")
+
+    def show_art(self, art):
+        # One Tk image for every dancer
+        tk_img = self.wd.ImageTk.PhotoImage(art) if art is not None else None
+        for canvas in self.canvases:
+            canvas.delete("art")
+            if tk_img:
+                canvas.image = tk_img
+                canvas.create_image(0, 0, anchor="nw", image=tk_img, tags="art")
+                # Under a flash that may still be showing
+                canvas.tag_lower("art")
+                canvas.pack(fill="both", expand=True)
+            else:
+                canvas.pack_forget()
+
+    def commit(self):
+        # One Python -> Tcl round trip for everything queued this tick
+        if self.batch:
+            self.wd.root.tk.eval("\n".join(self.batch))
+            self.batch.clear()
+
+
+class PygameBackend:
+    """The whole scene drawn into one pygame window, for previews and rehearsals.
+
+    Nothing moves on the desktop, so the window manager has no work to do: the
+    windows are rectangles on a black surface scaled by PREVIEW_SCALE, redrawn
+    with fills and an album art blit, and only the rectangles that changed are
+    presented. The Tk root stays as a small control window with the start
+    button, and the preview takes the same keys.
+    """
+
+    def __init__(self, wd):
+        self.wd = wd
+        self.pygame = wd.pygame
+        self.scale = wd.PREVIEW_SCALE
+
+    def setup(self, engine):
+        pg = self.pygame
+        pg.display.init()
+        sw, sh = engine.screen_width, engine.screen_height
+        self.screen = pg.display.set_mode((int(sw * self.scale), int(sh * self.scale)))
+        pg.display.set_caption("Window Dance preview")
+
+        # Window handles are DanceEngine.WINDOWS indexes, canvases the dancers'
+        self.windows = list(range(len(engine.WINDOWS)))
+        self.first_dancer = engine.DANCER1
+        self.canvases = self.windows[engine.DANCER1:engine.PILLAR1]
+
+        self.sizes = engine.window_sizes()
+        self.pos = [tuple(p) for p in engine.rest_positions()]
+        self.colors = [pg.Color(0, 0, 0)] + [pg.Color(0xA0, 0, 0)] * (len(self.windows) - 1)
+        self.flashes = [None] * len(self.canvases)
+        self.art = None
+        self.last_rects = []
+        self.commit()
+
+    def start(self, keys):
+        pg = self.pygame
+        # Tk keysym -> pygame key name
+        names = {"bracketleft": "[", "bracketright": "]"}
+        self.keys = {pg.key.key_code(names.get(keysym, keysym.lower())): action for keysym, action in keys.items()}
+        # The Tk root only holds the start button now
+        self.wd.root.geometry("320x120")
+        self.pump()
+
+    def pump(self):
+        # Runs on its own, so the preview stays responsive while paused or stopped
+        for event in self.pygame.event.get():
+            if event.type == self.pygame.QUIT:
+                self.wd.root.destroy()
+                return
+            if event.type == self.pygame.KEYDOWN and event.key in self.keys:
+                self.keys[event.key]()
+        self.wd.root.after(30, self.pump)
+
+    def move(self, win, x, y):
+        self.pos[win] = (x, y)
+
+    def set_color(self, win, color):
+        self.colors[win] = self.pygame.Color(color)
+
+    def flash(self, canvas, color):
+        self.flashes[canvas - self.first_dancer] = self.pygame.Color(color)
+
+    def clear_flash(self, canvas):
+        self.flashes[canvas - self.first_dancer] = None
+
+    def show_art(self, art):
+        if art is None:
+            self.art = None
+            return
+        pg = self.pygame
+        art = art.convert("RGB")
+        surface = pg.image.frombytes(art.tobytes(), art.size, "RGB")
+        size = max(1, int(self.wd.SQUARE_SIZE * self.scale))
+        self.art = pg.transform.smoothscale(surface, (size, size)).convert()
+
+    def commit(self):
+        pg = self.pygame
+        screen = self.screen
+        scale = self.scale
+        screen.fill((0, 0, 0))
+
+        rects = []
+        for w, ((x, y), (width, height)) in enumerate(zip(self.pos, self.sizes)):
+            rect = pg.Rect(int(x * scale), int(y * scale), max(1, int(width * scale)), max(1, int(height * scale)))
+            dancer = w - self.first_dancer
+            if 0 <= dancer < len(self.flashes) and self.art is not None:
+                if self.flashes[dancer] is not None:
+                    screen.fill(self.flashes[dancer], rect)
+                else:
+                    screen.blit(self.art, rect)
+            else:
+                screen.fill(self.colors[w], rect)
+            rects.append(rect)
+
+        # Where the windows were and where they are now, everything else is still black
+        pg.display.update(self.last_rects + rects)
+        self.last_rects = rects
+
+
+class WindowDance:
+    RENDER_BACKENDS = {"tk": TkBackend, "pygame": PygameBackend}
+    # Mixer frequency, sample format and channels. Songs at another rate stream from their file.
+    MIXER_FORMAT = (44100, -16, 2)
+
+    # Heavy modules, imported on first use by __getattr__ (attribute name -> module, member)
+    LAZY_IMPORTS = {
+        "np": ("numpy", None),
+        "librosa": ("librosa", None),
+        "pygame": ("pygame", None),
+        "soundfile": ("soundfile", None),
+        "soxr": ("soxr", None),
+        "Image": ("PIL.Image", None),
+        "ImageTk": ("PIL.ImageTk", None),
+        "ID3": ("mutagen.id3", "ID3"),
+    }
+
+    def __init__(self, interactive=True):
+        import tkinter as tk
+        import math
         from io import BytesIO
-        from mutagen.id3 import ID3
+        import os
+        import sys
+        import json
+        import shutil
+        import hashlib
+        import tempfile
+        import time
+        import threading
 
         self.tk = tk
-        self.librosa = librosa
-        self.pygame = pygame
         self.math = math
-        self.random = random
-        self.np = np
-        self.Image = Image
-        self.ImageTk = ImageTk
         self.BytesIO = BytesIO
-        self.ID3 = ID3
+        self.os = os
+        self.sys = sys
+        self.json = json
+        self.shutil = shutil
+        self.hashlib = hashlib
+        self.tempfile = tempfile
+        self.time = time
+        self.threading = threading
+
+        if not interactive:
+            # Config only, for benchmarks and tools that drive the methods directly
+            self.setup_defaults()
+            return
 
         self.setup_config()
-        self.analyze_audio()
         self.setup_windows()
         self.setup_state()
-        self.setup_audio()
+
+    def __getattr__(self, name):
+        # Only called for attributes that aren't set yet
+        if name not in WindowDance.LAZY_IMPORTS:
+            raise AttributeError(f"{type(self).__name__!r} object has no attribute {name!r}")
+
+        import importlib
+
+        module_name, member = WindowDance.LAZY_IMPORTS[name]
+        value = importlib.import_module(module_name)
+        if member:
+            value = getattr(value, member)
+        setattr(self, name, value)
+        return value
 
     # -------------------------------------------------
     # Configuration
 
     def setup_config(self):
-        self.AUDIO_FILE = input("\n\nEnter your file name (e.g., song.mp3): ")
+        self.setup_defaults()
+
+        entry = input("\n\nEnter your file, folder or .m3u playlist name, or live[:device, file or pipe] (e.g., song.mp3): ")
+        if entry.strip().lower() == "live" or entry.strip().lower().startswith("live:"):
+            # Dance to whatever is coming in instead of a song
+            self.LIVE_SOURCE = entry.strip().partition(":")[2].strip().strip('"')
+            self.AUDIO_FILE = "Live input"
+        else:
+            self.playlist = self.parse_playlist(entry)
+            self.AUDIO_FILE = self.playlist[0]
         self.WINDOW_JUMP = -int(input("Enter how high the windows can jump (0 for none): "))
 
-        rf = None
-        # Get current monitor refresh rate
-        try:
-            self.pygame.init()
-            self.pygame.display.set_mode((1, 1))
-            rf = self.pygame.display.get_current_refresh_rate()
-            self.pygame.display.quit()
-        except Exception as err:
-            print(f"Error getting refresh rate:\n\t{err}")
+        rf = self.probe_refresh_rate()
 
         unknown_rf = rf == 0 or rf is None
         if unknown_rf:
@@ -50,11 +2279,129 @@ class WindowDance:
             rf = 60
 
         self.UPDATE_HZ = rf if rf > 0 else 60
+        if len(self.playlist) > 1 or self.LIVE_SOURCE is not None:
+            # One tempo can't fit every song, each one is detected (and live input is followed as it plays)
+            return
         self.confirm_self_tempo = input("Do you want to set a custom tempo? (y/n): ").lower()
 
         if self.confirm_self_tempo == 'y':
             self.TEMPO_INPUT = int(input("Enter the tempo (BPM): "))
 
+    def parse_playlist(self, entry):
+        entry = entry.strip().strip('"')
+        if self.os.path.isdir(entry):
+            songs = sorted(
+                self.os.path.join(entry, name) for name in self.os.listdir(entry)
+                if name.lower().endswith(".mp3")
+            )
+        elif entry.lower().endswith((".m3u", ".m3u8")):
+            base = self.os.path.dirname(entry)
+            with open(entry, encoding="utf-8-sig") as f:
+                lines = [line.strip() for line in f]
+            songs = [self.os.path.join(base, line) for line in lines if line and not line.startswith("#")]
+        else:
+            songs = [entry]
+
+        if not songs:
+            raise SystemExit(f"No songs found in {entry}")
+        return songs
+
+    def probe_refresh_rate(self):
+        # Get current monitor refresh rate, from the OS where it's cheap, before any window or pygame exists
+        if self.os.name == "nt":
+            probe = self.refresh_rate_gdi
+        elif self.sys.platform == "darwin":
+            probe = self.refresh_rate_coregraphics
+        else:
+            probe = self.refresh_rate_xrandr
+        try:
+            rf = probe()
+            # 0 and 1 mean "hardware default" (GDI), or a display that doesn't say (built-in panels)
+            if rf and rf > 1:
+                return rf
+        except Exception as err:
+            print(f"Error getting refresh rate:\n\t{err}")
+
+        try:
+            # Only SDL's video part, a full pygame.init() would also open the mixer at its defaults
+            self.pygame.display.init()
+            rates = self.pygame.display.get_desktop_refresh_rates()
+            self.pygame.display.quit()
+            return rates[0] if rates else None
+        except Exception as err:
+            print(f"Error getting refresh rate:\n\t{err}")
+        return None
+
+    def refresh_rate_gdi(self):
+        import ctypes
+
+        user32 = ctypes.windll.user32
+        hdc = user32.GetDC(0)
+        rf = ctypes.windll.gdi32.GetDeviceCaps(hdc, 116)  # VREFRESH
+        user32.ReleaseDC(0, hdc)
+        return rf
+
+    def refresh_rate_coregraphics(self):
+        import ctypes
+        import ctypes.util
+
+        cg = ctypes.CDLL(ctypes.util.find_library("CoreGraphics"))
+        cg.CGMainDisplayID.restype = ctypes.c_uint32
+        cg.CGDisplayCopyDisplayMode.restype = ctypes.c_void_p
+        cg.CGDisplayCopyDisplayMode.argtypes = [ctypes.c_uint32]
+        cg.CGDisplayModeGetRefreshRate.restype = ctypes.c_double
+        cg.CGDisplayModeGetRefreshRate.argtypes = [ctypes.c_void_p]
+        cg.CGDisplayModeRelease.argtypes = [ctypes.c_void_p]
+
+        mode = cg.CGDisplayCopyDisplayMode(cg.CGMainDisplayID())
+        if not mode:
+            return None
+        rf = cg.CGDisplayModeGetRefreshRate(mode)
+        cg.CGDisplayModeRelease(mode)
+        return round(rf)
+
+    def refresh_rate_xrandr(self):
+        import ctypes
+        import ctypes.util
+
+        names = [ctypes.util.find_library("X11"), ctypes.util.find_library("Xrandr")]
+        if None in names:
+            return None
+        x11, xrandr = (ctypes.CDLL(name) for name in names)
+        x11.XOpenDisplay.restype = ctypes.c_void_p
+        x11.XOpenDisplay.argtypes = [ctypes.c_char_p]
+        x11.XDefaultRootWindow.restype = ctypes.c_ulong
+        x11.XDefaultRootWindow.argtypes = [ctypes.c_void_p]
+        x11.XCloseDisplay.argtypes = [ctypes.c_void_p]
+        xrandr.XRRGetScreenInfo.restype = ctypes.c_void_p
+        xrandr.XRRGetScreenInfo.argtypes = [ctypes.c_void_p, ctypes.c_ulong]
+        xrandr.XRRConfigCurrentRate.restype = ctypes.c_short
+        xrandr.XRRConfigCurrentRate.argtypes = [ctypes.c_void_p]
+        xrandr.XRRFreeScreenConfigInfo.argtypes = [ctypes.c_void_p]
+
+        # The display Tk will open too ($DISPLAY), without Xrandr (Wayland, no X) pygame is asked instead
+        display = x11.XOpenDisplay(None)
+        if not display:
+            return None
+        try:
+            config = xrandr.XRRGetScreenInfo(display, x11.XDefaultRootWindow(display))
+            if not config:
+                return None
+            rf = xrandr.XRRConfigCurrentRate(config)
+            xrandr.XRRFreeScreenConfigInfo(config)
+            return rf
+        finally:
+            x11.XCloseDisplay(display)
+
+    def setup_defaults(self):
+        self.AUDIO_FILE = None
+        self.playlist = []
+        self.WINDOW_JUMP = 0
+        self.UPDATE_HZ = 60
+        self.confirm_self_tempo = 'n'
+        # Set once the mixer is up (setup_mixer), analysis then decodes songs into mixer Sounds
+        self.decode_for_playback = False
+
         self.W_WIDTH, self.W_HEIGHT = 500, 300  # Main window size WxH -  -  -  -  -  -  -  (Default: 500 x 300)
 
         self.SQUARE_SIZE = 200                  # Dancer window size (square)   -  -  -  -  (Default: 200)
@@ -62,6 +2409,11 @@ class WindowDance:
 
         self.PILLAR_WIDTH = 100                 # Pillar window width in pixels -  -  -  -  (Default: 100)
 
+        self.DANCERS = 2                        # Number of dancer windows   -  -  -  -  -  (Default: 2)
+        self.ORBIT_RINGS = 1                    # Orbits the dancers are spread over  -  -  (Default: 1)
+        self.ORBIT_RING_STEP = 0.3              # How much smaller each inner orbit is   -  (Default: 0.3)
+        self.PILLARS = 4                        # Pillar windows (left, right, bottom, top...) (Default: 4)
+
         self.GATE_MULTIPLIER = 0.48             # Adaptive gate sensitivity  -  -  -  -  -  (Default: 0.48)
         self.BASS_RADIUS_PULL = 0.53            # Minimum orbit size   -  -  -  -  -  -  -  (Default: 0.53)
         self.MIN_GATE_DROP = 0.025              # Min RMS drop to trigger gate  -  -  -  -  (Default: 0.025)
@@ -77,249 +2429,702 @@ class WindowDance:
         self.TELEPORT_COOLDOWN = 2.7            # Seconds between teleports  -  -  -  -  -  (Default: 2.7)
         self.BG_FADE_SPEED = 0.12               # Background color fade speed   -  -  -  -  (Default: 0.12)
         self.BG_DANCERS_FADE_SPEED = 0.1        # Dancer bg color fade speed -  -  -  -  -  (Default: 0.1)
+        self.PLAYLIST_LOOP = False              # Loop the playlist -  -  -  -  -  -  -  -  (Default: False)
+        self.BATCH_TCL = True                   # Apply each frame with one Tcl call  -  -  (Default: True)
+        self.RENDER_BACKEND = "tk"              # "tk" windows or one "pygame" window -  -  (Default: "tk")
+        self.PREVIEW_SCALE = 0.5                # Size of the pygame preview vs the screen  (Default: 0.5)
+        self.SEED = None                        # Random seed (None for a new dance every run) (Default: None)
+        self.COMPILE_SHOW = False               # Compile each song's whole dance before it plays (Default: False)
+        self.PHYSICS_HZ = 60                    # Frame rate the per-frame values assume -  (Default: 60)
+        self.AUDIO_BUFFER = 512                 # Mixer buffer size in samples  -  -  -  -  (Default: 512)
+        self.SINGLE_DECODE = True               # Decode songs once for analysis and playback (Default: True)
+        self.AUDIO_LATENCY_MS = None            # Output latency in ms (None = estimate) -  (Default: None)
+        self.AV_OFFSET_MS = 0                   # Dance delay in ms ([ and ] to adjust)  -  (Default: 0)
+        self.MAX_FRAME_DT = 0.25                # Longest time step simulated in one tick   (Default: 0.25)
+        self.FRAME_THREAD = False               # Compute frames on a thread, Tk only applies them (Default: False)
+        self.GOVERNOR = True                    # Shed window updates when frames run over  (Default: True)
+        self.GOVERNOR_HIGH = 0.8                # Share of the frame budget that sheds a level (Default: 0.8)
+        self.GOVERNOR_LOW = 0.5                 # Share under which a level comes back   -  (Default: 0.5)
+        self.GOVERNOR_HOLD = 1.0                # Seconds under it before it comes back  -  (Default: 1.0)
+        self.GOVERNOR_MIN_MOVE = 3              # Smallest move applied under load in px -  (Default: 3)
+        self.SEEK_SECONDS = 5                   # Seek step of the arrow keys in seconds -  (Default: 5)
+        self.CHECKPOINT_SECONDS = 1.0           # Dance state saved this often for seeking  (Default: 1.0)
+        self.MAX_REPLAY_SECONDS = 30            # Longest replay on a seek in seconds -  -  (Default: 30)
+        self.BEAT_GRID_DIVISION = 2             # Points per beat that events snap to -  -  (Default: 2)
+
+        self.PROFILE = False                    # Record per-section frame timings -  -  -  (Default: False)
+        self.PROFILE_OVERLAY = False            # Show live timings on the main window   -  (Default: False)
+        self.PROFILE_OUTPUT = "frame_profile"   # Timings file name (.json and .csv)  -  -  (Default: "frame_profile")
+
+        self.ANALYSIS_SR = 22050                # Analysis sample rate in Hz -  -  -  -  -  (Default: 22050)
+        self.HOP_LENGTH = 512                   # Analysis hop length in samples   -  -  -  (Default: 512)
+        self.BASS_CUTOFF_HZ = 150               # Upper edge of the bass band in Hz   -  -  (Default: 150)
+        self.N_FFT = 2048                       # Analysis FFT size in samples  -  -  -  -  (Default: 2048)
+        self.BASS_BACKEND = "lowband"           # Bass extractor: "lowband" or "stft" -  -  (Default: "lowband")
+        self.STREAM_ANALYSIS_MINUTES = 10       # Stream-analyze songs longer than this  -  (Default: 10)
+        self.STREAM_BLOCK_SIZE = 65536          # Samples decoded per streaming block -  -  (Default: 65536)
+
+        self.CACHE_DIR = "analysis_cache"       # Analysis cache folder (None to disable)   (Default: "analysis_cache")
+        self.CACHE_MAX_MB = 256                 # Max cache size in MB (None = no limit) -  (Default: 256)
+
+        self.LIVE_SOURCE = None                 # Live input: "" default device, a name, file or pipe (Default: None)
+        self.LIVE_RATE = 44100                  # Capture (and pipe) sample rate in Hz   -  (Default: 44100)
+        self.LIVE_BLOCK = 256                   # Samples per captured block -  -  -  -  -  (Default: 256)
+        self.LIVE_HOP = 128                     # Live analysis hop at ANALYSIS_SR in samples (Default: 128)
+        self.LIVE_TEMPO = 120                   # Tempo until one is detected in BPM  -  -  (Default: 120)
+        self.LIVE_TEMPO_SECONDS = 8             # Onset history for the live tempo in seconds (Default: 8)
+        self.LIVE_PEAK_SECONDS = 10             # Half-life of the live bass peak in seconds (Default: 10)
 
     # -------------------------------------------------
     # Audio analysis
 
+    def report_progress(self, status):
+        # Read by poll_analysis on the Tk thread
+        self.analysis_status = status
+
     def analyze_audio(self):
         print("\nAnalyzing audio...\n")
+        self.report_progress("Analyzing audio...")
 
-        y, sr = self.librosa.load(self.AUDIO_FILE)
+        need_tempo = self.confirm_self_tempo != 'y'
+        detected_tempo, tracks, from_cache = self.load_or_compute_analysis(need_tempo)
+        if from_cache:
+            print("Loaded analysis from cache")
 
-        if self.confirm_self_tempo != 'y':
-            tempo, _ = self.librosa.beat.beat_track(y=y, sr=sr)
-            self.tempo = self.math.ceil(tempo.item())
+        if need_tempo:
+            self.tempo = self.math.ceil(detected_tempo)
+            self.beat_times = tracks["beat_times"]
         else:
             self.tempo = self.TEMPO_INPUT
+            # Beats detected earlier won't fit the entered tempo, the engine lays an even grid instead
+            self.beat_times = self.np.zeros(0)
 
-        self.TELEPORT_COOLDOWN_FRAMES = self.math.floor(
-            (60 / self.tempo) * self.UPDATE_HZ / self.TELEPORT_COOLDOWN
-        )
+        self.bass_energy = tracks["bass_energy"]
+        self.rms = tracks["rms"]
+        self.rms_times = tracks["rms_times"]
+        # The song decoded into a mixer Sound, None if it wasn't decoded here or can't play from memory
+        self.sound = tracks.get("sound")
+
+        print(f"Finished analyzing\n{'Detected' if need_tempo else 'User entered'} BPM: {self.tempo}")
 
-        S = self.np.abs(self.librosa.stft(y))
-        freqs = self.librosa.fft_frequencies(sr=sr)
-        bass = self.np.mean(S[freqs < 150, :], axis=0)
+    def load_or_compute_analysis(self, need_tempo=True, refresh=False):
+        """(detected_tempo, tracks, from_cache) for AUDIO_FILE, saving fresh results to the cache."""
+        key = self.analysis_cache_key() if self.CACHE_DIR else None
+        # The album art thumbnail is kept next to the tracks
+        self.analysis_key = key
+        cached = self.load_cached_analysis(key) if key and not refresh else None
 
+        if cached is not None and (cached[0] is not None or not need_tempo):
+            return cached[0], cached[1], True
+
+        if self.use_streaming_analysis():
+            detected_tempo, tracks = self.compute_analysis_streaming(need_tempo)
+        else:
+            detected_tempo, tracks = self.compute_analysis(need_tempo)
+        if key:
+            self.save_cached_analysis(key, detected_tempo, tracks)
+        return detected_tempo, tracks, False
+
+    def compute_analysis(self, need_tempo=True):
+        self.report_progress("Decoding audio...")
+        decoded = self.decode_once() if self.decode_for_playback else None
+        if decoded is None:
+            y, sr = self.librosa.load(self.AUDIO_FILE, sr=self.ANALYSIS_SR)
+            return self.analyze_signal(y, sr, need_tempo)
+
+        y, sound = decoded
+        detected_tempo, tracks = self.analyze_signal(y, self.ANALYSIS_SR, need_tempo)
+        tracks["sound"] = sound
+        return detected_tempo, tracks
+
+    def decode_once(self):
+        """(analysis signal, mixer Sound) of AUDIO_FILE from a single decode, or None.
+
+        The file is decoded block by block straight into the samples of a
+        Sound the mixer can play, and the analysis signal is the mono mix of
+        the same blocks, resampled like librosa.load does. None when the song
+        can't play from memory at the mixer's format (not readable by
+        soundfile, another sample rate, more than two channels).
+        """
+        import pygame.sndarray
+
+        np = self.np
+        try:
+            info = self.soundfile.info(self.AUDIO_FILE)
+        except Exception:
+            return None
+        rate, _, channels = self.pygame.mixer.get_init() or (0, 0, 0)
+        if info.samplerate != rate or info.channels > channels:
+            return None
+
+        # Reading zeros from np.zeros doesn't touch any memory, so only the Sound's own buffer is filled
+        sound = self.pygame.mixer.Sound(buffer=np.zeros(info.frames * channels, dtype=np.int16))
+        samples = pygame.sndarray.samples(sound)
+        # The same soxr_hq filter as librosa.load, a block at a time
+        resampler = self.soxr.ResampleStream(rate, self.ANALYSIS_SR, 1, dtype="float32", quality="HQ")
+
+        parts = []
+        pos = 0
+        for block in self.soundfile.blocks(self.AUDIO_FILE, blocksize=self.STREAM_BLOCK_SIZE, dtype="float32", always_2d=True):
+            block = block[:info.frames - pos]
+            n = len(block)
+            parts.append(resampler.resample_chunk(block.mean(axis=1)))
+            # Mono songs go to both channels
+            block *= 32768
+            samples[pos:pos + n] = np.clip(block, -32768, 32767, out=block)
+            pos += n
+        parts.append(resampler.resample_chunk(np.zeros(0, dtype=np.float32), last=True))
+
+        y = np.concatenate(parts)[:self.math.ceil(pos * self.ANALYSIS_SR / rate)]
+        return y, sound
+
+    def analyze_signal(self, y, sr, need_tempo=True):
+        self.report_progress("Detecting tempo, bass and volume..." if need_tempo else "Measuring bass and volume...")
+        stages = ("tempo", "bass", "rms") if need_tempo else ("bass", "rms")
+        results = {stage: self.analysis_stage(stage, y, sr) for stage in stages}
+
+        detected_tempo, beat_times = results.get("tempo", (None, self.np.zeros(0)))
+        bass = results["bass"]
         denom = bass.max() - bass.min()
-        self.bass_energy = bass / denom if denom > 0 else self.np.zeros_like(bass)
+        bass_energy = bass / denom if denom > 0 else self.np.zeros_like(bass)
 
-        self.rms = self.librosa.feature.rms(y=y)[0]
-        self.rms_times = self.librosa.frames_to_time(
-            self.np.arange(len(self.rms)), sr=sr
+        rms = results["rms"]
+        rms_times = self.librosa.frames_to_time(
+            self.np.arange(len(rms)), sr=sr, hop_length=self.HOP_LENGTH
         )
 
-        self.HALF_BEAT_FRAMES = self.math.floor((60 / self.tempo) * self.UPDATE_HZ / 2)
+        return detected_tempo, {
+            "bass_energy": bass_energy,
+            "rms": rms,
+            "rms_times": rms_times,
+            "beat_times": beat_times,
+        }
+
+    def analysis_stage(self, stage, y, sr):
+        if stage == "tempo":
+            tempo, beat_times = self.librosa.beat.beat_track(y=y, sr=sr, hop_length=self.HOP_LENGTH, units="time")
+            return float(tempo.item()), beat_times
+        if stage == "bass":
+            if self.BASS_BACKEND == "stft":
+                return self.bass_band_stft(y, sr)
+            return self.bass_band_lowband(y, sr)
+        if stage == "rms":
+            return self.librosa.feature.rms(y=y, frame_length=self.N_FFT, hop_length=self.HOP_LENGTH)[0]
+        raise ValueError(f"Unknown analysis stage: {stage}")
+
+    def analysis_config(self):
+        """The plain config values, enough to rebuild this analysis in another process."""
+        return {
+            name: value for name, value in vars(self).items()
+            if name.isupper() and isinstance(value, (int, float, str, bool, type(None)))
+        }
+
+    def bass_band_stft(self, y, sr):
+        S = self.np.abs(self.librosa.stft(y, n_fft=self.N_FFT, hop_length=self.HOP_LENGTH))
+        freqs = self.librosa.fft_frequencies(sr=sr, n_fft=self.N_FFT)
+        return self.np.mean(S[freqs < self.BASS_CUTOFF_HZ, :], axis=0)
+
+    def bass_band_lowband(self, y, sr):
+        """Mean STFT magnitude below BASS_CUTOFF_HZ without computing the full STFT.
+
+        The signal is decimated until the bass band is a small part of the new
+        bandwidth, then only the DFT bins under the cutoff are evaluated with one
+        matrix product. Window length, bin spacing and frame centers are the same
+        as bass_band_stft, so the result lines up with rms_times.
+        """
+        np = self.np
+        n_fft = self.N_FFT
+        hop = self.HOP_LENGTH
+        n_bins = int(np.count_nonzero(np.fft.rfftfreq(n_fft, 1 / sr) < self.BASS_CUTOFF_HZ))
+        n_frames = 1 + len(y) // hop
+
+        # Keep the new Nyquist at least 8x the cutoff, and the hop a whole number of samples
+        decim = 1
+        while hop % (decim * 2) == 0 and sr / (decim * 2) >= 16 * self.BASS_CUTOFF_HZ:
+            decim *= 2
+
+        y_low = self.soxr.resample(y, sr, sr / decim, quality="HQ") if decim > 1 else y
+        n_fft_low = n_fft // decim
+        hop_low = hop // decim
+
+        y_low = np.pad(y_low.astype(np.float32, copy=False), (n_fft_low // 2, n_fft_low // 2 + hop_low))
+        frames = np.lib.stride_tricks.sliding_window_view(y_low, n_fft_low)[::hop_low][:n_frames]
+
+        n = np.arange(n_fft_low)
+        window = 0.5 - 0.5 * np.cos(2 * np.pi * n / n_fft_low)
+        phase = 2 * np.pi * np.outer(n, np.arange(n_bins)) / n_fft_low
+        basis = np.concatenate([window[:, None] * np.cos(phase), window[:, None] * np.sin(phase)], axis=1)
+
+        spec = frames @ basis.astype(np.float32)
+        mag = np.hypot(spec[:, :n_bins], spec[:, n_bins:]) * decim
+        return mag.mean(axis=1)
+
+    def use_streaming_analysis(self):
+        try:
+            info = self.soundfile.info(self.AUDIO_FILE)
+        except Exception:
+            # Not readable by soundfile, only librosa's fallback decoders can load it
+            return False
+        return info.duration > self.STREAM_ANALYSIS_MINUTES * 60
+
+    def compute_analysis_streaming(self, need_tempo=True):
+        """Same tracks as compute_analysis, but decoded and analyzed block by block.
+
+        Only one block of audio and one hop of carry-over are held at a time, so
+        memory does not grow with the length of the song (apart from the output
+        tracks themselves, which are one value per hop).
+        """
+        np = self.np
+        sr = self.ANALYSIS_SR
+        n_fft = self.N_FFT
+        hop = self.HOP_LENGTH
+
+        info = self.soundfile.info(self.AUDIO_FILE)
+        native_sr = info.samplerate
+        resampler = self.soxr.ResampleStream(native_sr, sr, 1, dtype="float32", quality="HQ")
+
+        # Periodic Hann window, same as librosa.stft
+        window = (0.5 - 0.5 * np.cos(2 * np.pi * np.arange(n_fft) / n_fft)).astype(np.float32)
+        bass_bins = np.fft.rfftfreq(n_fft, 1 / sr) < self.BASS_CUTOFF_HZ
+        mel_fb = self.librosa.filters.mel(sr=sr, n_fft=n_fft, fmax=0.5 * sr) if need_tempo else None
+
+        bass_parts, rms_parts, onset_parts = [], [], []
+        onset_state = {"prev": None, "db_max": -np.inf}
+
+        def consume(buf):
+            if len(buf) < n_fft:
+                return buf
+            n_frames = 1 + (len(buf) - n_fft) // hop
+            frames = np.lib.stride_tricks.sliding_window_view(buf, n_fft)[::hop][:n_frames]
+
+            spec = np.abs(np.fft.rfft(frames * window, axis=1))
+            bass_parts.append(spec[:, bass_bins].mean(axis=1))
+            rms_parts.append(np.sqrt(np.mean(frames ** 2, axis=1)))
+
+            if mel_fb is not None:
+                # onset_strength as beat_track calls it: power mel spectrogram in dB, positive first
+                # difference, median over the bands. The 80 dB floor follows the running maximum
+                # instead of the global one.
+                mel_db = 10 * np.log10(np.maximum(1e-10, mel_fb @ (spec.T ** 2)))
+                onset_state["db_max"] = max(onset_state["db_max"], mel_db.max())
+                mel_db = np.maximum(mel_db, onset_state["db_max"] - 80.0)
+                prev = onset_state["prev"]
+                ref = np.concatenate([prev, mel_db[:, :-1]], axis=1) if prev is not None else mel_db[:, :-1]
+                diff = np.maximum(0.0, mel_db[:, -ref.shape[1]:] - ref) if ref.shape[1] else np.zeros((mel_db.shape[0], 0))
+                onset_parts.append(np.median(diff, axis=0))
+                onset_state["prev"] = mel_db[:, -1:]
+
+            return buf[n_frames * hop:]
+
+        # Centered frames, zero padded like librosa (pad_mode="constant")
+        buf = np.zeros(n_fft // 2, dtype=np.float32)
+        samples_in = 0
+        samples_out = 0
+        for block in self.soundfile.blocks(self.AUDIO_FILE, blocksize=self.STREAM_BLOCK_SIZE, dtype="float32", always_2d=True):
+            samples_in += len(block)
+            self.report_progress(f"Analyzing audio... {100 * samples_in // max(1, info.frames)}%")
+            y = resampler.resample_chunk(block.mean(axis=1))
+            samples_out += len(y)
+            buf = consume(np.concatenate([buf, y]))
+
+        y = resampler.resample_chunk(np.zeros(0, dtype=np.float32), last=True)
+        # Match librosa.resample's output length exactly
+        expected = int(np.ceil(samples_in * sr / native_sr))
+        y = y[:max(0, expected - samples_out)]
+        missing = expected - samples_out - len(y)
+        tail = np.zeros(max(0, missing) + n_fft // 2, dtype=np.float32)
+        consume(np.concatenate([buf, y, tail]))
+
+        bass = np.concatenate(bass_parts)
+        rms = np.concatenate(rms_parts).astype(np.float32)
+
+        denom = bass.max() - bass.min()
+        bass_energy = bass / denom if denom > 0 else np.zeros_like(bass)
+        rms_times = self.librosa.frames_to_time(np.arange(len(rms)), sr=sr, hop_length=hop)
+
+        detected_tempo = None
+        beat_times = np.zeros(0)
+        if need_tempo:
+            # lag + n_fft // (2 * hop) leading zeros, as in onset_strength(center=True)
+            onset_env = np.concatenate([np.zeros(1 + n_fft // (2 * hop))] + onset_parts)[:len(rms)]
+            detected_tempo = self.chunked_tempo(onset_env)
+            # Given the tempo, beat tracking is one pass over the envelope
+            _, beat_times = self.librosa.beat.beat_track(
+                onset_envelope=onset_env, sr=sr, hop_length=hop, bpm=detected_tempo, units="time"
+            )
+
+        return detected_tempo, {
+            "bass_energy": bass_energy,
+            "rms": rms,
+            "rms_times": rms_times,
+            "beat_times": beat_times,
+        }
+
+    def chunked_tempo(self, onset_env, chunk=1024):
+        """Global tempo of an onset envelope, like beat_track, without the full tempogram.
+
+        The mean tempogram is summed a thousand columns at a time, so the
+        (384 x frames) autocorrelation matrix never exists for long songs.
+        """
+        np = self.np
+        sr = self.ANALYSIS_SR
+        hop = self.HOP_LENGTH
+        win = self.librosa.time_to_frames(8.0, sr=sr, hop_length=hop).item()
+
+        # Same centering as tempogram(center=True)
+        padded = np.pad(onset_env, (win // 2, win // 2), mode="linear_ramp", end_values=[0, 0])
+        tg_sum = np.zeros(win)
+        for start in range(0, len(onset_env), chunk):
+            stop = min(start + chunk, len(onset_env))
+            tg = self.librosa.feature.tempogram(
+                onset_envelope=padded[start:stop + win - 1], sr=sr,
+                hop_length=hop, win_length=win, center=False
+            )
+            tg_sum += tg.sum(axis=1)
 
-        print(f"Finished analyzing\n{'Detected' if self.confirm_self_tempo != 'y' else 'User entered'} BPM: {self.tempo}\nSetting up windows...")
+        tg_mean = (tg_sum / max(1, len(onset_env)))[:, None]
+        tempo = self.librosa.feature.tempo(tg=tg_mean, sr=sr, hop_length=hop, aggregate=None)
+        return float(tempo.item())
 
     # -------------------------------------------------
-    # Utility helpers
+    # Analysis cache
+
+    CACHED_TRACKS = ("bass_energy", "rms", "rms_times", "beat_times")
+    # Times stay float64: float32 is only good to about 0.25 ms past 45 minutes, and the beat grid is built from them
+    CACHED_DTYPES = {"bass_energy": "float32", "rms": "float32", "rms_times": "float64", "beat_times": "float64"}
+    # A .tmp- folder older than this was left by a crashed writer, younger ones may still be written
+    STALE_TMP_SECONDS = 3600
+
+    def analysis_cache_key(self):
+        h = self.hashlib.sha1()
+        with open(self.AUDIO_FILE, "rb") as f:
+            for chunk in iter(lambda: f.read(1 << 20), b""):
+                h.update(chunk)
+        h.update(self.analysis_params().encode())
+        return h.hexdigest()
+
+    def analysis_params(self):
+        """Everything besides the file's contents that the analysis of AUDIO_FILE depends on."""
+        # Package metadata instead of librosa.__version__, so a cache hit never imports librosa
+        from importlib.metadata import version
+
+        # Streamed songs always take their bass from the STFT bins, whatever BASS_BACKEND says
+        backend = "stream" if self.use_streaming_analysis() else self.BASS_BACKEND
+        return f"sr={self.ANALYSIS_SR};n_fft={self.N_FFT};hop={self.HOP_LENGTH};bass={self.BASS_CUTOFF_HZ};backend={backend};librosa={version('librosa')}"
+
+    def load_cached_analysis(self, key):
+        path = self.os.path.join(self.CACHE_DIR, key)
+        meta_path = self.os.path.join(path, "meta.json")
+        try:
+            with open(meta_path) as f:
+                meta = self.json.load(f)
+            tracks = {
+                name: self.np.load(self.os.path.join(path, f"{name}.npy"), mmap_mode="r")
+                for name in self.CACHED_TRACKS
+            }
+            if any(tracks[name].dtype != self.CACHED_DTYPES[name] for name in self.CACHED_TRACKS):
+                # Saved with float32 times by an older version, analyzed again and saved over
+                return None
+            # Touch the entry so eviction drops the least recently used songs first
+            self.os.utime(meta_path)
+        except (OSError, ValueError, KeyError):
+            return None
+        return meta.get("tempo"), tracks
+
+    def save_cached_analysis(self, key, tempo, tracks):
+        try:
+            self.os.makedirs(self.CACHE_DIR, exist_ok=True)
+            tmp = self.tempfile.mkdtemp(dir=self.CACHE_DIR, prefix=".tmp-")
+            for name in self.CACHED_TRACKS:
+                self.np.save(self.os.path.join(tmp, f"{name}.npy"), self.np.ascontiguousarray(tracks[name], dtype=self.CACHED_DTYPES[name]))
+            with open(self.os.path.join(tmp, "meta.json"), "w") as f:
+                self.json.dump({"tempo": tempo, "audio_file": self.os.path.basename(self.AUDIO_FILE)}, f)
+
+            final = self.os.path.join(self.CACHE_DIR, key)
+            if self.os.path.isdir(final):
+                self.shutil.rmtree(final, ignore_errors=True)
+            self.os.replace(tmp, final)
+        except OSError as err:
+            print(f"Error writing analysis cache:\n\t{err}")
+            return
 
-    def random_hex_color(self):
-        return "#{:02X}{:02X}{:02X}".format(
-            self.random.randint(0,255),
-            self.random.randint(0,255),
-            self.random.randint(0,255)
-        )
+        self.evict_analysis_cache(keep=key)
 
-    def hex_to_rgb(self, c):
-        c = c.lstrip("#")
-        return self.np.array([int(c[i:i+2],16) for i in (0,2,4)], dtype=float)
+    def evict_analysis_cache(self, keep=None):
+        if self.CACHE_MAX_MB is None:
+            return
 
-    def rgb_to_hex(self, rgb):
-        return "#{:02X}{:02X}{:02X}".format(*rgb.astype(int))
+        entries = []
+        total = 0
+        for name in self.os.listdir(self.CACHE_DIR):
+            path = self.os.path.join(self.CACHE_DIR, name)
+            if not self.os.path.isdir(path):
+                continue
+            if name.startswith(".tmp-"):
+                # Another process (preanalyze.py, a prefetch) may be about to move it into place
+                try:
+                    if self.time.time() - self.os.stat(path).st_mtime > self.STALE_TMP_SECONDS:
+                        self.shutil.rmtree(path, ignore_errors=True)
+                except OSError:
+                    pass
+                continue
+            try:
+                size = sum(e.stat().st_size for e in self.os.scandir(path))
+                used = self.os.stat(self.os.path.join(path, "meta.json")).st_mtime
+            except OSError:
+                # Half-written or broken entry
+                size, used = 0, 0.0
+            entries.append((used, size, name, path))
+            total += size
+
+        limit = self.CACHE_MAX_MB * 1024 * 1024
+        for used, size, name, path in sorted(entries):
+            if total <= limit:
+                break
+            if name == keep:
+                continue
+            self.shutil.rmtree(path, ignore_errors=True)
+            total -= size
 
-    def get_window_pos(self, win):
-        geo = win.geometry().split("+")
-        return [int(geo[1]), int(geo[2])]
+    # -------------------------------------------------
+    # Compiled shows
+
+    def show_cache_key(self, engine, tempo, beat_times, art):
+        # Everything the frames depend on besides the tracks (the analysis key covers those)
+        settings = {name: value for name, value in vars(engine).items() if name.isupper()}
+        settings.update(
+            screen=(engine.screen_width, engine.screen_height), fps=self.UPDATE_HZ, tempo=tempo,
+            beats=len(beat_times), image=art is not None, seed=self.SEED,
+        )
+        return self.hashlib.sha1(self.json.dumps(settings, sort_keys=True, default=str).encode()).hexdigest()
+
+    def load_or_compile_show(self, analysis_key, tempo, bass_energy, rms, beat_times, art):
+        """The DanceShow of a song, loaded from next to its analysis or compiled (and saved there).
+
+        With SEED None the seed is picked when the show is compiled and kept
+        with it, so every replay is the same dance until a setting changes.
+        """
+        engine = DanceEngine(self, (self.engine.screen_width, self.engine.screen_height))
+        key = self.show_cache_key(engine, tempo, beat_times, art)
+        path = self.os.path.join(self.CACHE_DIR, analysis_key) if self.CACHE_DIR and analysis_key else None
+        meta_path = self.os.path.join(path, "show.json") if path else None
+
+        if path:
+            try:
+                with open(meta_path) as f:
+                    meta = self.json.load(f)
+                if meta["key"] == key:
+                    return DanceShow.load(self.np, path, "show_", meta["fps"])
+            except (OSError, ValueError, KeyError):
+                pass
+
+        start = self.time.perf_counter()
+        seed = self.SEED if self.SEED is not None else int.from_bytes(self.os.urandom(4), "little")
+        engine.random.seed(seed)
+        engine.load_tracks(bass_energy, rms, tempo, beat_times=beat_times)
+        engine.has_image = [art is not None] * engine.DANCERS
+        show = engine.compile_show(self.UPDATE_HZ)
+        print(f"Compiled {show.n_frames} frames in {self.time.perf_counter() - start:.2f} s")
+
+        if path:
+            try:
+                self.os.makedirs(path, exist_ok=True)
+                # The old show stops counting before its files are replaced
+                if self.os.path.exists(meta_path):
+                    self.os.remove(meta_path)
+                show.save(path, "show_")
+                with open(meta_path, "w") as f:
+                    self.json.dump({"key": key, "fps": show.fps, "seed": seed}, f)
+            except OSError as err:
+                print(f"Error writing compiled show:\n\t{err}")
+        return show
 
-    def extract_and_display_image(self, audio_file, canvas):
+    # -------------------------------------------------
+    # Utility helpers
+
+    def load_album_art(self, audio_file, cache_key=None):
+        """PIL image of the first embedded cover at SQUARE_SIZE, None without one.
+
+        Safe off the Tk thread. With the song's analysis cache key the resized
+        thumbnail (or the fact that there is none) is stored in its cache entry,
+        so a repeat play decodes one small PNG instead of the tags and the cover.
+        """
+        thumb_path = none_path = None
+        entry = self.os.path.join(self.CACHE_DIR, cache_key) if cache_key and self.CACHE_DIR else None
+        if entry and self.os.path.isdir(entry):
+            thumb_path = self.os.path.join(entry, f"art-{self.SQUARE_SIZE}.png")
+            none_path = self.os.path.join(entry, "art-none")
+            if self.os.path.exists(none_path):
+                return None
+            try:
+                img = self.Image.open(thumb_path)
+                img.load()
+                return img
+            except OSError:
+                pass
+
+        img = None
         try:
             tags = self.ID3(audio_file)
             for tag in tags.getall("APIC"):
                 img = self.Image.open(self.BytesIO(tag.data))
                 img = img.resize((self.SQUARE_SIZE, self.SQUARE_SIZE), self.Image.Resampling.LANCZOS)
-                tk_img = self.ImageTk.PhotoImage(img)
-
-                canvas.image = tk_img
-                canvas.create_image(0, 0, anchor="nw", image=tk_img)
-                return True
+                break
         except Exception:
-            pass
-        return False
-    
+            img = None
+
+        try:
+            if img is not None and thumb_path:
+                img.save(thumb_path)
+            elif img is None and none_path:
+                open(none_path, "w").close()
+        except OSError as err:
+            print(f"Error writing album art cache:\n\t{err}")
+        return img
+
+    def show_album_art(self, art):
+        self.backend.show_art(art)
+        has_image = [art is not None] * len(self.canvases)
+
+        def set_has_image():
+            self.engine.has_image = has_image
+
+        self.change_engine(set_has_image)
+
     def set_geometry_cached(self, win, x, y):
         x = int(x)
         y = int(y)
         key = id(win)
         last = self._last_geom.get(key)
         if last != (x, y):
-            win.geometry(f"+{x}+{y}")
+            self.backend.move(win, x, y)
             self._last_geom[key] = (x, y)
 
     def set_bg_cached(self, widget, color):
         key = id(widget)
         if self._last_bg.get(key) != color:
-            widget.config(bg=color)
+            self.backend.set_color(widget, color)
             self._last_bg[key] = color
 
-    # -------------------------------------------------
-    # Dancer/Pillar windows + flash
-
-    def make_dancer_window(self):
-        win = self.tk.Toplevel(self.root)
-        win.overrideredirect(True)
-        win.geometry(f"{self.SQUARE_SIZE}x{self.SQUARE_SIZE}+0+0")
-
-        canvas = self.tk.Canvas(
-            win,
-            width=self.SQUARE_SIZE,
-            height=self.SQUARE_SIZE,
-            highlightthickness=0
-        )
-        canvas.pack(fill="both", expand=True)
-
-        return win, canvas
-
-    def make_pillar_window(self, sz, v = True):
-        win = self.tk.Toplevel(self.root)
-        win.overrideredirect(True)
-
-        if v:
-            win.geometry(f"{self.PILLAR_WIDTH}x{sz}+0+0")
-        else:
-            win.geometry(f"{sz}x{self.PILLAR_WIDTH}+0+0")
-
-        return win
+    def commit_frame(self):
+        self.backend.commit()
 
     def trigger_flash(self, canvas, color="#FFFFFF"):
-        return canvas.create_rectangle(
-            0, 0, self.SQUARE_SIZE, self.SQUARE_SIZE,
-            fill=color, outline=""
-        )
-
-    def update_flash(self, canvas, rect, timer):
-        if rect is None:
-            return None, 0
-
-        timer -= 1
+        self.backend.flash(canvas, color)
 
-        if timer <= 0:
-            canvas.delete(rect)
-            return None, 0
-
-        return rect, timer
+    def clear_flash(self, canvas):
+        self.backend.clear_flash(canvas)
 
     # -------------------------------------------------
     # Windows + audio
 
     def setup_windows(self):
+        self.launch_time = self.time.perf_counter()
+
         self.root = self.tk.Tk()
         self.root.title(self.AUDIO_FILE.rsplit(".",1)[0])
         self.root.config(bg="#000000")
         self.root.resizable(False, False)
 
         sw, sh = self.root.winfo_screenwidth(), self.root.winfo_screenheight()
-        self.BASE_X = sw//2 - self.W_WIDTH//2
-        self.BASE_Y = sh//2 - self.W_HEIGHT//2
-
-        self.DEFAULT_D1_POS = [int(self.BASE_X/1.55), int(self.BASE_Y*1.15)]
-        self.DEFAULT_D2_POS = [int(self.BASE_X*1.8), int(self.BASE_Y*1.15)]
-
-        self.pillar_pos = [
-            [0, 0],                             # Left Piller
-            [int(sw - self.PILLAR_WIDTH), 0],   # Right Piller
-            [0, int(sh - self.PILLAR_WIDTH)],   # Bottom Piller
-            [0, 0]                              # Top Piller
-        ]
-        self.root.geometry(f"{self.W_WIDTH}x{self.W_HEIGHT}+{self.BASE_X}+{self.BASE_Y}")
-
-        self.dancer1, self.canvas1 = self.make_dancer_window()
-        self.dancer2, self.canvas2 = self.make_dancer_window()
-        self.pillar1 = self.make_pillar_window(sh)
-        self.pillar2 = self.make_pillar_window(sh)
-        self.pillar3 = self.make_pillar_window(sw, False)
-        self.pillar4 = self.make_pillar_window(sw, False)
-
-        for d in (self.dancer1, self.dancer2, self.pillar1, self.pillar2, self.pillar3, self.pillar4):
-            d.config(bg="#a00000")
-
-        for c in (self.canvas1, self.canvas2):
-            c.config(bg="#a00000")
-
-        self.dancer1.geometry(f"+{self.DEFAULT_D1_POS[0]}+{self.DEFAULT_D1_POS[1]}")
-        self.dancer2.geometry(f"+{self.DEFAULT_D2_POS[0]}+{self.DEFAULT_D2_POS[1]}")
-
-        for [pos_x, pos_y], pillar in zip(self.pillar_pos, [self.pillar1, self.pillar2, self.pillar3, self.pillar4]):
-            pillar.geometry(f"+{pos_x}+{pos_y}")
-
-        print("\nFinished setting up windows\nWaiting for user input on main window...")
+        self.engine = DanceEngine(self, (sw, sh), seed=self.SEED)
+        self.BASE_X, self.BASE_Y = self.engine.BASE_X, self.engine.BASE_Y
+
+        self.backend = self.RENDER_BACKENDS[self.RENDER_BACKEND](self)
+        self.backend.setup(self.engine)
+        self.windows = self.backend.windows
+        self.canvases = self.backend.canvases
+        if self.LIVE_SOURCE is not None:
+            # Live input has no song to seek in or align to
+            self.backend.start({})
+        else:
+            self.backend.start({
+                # Live AV offset calibration
+                "bracketleft": lambda: self.nudge_av_offset(-5),
+                "bracketright": lambda: self.nudge_av_offset(5),
+                # Transport: pause, seek and an A-B loop
+                "space": self.toggle_pause,
+                "Left": lambda: self.seek_by(-self.SEEK_SECONDS),
+                "Right": lambda: self.seek_by(self.SEEK_SECONDS),
+                "a": self.set_loop_start,
+                "b": self.set_loop_end,
+                "c": self.clear_loop,
+            })
+
+        print("\nFinished setting up windows")
 
     def setup_audio(self):
-        self.pygame.mixer.pre_init(44100, -16, 2, 512)
-        self.pygame.mixer.init()
-        self.pygame.mixer.music.load(self.AUDIO_FILE)
-        self.pygame.mixer.music.set_volume(self.VOLUME)
+        self.setup_mixer()
+        self.player.load(self.AUDIO_FILE, self.sound)
+
+    def setup_mixer(self):
+        # Done before the analysis with SINGLE_DECODE, so it can decode into mixer Sounds
+        if self.player is not None:
+            return
+        mixer = self.pygame.mixer
+        if mixer.get_init():
+            # Started elsewhere (a pygame.init()) at its defaults, pre_init would be ignored
+            mixer.quit()
+        mixer.pre_init(*self.MIXER_FORMAT, self.AUDIO_BUFFER)
+        mixer.init()
+        self.player = AudioPlayer(self.pygame, self.time.perf_counter)
+        self.player.set_volume(self.VOLUME)
+        # Decoded Sounds are built for MIXER_FORMAT, a device that settled on another one plays from the file
+        self.decode_for_playback = self.SINGLE_DECODE and mixer.get_init() == self.MIXER_FORMAT
+        if mixer.get_init() != self.MIXER_FORMAT:
+            print(f"Mixer opened as {mixer.get_init()} instead of {self.MIXER_FORMAT}, songs stream from their files")
+
+    def audio_latency(self):
+        """Seconds between a position report and the sound being heard."""
+        if self.AUDIO_LATENCY_MS is not None:
+            return self.AUDIO_LATENCY_MS / 1000
+        # get_pos() counts what was handed to the mixer, which is heard one buffer later
+        init = self.pygame.mixer.get_init()
+        freq = init[0] if init else 44100
+        return self.AUDIO_BUFFER / freq
+
+    def nudge_av_offset(self, ms):
+        self.AV_OFFSET_MS += ms
+        if self.playback_clock:
+            self.playback_clock.offset = self.AV_OFFSET_MS / 1000
+        print(f"AV offset: {self.AV_OFFSET_MS} ms")
 
     # -------------------------------------------------
     # State
 
     def setup_state(self):
-        self.angle = 0.0
-        self.jump_velocity = 0.0
-        self.pillar_jump_velocity = 0.0
-        self.orbit_radius = self.ORBIT_RADIUS
+        # Playlist: the song playing, the next one once prefetched, and whether it is queued
+        self.current_track = None
+        self.first_track = None
+        self.next_track = None
+        self.next_queued = False
+        self.prefetching = False
+        self.music_t = 0.0
 
-        # Swing / orbit
-        self.angle_accumulator = 0.0
-        self.speed_boost_timer = 0
-        self.gate_cooldown_timer = 0
-        self.boost_timer = 0
+        self.is_running = False
 
-        self.orbit_radius_current = self.ORBIT_RADIUS
-        self.orbit_radius_target = self.ORBIT_RADIUS
+        # Transport: song time of the last play(start=...), pause, and the A-B loop
+        self.seek_offset = 0.0
+        self.paused = False
+        self.loop_a = None
+        self.loop_b = None
+        self.frame_job = None
 
-        # Teleport / easing
-        self.teleport_timer = 0
-        self.speed_boost_timer = 0
-        self.TELEPORT_EASE_FRAMES = max(3, self.UPDATE_HZ // 15)
-
-        self.teleport_d1_start = [0, 0]
-        self.teleport_d2_start = [0, 0]
-        self.teleport_d1_target = [0, 0]
-        self.teleport_d2_target = [0, 0]
-
-        # Background / dancer colors
-        self.bg_color = self.np.array([0, 0, 0], dtype=float)
-        self.bg_target = self.np.array([0, 0, 0], dtype=float)
-        self.bg_dancer1_color = self.np.array([0, 0, 0], dtype=float)
-        self.bg_dancer1_target = self.np.array([160, 0, 0], dtype=float)
-        self.bg_dancer2_color = self.np.array([0, 0, 0], dtype=float)
-        self.bg_dancer2_target = self.np.array([160, 0, 0], dtype=float)
-        self.bg_dancer1_teleport_target = self.np.array([0, 0, 0], dtype=float)
-        self.bg_dancer2_teleport_target = self.np.array([0, 0, 0], dtype=float)
-
-        # Background / Pillar colors
-        self.bg_pillar1_color = self.np.array([0, 0, 0], dtype=float)
-        self.bg_pillar1_target = self.np.array([160, 0, 0], dtype=float)
-        self.bg_pillar2_color = self.np.array([0, 0, 0], dtype=float)
-        self.bg_pillar2_target = self.np.array([160, 0, 0], dtype=float)
-        self.bg_pillar3_color = self.np.array([0, 0, 0], dtype=float)
-        self.bg_pillar3_target = self.np.array([160, 0, 0], dtype=float)
-        self.bg_pillar4_color = self.np.array([0, 0, 0], dtype=float)
-        self.bg_pillar4_target = self.np.array([160, 0, 0], dtype=float)
-
-        # Images
-        self.has_image1 = False
-        self.has_image2 = False
-
-        self.FLASH_FRAMES = max(3, self.UPDATE_HZ // 17)
-        self.flash_timer_1 = 0
-        self.flash_timer_2 = 0
-        self.flash_rect_1 = None
-        self.flash_rect_2 = None
+        # Smoothed playback time, started with each song in start_frame_clock
+        self.playback_clock = None
 
-        self.is_running = False
+        # Songs play through the AudioPlayer made by setup_mixer
+        self.player = None
+        self.sound = None
+
+        # The song's compiled DanceShow with COMPILE_SHOW, played instead of stepping the engine
+        self.show = None
+
+        # Live mode: the input, its analysis, and the block-arrival-to-commit time of each analyzed frame
+        self.live_input = None
+        self.live_analyzer = None
+        self.live_start = 0.0
+        self.live_latency = []
 
         # Geometry cache
         self._last_geom = {}
@@ -327,337 +3132,655 @@ class WindowDance:
         # Background color cache
         self._last_bg = {}
 
-        # RMS cursor
-        self.rms_cursor = 0
+        # Frame profiler, None when PROFILE is off
+        self.profiler = None
+        if self.PROFILE:
+            self.enable_profiler()
+
+        # Frame scheduler, and the governor made with each start (None when GOVERNOR is off)
+        self.governor = None
+        self.producer = None
+        self.frame_period = 1 / self.UPDATE_HZ
+        self.next_deadline = 0.0
+        self.last_tick = 0.0
+        self.frames_ticked = 0
+        self.frames_missed = 0
+        # Sum of squared differences between tick intervals and frame_period
+        self.tick_error_sq = 0.0
 
     # -------------------------------------------------
-    # Main update loop
+    # Profiling
 
-    def update_loop(self):
-        # If music stopped -> reset
-        if not self.pygame.mixer.music.get_busy():
-            self.angle_accumulator = 0.0
-            self.jump_velocity = 0.0
-            self.orbit_radius_current = self.ORBIT_RADIUS
-            self.orbit_radius_target = self.ORBIT_RADIUS
-            self.speed_boost_timer = 0
-            self.gate_cooldown_timer = 0
-            self.teleport_timer = 0
-            self.TELEPORT_EASE_FRAMES = max(3, self.UPDATE_HZ // 15)
-            self.teleport_d1_start = [0, 0]
-            self.teleport_d2_start = [0, 0]
-            self.teleport_d1_target = [0, 0]
-            self.teleport_d2_target = [0, 0]
-            self.rms_cursor = 0
-            self._last_bg.clear()
-            self._last_geom.clear()
-
-            self.set_geometry_cached(self.dancer1, self.DEFAULT_D1_POS[0], self.DEFAULT_D1_POS[1])
-            self.set_geometry_cached(self.dancer2, self.DEFAULT_D2_POS[0], self.DEFAULT_D2_POS[1])
-
-            for [pos_x, pos_y], pillar in zip(self.pillar_pos, [self.pillar1, self.pillar2, self.pillar3, self.pillar4]):
-                self.set_geometry_cached(pillar, pos_x, pos_y)
-
-            self.set_geometry_cached(self.root, self.BASE_X, self.BASE_Y)
-            self.root.config(bg="#000000")
-
-            self.is_running = False
-            self.start_button.pack(expand=True)
-            return
+    def enable_profiler(self):
+        prof = self.profiler = FrameProfiler(self.np, self.time.perf_counter)
 
-        sin = self.math.sin
-        cos = self.math.cos
+        # Counting wrappers replace the cached setters on this instance only,
+        # so the unprofiled path runs the plain methods untouched
+        set_geometry = self.set_geometry_cached
+        set_bg = self.set_bg_cached
 
-        t = self.pygame.mixer.music.get_pos() / 1000
-        while (
-            self.rms_cursor + 1 < len(self.rms_times)
-            and self.rms_times[self.rms_cursor + 1] <= t
-        ):
-            self.rms_cursor += 1
+        def set_geometry_counted(win, x, y):
+            if self._last_geom.get(id(win)) == (int(x), int(y)):
+                prof.geom_skipped += 1
+            else:
+                prof.geom_issued += 1
+            set_geometry(win, x, y)
 
-        rms_idx = self.rms_cursor
-        bass_idx = min(rms_idx, len(self.bass_energy) - 1)
+        def set_bg_counted(widget, color):
+            if self._last_bg.get(id(widget)) == color:
+                prof.bg_skipped += 1
+            else:
+                prof.bg_issued += 1
+            set_bg(widget, color)
+
+        self.set_geometry_cached = set_geometry_counted
+        self.set_bg_cached = set_bg_counted
+        # The variants with the hooks, see ProfiledMethod
+        self.update_loop = self.update_loop_profiled
+        self.update_live = self.update_live_profiled
+        self.apply_frame = self.apply_frame_profiled
+        if not self.FRAME_THREAD:
+            # Its laps would land in whatever frame the Tk thread is timing
+            self.engine.profiler = prof
+            self.engine.step = self.engine.step_profiled
+
+    def setup_profile_overlay(self):
+        self.profile_label = self.tk.Label(
+            self.root, justify="left", anchor="nw",
+            font=("Consolas", 9), fg="#FFFFFF", bg="#000000"
+        )
+        self.profile_label.place(x=4, y=4)
+        self.update_profile_overlay()
+
+    def update_profile_overlay(self):
+        prof = self.profiler
+        recent = prof.totals[-self.UPDATE_HZ:]
+        if recent:
+            ms = self.np.asarray(recent) * 1000
+            p50, p95, p99 = self.np.percentile(ms, [50, 95, 99])
+            self.profile_label.config(text=(
+                f"frame p50 {p50:.2f} / p95 {p95:.2f} / p99 {p99:.2f} ms\n"
+                f"missed {self.frames_missed}\n"
+                f"geometry {prof.geom_issued} issued / {prof.geom_skipped} skipped\n"
+                f"bg {prof.bg_issued} issued / {prof.bg_skipped} skipped"
+                + (f"\ngovernor {self.governor.LEVELS[self.governor.level]}" if self.governor is not None else "")
+            ))
+        self.root.after(500, self.update_profile_overlay)
+
+    def export_profile(self):
+        summary = self.profiler.export(self.PROFILE_OUTPUT, {
+            "update_hz": self.UPDATE_HZ,
+            "frames_ticked": self.frames_ticked,
+            "frames_missed": self.frames_missed,
+            "tick_jitter_ms": self.tick_jitter_ms(),
+            "clock": self.playback_clock.jitter() if self.playback_clock else None,
+            "governor": self.governor.summary() if self.governor is not None else None,
+        })
+        total = summary["total"]
+        if total:
+            print(f"Frame time p50 {total['p50_ms']:.2f} ms, p95 {total['p95_ms']:.2f} ms, p99 {total['p99_ms']:.2f} ms")
+        print(f"Profile written to {self.PROFILE_OUTPUT}.json / .csv")
 
-        # -------- ADAPTIVE GATE --------
-        if rms_idx < len(self.rms):
-            window = self.rms[max(0, rms_idx - 20):rms_idx + 1]
-            noise_floor = self.np.median(window) if len(window) else self.rms[rms_idx]
-        else:
-            noise_floor = self.rms[-1]
+    # -------------------------------------------------
+    # Frame scheduler
+
+    def start_frame_clock(self):
+        now = self.time.perf_counter()
+        self.frame_period = 1 / self.UPDATE_HZ
+        self.next_deadline = now
+        self.last_tick = now - self.frame_period
+        self.frames_ticked = 0
+        self.frames_missed = 0
+        self.tick_error_sq = 0.0
+
+        if self.FRAME_THREAD and self.live_input is None:
+            self.producer = FrameProducer(
+                self.threading, self.compute_frame, self.engine.rest_positions,
+                self.engine.DANCERS, self.frame_period, self.MAX_FRAME_DT,
+            )
 
-        adaptive_gate = noise_floor * self.GATE_MULTIPLIER
+        if self.GOVERNOR:
+            engine = self.engine
+            self.governor = FrameGovernor(
+                self.time.perf_counter, self.frame_period, len(engine.WINDOWS), range(engine.PILLAR1, len(engine.WINDOWS)),
+                self.GOVERNOR_HIGH, self.GOVERNOR_LOW, self.GOVERNOR_HOLD, self.GOVERNOR_MIN_MOVE,
+            )
 
-        is_gated = (
-            rms_idx < len(self.rms)
-            and self.rms[rms_idx] < adaptive_gate
-            and (noise_floor - self.rms[rms_idx]) > self.MIN_GATE_DROP
-        )
+        self.playback_clock = PlaybackClock(self.time.perf_counter, self.audio_latency(), self.AV_OFFSET_MS / 1000)
+
+    def begin_frame(self):
+        """Seconds since the previous tick, capped at MAX_FRAME_DT."""
+        now = self.time.perf_counter()
+        dt = now - self.last_tick
+        self.last_tick = now
+        self.frames_ticked += 1
+        self.tick_error_sq += (dt - self.frame_period) ** 2
+        return min(dt, self.MAX_FRAME_DT)
+
+    def tick_jitter_ms(self):
+        """RMS difference between the tick intervals and the frame period, in ms."""
+        return self.math.sqrt(self.tick_error_sq / max(1, self.frames_ticked)) * 1000
+
+    def schedule_next_frame(self):
+        period = self.frame_period
+        self.next_deadline += period
+        now = self.time.perf_counter()
+
+        missed = 0
+        if now > self.next_deadline:
+            # Overran the slot: drop the missed ones instead of bursting to catch up
+            missed = int((now - self.next_deadline) / period) + 1
+            self.frames_missed += missed
+            self.next_deadline += missed * period
+        if self.governor is not None:
+            self.governor.record(now - self.last_tick, missed)
+
+        self.frame_job = self.root.after(int((self.next_deadline - now) * 1000), self.update_loop)
 
-        # -------- SWING --------
-        swing_freq = (self.tempo / 2) / 60
-        base_speed = swing_freq / self.UPDATE_HZ
-        speed_multiplier = 1.0
+    # -------------------------------------------------
+    # Main update loop
 
-        if self.speed_boost_timer > 0:
-            speed_lerp = self.speed_boost_timer / self.HALF_BEAT_FRAMES
-            speed_multiplier = 1 + (self.BASS_SPEED_BOOST - 1) * speed_lerp
-            self.speed_boost_timer -= 1
+    @ProfiledMethod
+    def update_loop(self):
+        if self.live_input is not None:
+            self.update_live()
+            return
 
-        self.angle_accumulator += base_speed * speed_multiplier
+        if self.paused:
+            # get_busy() is False while paused, resume() starts the loop again
+            return
 
-        raw_sine = sin(t * swing_freq * 2 * self.math.pi)
-        raw_fast = sin(t * (self.tempo / 1.4 / 60) * 1.5 * self.math.pi)
+        if not self.player.get_busy() and self.prefetching:
+            # The next song isn't analyzed yet, hold the dance until it is
+            self.frame_job = self.root.after(100, self.update_loop)
+            return
 
-        swing_x = 150 * (abs(raw_sine) ** 0.5 * (1 if raw_sine > 0 else -1))
-        swing_y = 100 * (abs(raw_fast) ** 0.6 * (1 if raw_fast <= 0 else -1))
+        if not self.player.get_busy() and self.next_track is not None:
+            # It was ready too late to be queued
+            self.player.load(self.next_track["file"], self.next_track["sound"])
+            self.player.play()
+            self.switch_track(self.next_track, keep_state=True)
 
-        # -------- BASS then shrink ORBIT RADIUS --------
-        bass_strength = self.bass_energy[bass_idx]
+        # If music stopped -> reset
+        if not self.player.get_busy():
+            if self.current_track is not self.first_track:
+                # Back to the top of the playlist for the next Start
+                self.player.load(self.first_track["file"], self.first_track["sound"])
+                self.switch_track(self.first_track, keep_state=False, prefetch=False)
+            self.rest_windows()
+            jitter = self.playback_clock.jitter()
+            print(f"Clock jitter: {jitter['raw_jitter_ms']:.2f} ms raw, {jitter['smoothed_jitter_ms']:.2f} ms smoothed")
+            return
 
-        if bass_strength > 0.65:
-            self.orbit_radius_current = self.ORBIT_RADIUS * (
-                1 - bass_strength * (1 - self.BASS_RADIUS_PULL)
-            )
-            self.orbit_radius_target = self.ORBIT_RADIUS
-            self.boost_timer = self.HALF_BEAT_FRAMES
+        dt = self.begin_frame()
 
-        if self.boost_timer > 0:
-            lerp = self.boost_timer / self.HALF_BEAT_FRAMES
-            self.orbit_radius_current = (
-                self.orbit_radius_target * (1 - lerp) +
-                self.orbit_radius_current * lerp
-            )
-            self.boost_timer -= 1
-        else:
-            self.orbit_radius_current = (
-                self.orbit_radius_current * 0.9 +
-                self.ORBIT_RADIUS * 0.1
-            )
+        prof = self.profiler
+        if prof:
+            prof.start_frame()
 
-        # -------- BASS then SPEED BOOST --------
-        if bass_strength > self.BASS_SPEED_THRESHOLD:
-            self.speed_boost_timer = self.HALF_BEAT_FRAMES
-
-        # -------- BASS then JUMP --------
-        if bass_strength > self.JUMP_BASS_THRESHOLD and self.jump_velocity > -self.JUMP_REARM_VELOCITY:
-            self.jump_velocity = self.WINDOW_JUMP
-            self.pillar_jump_velocity = self.WINDOW_JUMP * 1.6
-            for i in range(3):
-                self.bg_color[i] = 255
-                self.bg_target[i] = 0
-
-            # Dancer1 flash
-            if not self.has_image1:
-                for i in range(3):
-                    self.bg_dancer1_target[i] = self.bg_dancer1_teleport_target[i]
-                    self.bg_dancer1_color[i] = 255
-            else:
-                if self.flash_rect_1:
-                    self.canvas1.delete(self.flash_rect_1)
-                self.flash_rect_1 = self.trigger_flash(self.canvas1)
-                self.flash_timer_1 = self.FLASH_FRAMES
-
-            # Dancer2 flash
-            if not self.has_image2:
-                for i in range(3):
-                    self.bg_dancer2_target[i] = self.bg_dancer2_teleport_target[i]
-                    self.bg_dancer2_color[i] = 255
-            else:
-                if self.flash_rect_2:
-                    self.canvas2.delete(self.flash_rect_2)
-                self.flash_rect_2 = self.trigger_flash(self.canvas2)
-                self.flash_timer_2 = self.FLASH_FRAMES
+        pos = self.update_playlist(self.player.get_pos() / 1000)
+        if self.loop_b is not None and self.seek_offset + pos >= self.loop_b:
+            self.seek(self.loop_a)
+            pos = 0.0
 
-            # Pillar flash
-            for bg_color in [self.bg_pillar1_color, self.bg_pillar2_color, self.bg_pillar3_color, self.bg_pillar4_color]:
-                for i in range(3):
-                    bg_color[i] = 255
+        t = self.playback_clock.update(self.seek_offset + pos)
+        if self.producer is not None:
+            # The frame thread computed this tick's frame during the last one, the next one starts now
+            frame = self.producer.take()
+            self.producer.request(t + self.frame_period)
+            if prof:
+                prof.lap("take_frame")
+        else:
+            frame = self.compute_frame(t, dt)
+            if prof and self.show is not None:
+                prof.lap("show_lookup")
+        if frame is not None:
+            self.apply_frame(frame)
 
-        cx = cos(self.angle_accumulator) * self.orbit_radius_current
-        cy = sin(self.angle_accumulator) * self.orbit_radius_current
-        vY = cos(self.angle_accumulator) * swing_y
+        if prof:
+            prof.end_frame()
 
-        center_x = self.BASE_X + self.W_WIDTH // 3.6 + swing_x
-        center_y = self.BASE_Y + self.W_HEIGHT // 3.6 + swing_y
+        self.schedule_next_frame()
 
-        # -------- JUMP PHYSICS --------
-        self.jump_velocity += self.JUMP_GRAVITY
-        self.jump_velocity *= self.JUMP_DAMPING
-        self.pillar_jump_velocity += self.JUMP_GRAVITY * 1.4
-        self.pillar_jump_velocity *= self.JUMP_DAMPING
+    def compute_frame(self, t, dt):
+        return self.show.frame_at(t) if self.show is not None else self.engine.step(t, dt)
 
-        jump_offset = self.jump_velocity
-        pillar_jump_offset = self.pillar_jump_velocity
-        if abs(jump_offset) < 3.0:
-            jump_offset = 0.0
-        if abs(pillar_jump_offset) < 3.0:
-            pillar_jump_offset = 0.0
+    def change_engine(self, change):
+        """Run change(), which changes the engine or the show, on the thread that steps them."""
+        if self.producer is not None:
+            self.producer.send(change)
+        else:
+            change()
+
+    @ProfiledMethod
+    def update_live(self):
+        if self.live_input.ended:
+            self.live_input.stop()
+            self.rest_windows()
+            self.report_live_latency()
+            # A fresh input and analysis for the next Start
+            self.setup_live()
+            return
 
-        self.set_geometry_cached(self.root, self.BASE_X + swing_x, self.BASE_Y + swing_y + jump_offset)
+        dt = self.begin_frame()
+
+        prof = self.profiler
+        if prof:
+            prof.start_frame()
+
+        result = self.live_analyzer.process(self.live_input.read())
+        if result is not None:
+            arrival, bass_energy, is_gated = result
+            self.engine.feed_live(bass_energy, is_gated)
+
+        t = self.last_tick - self.live_start
+        if self.live_analyzer.tempo != self.engine.tempo:
+            self.engine.set_tempo(self.live_analyzer.tempo, t)
+            print(f"Tempo: {self.engine.tempo} BPM")
+
+        frame = self.engine.step(t, dt)
+        self.apply_frame(frame)
+        if result is not None:
+            self.live_latency.append(self.time.perf_counter() - arrival)
+
+        if prof:
+            prof.end_frame()
+
+        self.schedule_next_frame()
+
+    def report_live_latency(self):
+        analyzer = self.live_analyzer
+        print(f"Analysis hop: {analyzer.hop / analyzer.rate * 1000:.2f} ms, "
+              f"{analyzer.dropped / analyzer.rate:.2f} s of input dropped")
+        if self.live_latency:
+            ms = self.np.array(self.live_latency) * 1000
+            p50, p95 = self.np.percentile(ms, [50, 95])
+            print(f"Input to motion: {p50:.2f} ms p50, {p95:.2f} ms p95, {ms.max():.2f} ms max "
+                  f"over {len(ms)} frames (frame period {self.frame_period * 1000:.2f} ms)")
+
+    def rest_windows(self):
+        """Windows back to where they started, with the Start button showing again."""
+        if self.producer is not None:
+            self.producer.stop()
+            self.producer = None
+        self.engine.reset()
+        if self.show is not None:
+            self.show.rewind()
+        self._last_bg.clear()
+        self._last_geom.clear()
+
+        for win, (pos_x, pos_y) in zip(self.windows, self.engine.rest_positions()):
+            self.set_geometry_cached(win, pos_x, pos_y)
+        self.set_bg_cached(self.windows[0], "#000000")
+
+        for canvas in self.canvases:
+            self.clear_flash(canvas)
+
+        self.commit_frame()
 
-        self.set_geometry_cached(self.pillar1, (self.pillar_pos[0][0] + (cx if cx >= 40 else 40)) + swing_x + pillar_jump_offset, 0)
+        self.is_running = False
+        self.start_button.pack(expand=True)
+        print(f"Frames: {self.frames_ticked} ticked, {self.frames_missed} missed at {self.UPDATE_HZ}Hz, "
+              f"tick jitter {self.tick_jitter_ms():.2f} ms")
+        if self.governor is not None:
+            print(self.governor.report())
+            self.governor.reset()
 
-        self.set_geometry_cached(self.pillar2, (self.pillar_pos[1][0] - (cx if cx >= 40 else 40)) - swing_x - pillar_jump_offset, 0)
+    @ProfiledMethod
+    def apply_frame(self, frame):
+        prof = self.profiler
+        if self.governor is not None:
+            frame = self.governor.shed(frame)
 
-        # -------- TELEPORT/MOVE --------
-        if is_gated and self.gate_cooldown_timer == 0 and bass_strength < 0.2:
-            max_x = self.root.winfo_screenwidth() - self.SQUARE_SIZE
-            max_y = self.root.winfo_screenheight() - self.SQUARE_SIZE
+        for win, pos in zip(self.windows, frame.positions):
+            if pos is not None:
+                self.set_geometry_cached(win, pos[0], pos[1])
 
-            self.teleport_d1_start = self.get_window_pos(self.dancer1)
-            self.teleport_d2_start = self.get_window_pos(self.dancer2)
+        if prof:
+            prof.lap("geometry_apply")
 
-            self.teleport_d1_target = [self.random.randint(0, max_x), self.random.randint(0, max_y)]
+        for win, color in zip(self.windows, frame.colors):
+            if color is not None:
+                self.set_bg_cached(win, color)
 
-            self.teleport_d2_target = [self.random.randint(0, max_x), self.random.randint(0, max_y)]
+        for kind, dancer, color in frame.flashes:
+            canvas = self.canvases[dancer]
+            self.clear_flash(canvas)
+            if kind == "flash":
+                self.trigger_flash(canvas, color)
 
-            for bg_target in [self.bg_pillar1_target, self.bg_pillar2_target, self.bg_pillar3_target, self.bg_pillar4_target]:
-                bg_target[:] = self.hex_to_rgb(self.random_hex_color())
+        if prof:
+            prof.lap("bg_apply")
 
-            self.teleport_timer = self.TELEPORT_EASE_FRAMES
-            self.gate_cooldown_timer = self.TELEPORT_COOLDOWN_FRAMES
+        self.commit_frame()
 
-            self.bg_color = self.hex_to_rgb(self.random_hex_color())
-            for i in range(3):
-                self.bg_target[i] = 0
+        if prof:
+            prof.lap("commit")
 
-            if not self.has_image1:
-                self.bg_dancer1_target = self.hex_to_rgb(self.random_hex_color())
-                for i in range(3):
-                    self.bg_dancer1_teleport_target[i] = self.bg_dancer1_target[i]
-            else:
-                if self.flash_rect_1:
-                    self.canvas1.delete(self.flash_rect_1)
-                self.flash_rect_1 = self.trigger_flash(self.canvas1, self.random_hex_color())
-                self.flash_timer_1 = self.FLASH_FRAMES * 2
-
-            if not self.has_image2:
-                self.bg_dancer2_target = self.hex_to_rgb(self.random_hex_color())
-                for i in range(3):
-                    self.bg_dancer2_teleport_target[i] = self.bg_dancer2_target[i]
-            else:
-                if self.flash_rect_2:
-                    self.canvas2.delete(self.flash_rect_2)
-                self.flash_rect_2 = self.trigger_flash(self.canvas2, self.random_hex_color())
-                self.flash_timer_2 = self.FLASH_FRAMES * 2
+    # -------------------------------------------------
+    # Start
 
-        if self.teleport_timer > 0:
-            t_norm = 1 - (self.teleport_timer / self.TELEPORT_EASE_FRAMES)
-            t_ease = 1 - (1 - t_norm) ** 3
+    def start(self):
+        if self.is_running:
+            return
 
-            d1x = self.teleport_d1_start[0] + (self.teleport_d1_target[0] - self.teleport_d1_start[0]) * t_ease
-            d1y = self.teleport_d1_start[1] + (self.teleport_d1_target[1] - self.teleport_d1_start[1]) * t_ease
-            d2x = self.teleport_d2_start[0] + (self.teleport_d2_target[0] - self.teleport_d2_start[0]) * t_ease
-            d2y = self.teleport_d2_start[1] + (self.teleport_d2_target[1] - self.teleport_d2_start[1]) * t_ease
+        self.is_running = True
 
-            self.set_geometry_cached(self.dancer1, d1x, d1y)
-            self.set_geometry_cached(self.dancer2, d2x, d2y)
+        if self.live_input is not None:
+            self.start_live()
+            return
 
-            self.teleport_timer -= 1
+        self.player.play()
+        self.music_t = 0.0
+        self.seek_offset = 0.0
+        self.show_album_art(self.current_track["art"])
+        self.prefetch_next()
 
-        elif self.gate_cooldown_timer > 0:
-            self.gate_cooldown_timer -= 1
+        self.start_button.pack_forget()
+        self.start_frame_clock()
+        self.update_loop()
+
+    def run(self):
+        self.start_button = self.tk.Button(
+            self.root,
+            text="Analyzing audio...",
+            state="disabled",
+            command=self.start
+        )
+        self.start_button.pack(expand=True)
 
+        if self.profiler and self.PROFILE_OVERLAY:
+            self.setup_profile_overlay()
+
+        self.root.after_idle(self.report_first_window)
+        if self.SINGLE_DECODE and self.LIVE_SOURCE is None:
+            self.setup_mixer()
+        if self.LIVE_SOURCE is not None:
+            self.setup_live()
+            if self.live_input.kind == "file":
+                # Play the file too, to hear what the dance reacts to
+                self.AUDIO_FILE = self.LIVE_SOURCE
+                self.setup_audio()
+            print(f"Listening to {self.live_input.describe()}")
+            self.start_button.config(text="Start the window dance", state="normal")
         else:
-            self.set_geometry_cached(self.dancer1, center_x + cx,  center_y + cy)
-            self.set_geometry_cached(self.dancer2, center_x - cx, center_y - cy)
+            self.start_analysis()
+        self.root.mainloop()
 
-        if abs(vY) >= 1.0:
-            self.set_geometry_cached(self.pillar3, self.pillar_pos[2][0], self.pillar_pos[2][1] - vY)
-            self.set_geometry_cached(self.pillar4, self.pillar_pos[3][0], self.pillar_pos[3][1] + vY)
+        if self.live_input is not None:
+            self.live_input.stop()
 
-        # -------- BACKGROUND FADE --------
-        for i in range(3):
-            self.bg_color[i] += (self.bg_target[i] - self.bg_color[i]) * self.BG_FADE_SPEED
+        if self.profiler:
+            self.export_profile()
 
-            if self.bg_color[i] < 0:
-                self.bg_color[i] = 0
-            elif self.bg_color[i] > 255:
-                self.bg_color[i] = 255
+    def setup_live(self):
+        self.live_input = LiveInput(self, self.LIVE_SOURCE)
+        self.live_analyzer = LiveAnalyzer(self.np, self, self.live_input.rate)
+        # Only the newest hop is danced to, the ring just has to outlast a frame's worth of them
+        self.engine.load_live(self.live_analyzer.tempo, max(64, int(self.live_analyzer.frame_rate * self.MAX_FRAME_DT) + 1))
+        self.live_latency = []
 
-        self.set_bg_cached(self.root, self.rgb_to_hex(self.bg_color))
+    def start_live(self):
+        self.show_album_art(None)
+        self.start_button.pack_forget()
+        self.start_frame_clock()
+        if self.live_input.kind == "file":
+            self.player.play()
+        self.live_input.start()
+        self.live_start = self.time.perf_counter()
+        self.update_loop()
 
-        # Dancer1 background fade
-        if not self.has_image1:
-            for i in range(3):
-                self.bg_dancer1_color[i] += (self.bg_dancer1_target[i] - self.bg_dancer1_color[i]) * self.BG_DANCERS_FADE_SPEED
+    def report_first_window(self):
+        print(f"Windows up after {(self.time.perf_counter() - self.launch_time) * 1000:.0f} ms")
 
-                if self.bg_dancer1_color[i] < 0:
-                    self.bg_dancer1_color[i] = 0
-                elif self.bg_dancer1_color[i] > 255:
-                    self.bg_dancer1_color[i] = 255
+    # -------------------------------------------------
+    # Background analysis
 
-            self.set_bg_cached(self.dancer1, self.rgb_to_hex(self.bg_dancer1_color))
-        else:
-            self.flash_rect_1, self.flash_timer_1 = self.update_flash(
-                self.canvas1, self.flash_rect_1, self.flash_timer_1
-            )
+    def start_analysis(self):
+        self.analysis_status = "Analyzing audio..."
+        self.analysis_error = None
+        self.analysis_done = False
+        self.threading.Thread(target=self.analysis_worker, daemon=True).start()
+        self.poll_analysis()
 
-        # Dancer2 background fade
-        if not self.has_image2:
-            for i in range(3):
-                self.bg_dancer2_color[i] += (self.bg_dancer2_target[i] - self.bg_dancer2_color[i]) * self.BG_DANCERS_FADE_SPEED
+    def analysis_worker(self):
+        # Only plain attributes are written here, Tk is touched from poll_analysis
+        try:
+            self.analyze_audio()
+            self.report_progress("Loading album art...")
+            self.album_art = self.load_album_art(self.AUDIO_FILE, self.analysis_key)
+            if self.COMPILE_SHOW:
+                self.report_progress("Compiling the dance...")
+                self.show = self.load_or_compile_show(
+                    self.analysis_key, self.tempo, self.bass_energy, self.rms, self.beat_times, self.album_art
+                )
+        except Exception as err:
+            self.analysis_error = err
+        self.analysis_done = True
 
-                if self.bg_dancer2_color[i] < 0:
-                    self.bg_dancer2_color[i] = 0
-                elif self.bg_dancer2_color[i] > 255:
-                    self.bg_dancer2_color[i] = 255
+    def poll_analysis(self):
+        if not self.analysis_done:
+            self.start_button.config(text=self.analysis_status)
+            self.root.after(100, self.poll_analysis)
+            return
 
-            self.set_bg_cached(self.dancer2, self.rgb_to_hex(self.bg_dancer2_color))
-        else:
-            self.flash_rect_2, self.flash_timer_2 = self.update_flash(
-                self.canvas2, self.flash_rect_2, self.flash_timer_2
-            )
+        if self.analysis_error is not None:
+            print(f"Error analyzing audio:\n\t{self.analysis_error}")
+            self.start_button.config(text=f"Could not analyze {self.AUDIO_FILE}")
+            return
 
-        # Pillar background fade
-        for pillar, bg_color, bg_target in [
-            (self.pillar1, self.bg_pillar1_color, self.bg_pillar1_target),
-            (self.pillar2, self.bg_pillar2_color, self.bg_pillar2_target),
-            (self.pillar3, self.bg_pillar3_color, self.bg_pillar3_target),
-            (self.pillar4, self.bg_pillar4_color, self.bg_pillar4_target),
-        ]:
-            for i in range(3):
-                bg_color[i] += (bg_target[i] - bg_color[i]) * self.BG_DANCERS_FADE_SPEED
+        self.current_track = self.first_track = {
+            "index": 0,
+            "file": self.AUDIO_FILE,
+            "tempo": self.tempo,
+            "bass_energy": self.bass_energy,
+            "rms": self.rms,
+            "rms_times": self.rms_times,
+            "beat_times": self.beat_times,
+            "sound": self.sound,
+            "art": self.album_art,
+            "show": self.show,
+        }
+        self.engine.load_tracks(self.bass_energy, self.rms, self.tempo, beat_times=self.beat_times)
+        self.setup_audio()
+        self.start_button.config(text="Start the window dance", state="normal")
+        print(f"Ready after {(self.time.perf_counter() - self.launch_time) * 1000:.0f} ms\nWaiting for user input on main window...")
 
-                if bg_color[i] < 0:
-                    bg_color[i] = 0
-                elif bg_color[i] > 255:
-                    bg_color[i] = 255
+    # -------------------------------------------------
+    # Playlist
 
-            self.set_bg_cached(pillar, self.rgb_to_hex(bg_color))
+    def prefetch_next(self):
+        if self.prefetching or self.next_track is not None:
+            return
+        index = self.current_track["index"] + 1
+        if index >= len(self.playlist) and not self.PLAYLIST_LOOP:
+            return
+        if len(self.playlist) < 2:
+            return
+
+        self.prefetching = True
+        self.threading.Thread(target=self.prefetch_worker, args=(index,), daemon=True).start()
+
+    def prefetch_worker(self, index):
+        # Analyzes and loads the art of the next playable song, skipping broken ones.
+        # Works on its own WindowDance so the playing song's attributes are never touched.
+        try:
+            for _ in range(len(self.playlist)):
+                if index >= len(self.playlist):
+                    if not self.PLAYLIST_LOOP:
+                        return
+                    index = 0
+
+                audio_file = self.playlist[index]
+                helper = WindowDance(interactive=False)
+                vars(helper).update(self.analysis_config())
+                helper.AUDIO_FILE = audio_file
+                helper.decode_for_playback = self.decode_for_playback
+                try:
+                    helper.analyze_audio()
+                except Exception as err:
+                    print(f"Error analyzing {audio_file}, skipping it:\n\t{err}")
+                    index += 1
+                    continue
+                if helper.sound is None and self.decode_for_playback and not self.player.streaming:
+                    # Loaded from the cache, but only a Sound can follow the one playing without a gap
+                    decoded = helper.decode_once()
+                    helper.sound = decoded[1] if decoded is not None else None
+
+                art = self.load_album_art(audio_file, helper.analysis_key)
+                show = None
+                if self.COMPILE_SHOW:
+                    show = self.load_or_compile_show(
+                        helper.analysis_key, helper.tempo, helper.bass_energy, helper.rms, helper.beat_times, art
+                    )
+                self.next_track = {
+                    "index": index,
+                    "file": audio_file,
+                    "tempo": helper.tempo,
+                    "bass_energy": helper.bass_energy,
+                    "rms": helper.rms,
+                    "rms_times": helper.rms_times,
+                    "beat_times": helper.beat_times,
+                    "sound": helper.sound,
+                    "art": art,
+                    "show": show,
+                }
+                return
+        finally:
+            self.prefetching = False
+
+    def update_playlist(self, pos):
+        """Queue or switch to the next song. Returns pos, or 0.0 if get_pos() was started over."""
+        track = self.next_track
+        if track is not None and not self.next_queued:
+            if not self.player.queue(track["file"], track["sound"]):
+                # A song without a Sound can't follow one on a channel. This one moves to mixer.music
+                # where it is (like a seek, get_pos() starts over), so the next one can queue behind it.
+                self.player.play(start=self.seek_offset + pos)
+                self.seek_offset += pos
+                pos = 0.0
+                self.player.queue(track["file"], track["sound"])
+            self.next_queued = True
+        elif self.next_queued and pos < self.music_t - 0.5:
+            # get_pos() starts over when the queued song takes over
+            self.switch_track(track, keep_state=True)
+        self.music_t = pos
+        return pos
+
+    def switch_track(self, track, keep_state=True, prefetch=True):
+        self.next_track = None
+        self.next_queued = False
+        self.current_track = track
+        self.music_t = 0.0
+        self.seek_offset = 0.0
+        self.clear_loop()
+
+        self.AUDIO_FILE = track["file"]
+        self.tempo = track["tempo"]
+        self.bass_energy = track["bass_energy"]
+        self.rms = track["rms"]
+        self.rms_times = track["rms_times"]
+        self.beat_times = track["beat_times"]
+        self.sound = track["sound"]
+
+        show = track["show"]
+        tracks = self.bass_energy, self.rms, self.tempo
+        beat_times = self.beat_times
+
+        def load_track():
+            self.show = show
+            if show is not None:
+                # The windows are where the last song left them
+                show.rewind()
+            self.engine.load_tracks(*tracks, keep_state=keep_state, beat_times=beat_times)
+
+        self.change_engine(load_track)
+        self.show_album_art(track["art"])
+        self.root.title(self.os.path.basename(self.AUDIO_FILE).rsplit(".", 1)[0])
+
+        if prefetch:
+            print(f"Now playing {self.AUDIO_FILE} ({self.tempo} BPM)")
+            self.prefetch_next()
 
-        self.root.after_idle(self.update_loop)
 
     # -------------------------------------------------
-    # Start
+    # Transport
 
-    def start(self):
-        if self.is_running:
+    def music_position(self):
+        return self.seek_offset + self.player.get_pos() / 1000
+
+    def seek(self, target):
+        if not self.is_running:
             return
+        # From the analysis, the engine may still be on its way to this song on the frame thread
+        target = min(max(0.0, target), max(0.0, float(self.rms_times[-1]) - 0.5))
+
+        # play(start=...) restarts get_pos() at 0, set_pos() would leave it counting from the old spot.
+        # A queued next song stays queued.
+        self.player.play(start=target)
+        if self.paused:
+            self.player.pause()
+        self.seek_offset = target
+        self.music_t = 0.0
+
+        for canvas in self.canvases:
+            self.clear_flash(canvas)
+        if self.governor is not None:
+            self.governor.reset()
+        engine_t = target - self.playback_clock.latency - self.playback_clock.offset
+
+        def seek_engine():
+            if self.show is not None:
+                # The next frame is looked up at the new time, flashes included
+                self.show.rewind()
+            else:
+                self.engine.seek(engine_t)
 
-        self.is_running = True
+        self.change_engine(seek_engine)
+        self.playback_clock.jump(target)
+
+    def seek_by(self, seconds):
+        if self.is_running:
+            self.seek(self.music_position() + seconds)
 
-        self.pygame.mixer.music.play()
-        self.has_image1 = self.extract_and_display_image(self.AUDIO_FILE, self.canvas1)
-        self.has_image2 = self.extract_and_display_image(self.AUDIO_FILE, self.canvas2)
+    def toggle_pause(self):
+        if not self.is_running:
+            return
+        if self.paused:
+            self.resume()
+        else:
+            self.player.pause()
+            self.paused = True
+            if self.frame_job:
+                self.root.after_cancel(self.frame_job)
+                self.frame_job = None
+
+    def resume(self):
+        self.paused = False
+        self.player.unpause()
+        self.playback_clock.jump(self.music_position())
+        # Restart the frame deadlines, the pause doesn't count as missed frames
+        now = self.time.perf_counter()
+        self.next_deadline = now
+        self.last_tick = now - self.frame_period
+        self.update_loop()
 
-        if not self.has_image1:
-            self.canvas1.pack_forget()
+    def set_loop_start(self):
+        if self.is_running:
+            self.loop_a = self.music_position()
+            self.loop_b = None
+            print(f"Loop start: {self.loop_a:.2f} s")
 
-        if not self.has_image2:
-            self.canvas2.pack_forget()
+    def set_loop_end(self):
+        if self.is_running and self.loop_a is not None and self.music_position() > self.loop_a:
+            self.loop_b = self.music_position()
+            print(f"Looping {self.loop_a:.2f} s - {self.loop_b:.2f} s")
+            self.seek(self.loop_a)
 
-        self.start_button.pack_forget()
-        self.update_loop()
+    def clear_loop(self):
+        self.loop_a = None
+        self.loop_b = None
 
-    def run(self):
-        self.start_button = self.tk.Button(
-            self.root,
-            text="Start the window dance",
-            command=self.start
-        )
-        self.start_button.pack(expand=True)
-        self.root.mainloop()
 
 if __name__ == "__main__":
     WindowDance().run()
\ No newline at end of file
@@ -0,0 +1,153 @@
+"""Pre-analyze a music library into the analysis cache.
+
+Run `python preanalyze.py <folder>` before a show: every song is analyzed once,
+across all cores, and main.py then loads it from the cache instantly. Progress
+is kept in the cache folder, so an interrupted run picks up where it stopped.
+"""
+
+import argparse
+import json
+import os
+import sys
+import time
+from concurrent.futures import ProcessPoolExecutor, as_completed
+
+from main import WindowDance
+
+AUDIO_EXTENSIONS = (".mp3",)
+MANIFEST_NAME = "library.json"
+
+
+def find_songs(folder, extensions):
+    songs = []
+    for dirpath, _, filenames in os.walk(folder):
+        for name in filenames:
+            if name.lower().endswith(extensions):
+                songs.append(os.path.abspath(os.path.join(dirpath, name)))
+    return songs
+
+
+def file_stamp(path):
+    st = os.stat(path)
+    return [st.st_size, st.st_mtime_ns]
+
+
+def load_manifest(path):
+    try:
+        with open(path) as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return {}
+
+
+def save_manifest(path, manifest):
+    tmp = f"{path}.tmp"
+    with open(tmp, "w") as f:
+        json.dump(manifest, f, indent=1)
+    os.replace(tmp, path)
+
+
+def is_done(entry, path, wd):
+    """True if the song is unchanged and its cached analysis is still the one main.py would look up."""
+    if entry is None or entry.get("status") != "done" or entry.get("stamp") != file_stamp(path):
+        return False
+    # The same file analyzed with other settings (or another librosa) gets another key
+    wd.AUDIO_FILE = path
+    return entry.get("params") == wd.analysis_params() and os.path.isdir(os.path.join(wd.CACHE_DIR, entry["key"]))
+
+
+def init_worker():
+    # One song per core, so numpy and numba shouldn't start thread pools of their own.
+    # Runs before the first task, and main.py imports numpy lazily.
+    for var in ("OMP_NUM_THREADS", "OPENBLAS_NUM_THREADS", "MKL_NUM_THREADS", "NUMBA_NUM_THREADS"):
+        os.environ.setdefault(var, "1")
+
+
+def analyze_song(path, config, force=False):
+    """Analyze one song into the cache, in a worker process."""
+    start = time.perf_counter()
+    try:
+        wd = WindowDance(interactive=False)
+        vars(wd).update(config)
+        wd.AUDIO_FILE = path
+        wd.report_progress = lambda status: None
+
+        tempo, tracks, from_cache = wd.load_or_compute_analysis(refresh=force)
+        return {
+            "status": "done",
+            # Set by load_or_compute_analysis, hashing the file again would double the cost of a cached song
+            "key": wd.analysis_key,
+            "params": wd.analysis_params(),
+            "tempo": tempo,
+            "duration": len(tracks["rms"]) * wd.HOP_LENGTH / wd.ANALYSIS_SR,
+            "seconds": time.perf_counter() - start,
+            "from_cache": from_cache,
+        }
+    except Exception as err:
+        return {"status": "failed", "error": f"{type(err).__name__}: {err}", "seconds": time.perf_counter() - start}
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("folder", help="folder to search for songs (including subfolders)")
+    parser.add_argument("--workers", type=int, default=os.cpu_count() or 1, help="songs analyzed at the same time (default: all cores)")
+    parser.add_argument("--cache-dir", help="analysis cache folder (default: the one set in main.py)")
+    parser.add_argument("--cache-max-mb", type=float, help="cache size limit applied after the run (default: the one set in main.py)")
+    parser.add_argument("--extensions", nargs="+", default=list(AUDIO_EXTENSIONS), help="file extensions to pick up")
+    parser.add_argument("--force", action="store_true", help="analyze songs again even if they are done")
+    args = parser.parse_args()
+
+    wd = WindowDance(interactive=False)
+    if args.cache_dir:
+        wd.CACHE_DIR = args.cache_dir
+    if args.cache_max_mb is not None:
+        wd.CACHE_MAX_MB = args.cache_max_mb
+    if not wd.CACHE_DIR:
+        print("The analysis cache is disabled (CACHE_DIR is None), there is nowhere to store the results")
+        sys.exit(1)
+    os.makedirs(wd.CACHE_DIR, exist_ok=True)
+
+    manifest_path = os.path.join(wd.CACHE_DIR, MANIFEST_NAME)
+    manifest = load_manifest(manifest_path)
+
+    songs = find_songs(args.folder, tuple(ext.lower() for ext in args.extensions))
+    todo = [p for p in songs if args.force or not is_done(manifest.get(p), p, wd)]
+    # Longest songs first, so one big file doesn't finish alone at the end
+    todo.sort(key=os.path.getsize, reverse=True)
+    print(f"{len(songs)} songs found, {len(songs) - len(todo)} already done, {len(todo)} to analyze on {args.workers} workers")
+
+    # The cache is only trimmed once, at the end
+    config = wd.analysis_config()
+    config.update(CACHE_MAX_MB=None)
+
+    start = time.perf_counter()
+    audio_seconds = 0.0
+    failed = 0
+    with ProcessPoolExecutor(max_workers=args.workers, initializer=init_worker) as pool:
+        futures = {pool.submit(analyze_song, path, config, args.force): path for path in todo}
+        for i, future in enumerate(as_completed(futures), 1):
+            path = futures[future]
+            result = future.result()
+            result["stamp"] = file_stamp(path)
+            manifest[path] = result
+            save_manifest(manifest_path, manifest)
+
+            name = os.path.relpath(path, args.folder)
+            if result["status"] == "done":
+                audio_seconds += result["duration"]
+                print(f"[{i}/{len(todo)}] {name}: {result['tempo']:.1f} BPM, {result['seconds']:.2f} s")
+            else:
+                failed += 1
+                print(f"[{i}/{len(todo)}] {name}: {result['error']}")
+
+    elapsed = time.perf_counter() - start
+    wd.evict_analysis_cache()
+
+    done = len(todo) - failed
+    print(f"\nAnalyzed {done} songs in {elapsed:.1f} s ({failed} failed)")
+    if elapsed > 0 and done:
+        print(f"Throughput: {done / elapsed * 60:.1f} songs/min, {audio_seconds / elapsed:.0f}x realtime")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,200 @@
+"""Render the window dance of a song to a video, without opening any windows.
+
+Run `python render.py song.mp3 -o show.mp4`. The dance is compiled at a fixed
+frame rate straight from the analysis tracks (DanceEngine.compile_show), the
+windows (album art and flashes included) are drawn into NumPy frames, and the
+frames are encoded in segments across a process pool with ffmpeg, then joined
+and muxed with the song. Without ffmpeg on the PATH the frames are written as
+PNG files instead.
+"""
+
+import argparse
+import os
+import shutil
+import subprocess
+import sys
+import tempfile
+import time
+from concurrent.futures import ProcessPoolExecutor, as_completed
+
+from main import DanceEngine, WindowDance
+
+
+def parse_size(text):
+    w, h = text.lower().split("x")
+    return int(w), int(h)
+
+
+def blit(buf, x, y, w, h, src):
+    """Fill (or copy src into) the w x h rectangle at x, y, clipped to the frame."""
+    height, width = buf.shape[:2]
+    x0, y0 = max(x, 0), max(y, 0)
+    x1, y1 = min(x + w, width), min(y + h, height)
+    if x0 >= x1 or y0 >= y1:
+        return
+    if getattr(src, "ndim", 1) == 3:
+        buf[y0:y1, x0:x1] = src[y0 - y:y1 - y, x0 - x:x1 - x]
+    else:
+        buf[y0:y1, x0:x1] = src
+
+
+def draw_frame(buf, sizes, positions, colors, flash_colors, flash_on, art):
+    """Draw one frame, windows stacked in creation order (root at the bottom)."""
+    buf[:] = 0
+    for w, ((x, y), (ww, wh)) in enumerate(zip(positions, sizes)):
+        dancer = w - 1
+        if 0 <= dancer < len(flash_on) and art is not None:
+            src = flash_colors[dancer] if flash_on[dancer] else art
+        else:
+            src = colors[w]
+        blit(buf, int(x), int(y), ww, wh, src)
+
+
+def ffmpeg_video_args(ffmpeg, width, height, fps, crf, preset, output):
+    return [
+        ffmpeg, "-hide_banner", "-loglevel", "error", "-y",
+        "-f", "rawvideo", "-pix_fmt", "rgb24", "-s", f"{width}x{height}", "-r", str(fps), "-i", "-",
+        "-c:v", "libx264", "-preset", preset, "-crf", str(crf), "-pix_fmt", "yuv420p",
+        output,
+    ]
+
+
+def render_segment(job):
+    """Draw and encode frames [start, stop) in a worker process."""
+    import numpy as np
+
+    begin = time.perf_counter()
+    width, height = job["size"]
+    buf = np.zeros((height, width, 3), dtype=np.uint8)
+    positions, colors, flash_colors, flash_on = job["tracks"]
+
+    encoder = None
+    if job["ffmpeg"]:
+        args = ffmpeg_video_args(job["ffmpeg"], width, height, job["fps"], job["crf"], job["preset"], job["output"])
+        encoder = subprocess.Popen(args, stdin=subprocess.PIPE)
+
+    try:
+        for i in range(len(positions)):
+            draw_frame(buf, job["sizes"], positions[i], colors[i], flash_colors[i], flash_on[i], job["art"])
+            if encoder:
+                encoder.stdin.write(buf.tobytes())
+            else:
+                from PIL import Image
+
+                path = os.path.join(job["output"], f"{job['start'] + i + 1:06d}.png")
+                Image.fromarray(buf).save(path, compress_level=1)
+    finally:
+        if encoder:
+            encoder.stdin.close()
+            if encoder.wait() != 0:
+                raise RuntimeError(f"ffmpeg failed on segment {job['index']}")
+
+    return job["index"], len(positions), time.perf_counter() - begin
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("audio", help="song to render")
+    parser.add_argument("-o", "--output", help="video file (default: the song name with .mp4)")
+    parser.add_argument("--fps", type=int, default=60, help="frame rate of the video")
+    parser.add_argument("--size", type=parse_size, default=(1920, 1080), help="screen size to dance on, WxH")
+    parser.add_argument("--jump", type=int, default=40, help="how high the windows can jump (0 for none)")
+    parser.add_argument("--tempo", type=int, help="use this tempo instead of detecting it")
+    parser.add_argument("--seed", type=int, default=0, help="random seed, the same seed renders the same dance")
+    parser.add_argument("--workers", type=int, default=os.cpu_count() or 1, help="processes drawing and encoding frames")
+    parser.add_argument("--crf", type=int, default=18, help="x264 quality, lower is better")
+    parser.add_argument("--preset", default="veryfast", help="x264 speed preset")
+    parser.add_argument("--png", metavar="FOLDER", help="write PNG frames to this folder instead of a video")
+    args = parser.parse_args()
+
+    wd = WindowDance(interactive=False)
+    np = wd.np
+    wd.AUDIO_FILE = args.audio
+    wd.WINDOW_JUMP = -args.jump
+    if args.tempo:
+        wd.confirm_self_tempo = 'y'
+        wd.TEMPO_INPUT = args.tempo
+    wd.analyze_audio()
+
+    width, height = args.size
+    engine = DanceEngine(wd, (width, height), seed=args.seed)
+    engine.load_tracks(wd.bass_energy, wd.rms, wd.tempo, beat_times=wd.beat_times)
+
+    art = wd.load_album_art(args.audio, wd.analysis_key)
+    art = np.asarray(art.convert("RGB")) if art is not None else None
+    engine.has_image = [art is not None] * engine.DANCERS
+
+    start = time.perf_counter()
+    show = engine.compile_show(args.fps)
+    n_frames = show.n_frames
+    tracks = tuple(getattr(show, name) for name in show.ARRAYS)
+    print(f"Stepped {n_frames} frames in {time.perf_counter() - start:.2f} s")
+
+    ffmpeg = None if args.png else shutil.which("ffmpeg")
+    if not args.png and not ffmpeg:
+        args.png = os.path.splitext(args.audio)[0] + "_frames"
+        print(f"ffmpeg not found, writing PNG frames to {args.png} instead")
+
+    work_dir = args.png or tempfile.mkdtemp(prefix="window_dance_render_")
+    os.makedirs(work_dir, exist_ok=True)
+
+    # A few segments per worker, so one slow segment doesn't hold up the end
+    n_segments = max(1, min(n_frames, args.workers * 3))
+    bounds = np.linspace(0, n_frames, n_segments + 1).astype(int)
+    sizes = engine.window_sizes()
+    jobs = []
+    for k in range(n_segments):
+        a, b = bounds[k], bounds[k + 1]
+        jobs.append({
+            "index": k,
+            "start": int(a),
+            "size": (width, height),
+            "sizes": sizes,
+            "tracks": tuple(track[a:b] for track in tracks),
+            "art": art,
+            "fps": args.fps,
+            "crf": args.crf,
+            "preset": args.preset,
+            "ffmpeg": ffmpeg,
+            "output": os.path.join(work_dir, f"segment_{k:04d}.mp4") if ffmpeg else work_dir,
+        })
+
+    start = time.perf_counter()
+    done = 0
+    with ProcessPoolExecutor(max_workers=args.workers) as pool:
+        for future in as_completed([pool.submit(render_segment, job) for job in jobs]):
+            _, frames, _ = future.result()
+            done += frames
+            print(f"\r{done}/{n_frames} frames", end="", flush=True)
+    elapsed = time.perf_counter() - start
+    print(f"\nRendered {n_frames} frames in {elapsed:.1f} s ({n_frames / elapsed:.0f} fps, "
+          f"{engine.duration / elapsed:.1f}x realtime on {args.workers} workers)")
+
+    if not ffmpeg:
+        print(f"Join them with the audio using:\n"
+              f"  ffmpeg -framerate {args.fps} -i {os.path.join(args.png, '%06d.png')} -i \"{args.audio}\" "
+              f"-c:v libx264 -pix_fmt yuv420p -c:a aac -shortest out.mp4")
+        return
+
+    output = args.output or os.path.splitext(args.audio)[0] + ".mp4"
+    concat_list = os.path.join(work_dir, "segments.txt")
+    with open(concat_list, "w") as f:
+        for job in jobs:
+            f.write(f"file '{job['output']}'\n")
+
+    # Segments are joined without re-encoding, only the audio is encoded
+    result = subprocess.run([
+        ffmpeg, "-hide_banner", "-loglevel", "error", "-y",
+        "-f", "concat", "-safe", "0", "-i", concat_list, "-i", args.audio,
+        "-map", "0:v", "-map", "1:a", "-c:v", "copy", "-c:a", "aac", "-b:a", "192k", "-shortest",
+        output,
+    ])
+    shutil.rmtree(work_dir, ignore_errors=True)
+    if result.returncode != 0:
+        print("ffmpeg failed to join the segments")
+        sys.exit(1)
+    print(f"Video written to {output}")
+
+
+if __name__ == "__main__":
+    main()